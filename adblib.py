@@ -1,15 +1,66 @@
 #!/usr/bin/python3
 
+import concurrent.futures
+import hashlib
 import subprocess
 import time
 import re
 import os
+import selectors
+import shlex
+import signal
+import shutil
+import socket
+import tarfile
 import zipfile
 import tempfile
-import shutil
+import uuid
+import zlib
+try:
+    import pty
+except ImportError:  # not available on Windows, adb progress is polled there
+    pty = None
+from core import transfer_codec
+from core.adb_protocol import AdbServerClient, AdbProtocolError
+from core.adb_session import AdbShellSession, AdbSessionError
+from core.app_inventory import AppInventory, parse_dumpsys_packages
+from core.analysis_cache import AnalysisCache, analysis_cache_enabled
+from core.capture_tail import CaptureTail
+from core.device_storage import DeviceStorage, LRU_INDEX_NAME
+from core.layer_deployment import LayerDeployment
+from core.logcat_stream import LogcatStream
 from core.logger_config import setup_logger
+from core.pattern_scan import PatternScanner
 
 ADB = "adb"
+# Set to 1 to route adb.command() through one persistent shell per device
+SESSION_MODE_ENV = "TRACEUI_ADB_SESSIONS"
+# 'cli' forks the adb binary per call, 'socket' talks to the adb server on port 5037 directly
+TRANSPORT_ENV = "TRACEUI_ADB_TRANSPORT"
+TRANSPORTS = ("cli", "socket")
+PROP_LINE = re.compile(r'^\[([^\]]+)\]: \[(.*)$')
+TRANSFER_PROGRESS = re.compile(rb'\[\s*(\d+)%\]')
+PROGRESS_SELECT_TIMEOUT = 0.25
+# adb only draws its progress lines on a terminal that is not 'dumb'
+PROGRESS_TERM = "xterm"
+# Markers of the on-device symbol search output
+SO_MARKER = "__TRACEUI_SO__"
+NO_DEVICE_TOOLS = "__TRACEUI_NO_TOOLS__"
+PROCESS_EXITED = "__TRACEUI_PROCESS_EXITED__"
+# Hash, size and mtime of files pushed with dedup, one "sha256 size mtime path" line each
+PUSH_MANIFEST = "/data/local/tmp/traceui_push_manifest"
+PUSH_MANIFEST_MAX_ENTRIES = 1000
+# Files per 'exec-out tar' command in pull_many, keeps the command line short
+PULL_MANY_BATCH = 500
+# 'auto' compresses big transfers on slow links, 'off', or force 'gzip' / 'zstd'
+COMPRESSION_ENV = "TRACEUI_ADB_COMPRESSION"
+TRANSFER_CHUNK = 256 * 1024
+THROUGHPUT_MIN_SAMPLE = 4 * 1024 * 1024  # smaller transfers are dominated by latency
+MiB = 1024 * 1024
+# Resumable transfers move and verify files in chunks of whole dd blocks
+RESUMABLE_CHUNK = 64 * MiB
+DD_BLOCK = MiB
+PARTIAL_SUFFIX = ".partial"
 
 # Detection strings
 VULKAN_SYMBOLS = [b"vkCreateInstance", b"vkCreateDevice", b"libvulkan"]
@@ -32,16 +83,116 @@ class print_codes:
     END_CODE = '\033[0m'
 
 
+class _ExecStream(object):
+    """
+    Raw byte stream to or from a device command, over 'adb exec-out' / 'adb exec-in'
+    or the exec service of the adb server.
+    """
+
+    def __init__(self, adb, device, cmd, write=False):
+        self.write_mode = write
+        self.aborted = False
+        self._sock = None
+        self._process = None
+        self._file = None
+        logger.debug(f"Opening exec stream on device {device}: {cmd}")
+        if adb.server:
+            self._sock = adb.server.open_exec(device, cmd)
+            if not write:
+                self._file = self._sock.makefile("rb")
+        else:
+            self._process = subprocess.Popen(
+                [ADB, '-s', device, 'exec-in' if write else 'exec-out', cmd],
+                stdin=subprocess.PIPE if write else subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL if write else subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            self._file = self._process.stdin if write else self._process.stdout
+
+    def read(self, size):
+        return self._file.read(size)
+
+    def write(self, data):
+        if self._sock is not None:
+            self._sock.sendall(data)
+        else:
+            self._file.write(data)
+
+    def abort(self):
+        self.aborted = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        failed = self.aborted or exc_type is not None
+        if self._sock is not None:
+            if self.write_mode and not failed:
+                # Signal end of input, then wait for the device command to finish
+                self._sock.shutdown(socket.SHUT_WR)
+                while self._sock.recv(TRANSFER_CHUNK):
+                    pass
+            if self._file is not None:
+                self._file.close()
+            self._sock.close()
+            return False
+        if failed and self._process.poll() is None:
+            self._process.kill()
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        returncode = self._process.wait()
+        if returncode and not failed and self.write_mode:
+            raise OSError(f"exec-in command failed with return code {returncode}")
+        return False
+
+
 class adb(object):
     POTENTIAL_SUDO_COMMANDS = ["su -c", "su 0"]
+    DEVICE_PROBE_TIMEOUT = 30  # seconds
+    PROGRESS_POLL_INTERVAL = 1  # seconds without adb progress output before polling the file size
+    COMPRESSION_MIN_SIZE = 16 * MiB
+    COMPRESSION_MAX_THROUGHPUT = 30 * MiB  # bytes/s, faster links are not worth compressing for
+    RESUMABLE_RETRIES = 3  # attempts per chunk after the first one failed
 
-    def __init__(self):
+    def __init__(self, session_mode=None, transport=None):
         self.device = None
         self.devices = []
         self.configs = {}  # above device name -> model name
         self.restore_props = {}
         self.restore_settings = {}
         self.added_files = []
+        if session_mode is None:
+            session_mode = os.environ.get(SESSION_MODE_ENV, "") not in ("", "0")
+        self.session_mode = session_mode
+        self.sessions = {}  # (device, run_with_sudo) -> AdbShellSession
+        self.shell_round_trips = 0
+        self.prop_cache = {}  # device -> {prop: value} snapshot of getprop
+        self.analysis_cache = AnalysisCache() if analysis_cache_enabled() else None
+        self.app_inventories = {}  # device -> AppInventory
+        self.local_hashes = {}  # (path, size, mtime_ns, ctime_ns) -> sha256
+        self.push_timings = {}  # seconds spent per phase of the last push
+        self.installed_apks = {}  # (device, package) -> sha256 of the apk known to be installed
+        self.layers = LayerDeployment(self)
+        self.storage = DeviceStorage(self)
+        self.link_throughput = {}  # device -> bytes/s measured on the last transfer
+        self.compressed_throughput = {}  # device -> file bytes/s of the last compressed transfer
+        self.device_codecs = {}  # device -> compressors available on the device
+        self.transport = None
+        self.server = None
+        self.set_transport(transport or os.environ.get(TRANSPORT_ENV, "cli"))
+
+    def set_transport(self, transport):
+        """Switches between the adb binary ('cli') and the native adb server client ('socket')"""
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown adb transport '{transport}', expected one of {TRANSPORTS}")
+        if self.server and transport != "socket":
+            self.server.close()
+            self.server = None
+        if transport == "socket" and self.server is None:
+            self.server = AdbServerClient()
+        self.transport = transport
 
     def manage_app_permissions(self, pkg_name=None, device=None):
         """
@@ -78,78 +229,177 @@ class adb(object):
                 return pkg_path.split(":", 1)[1]
         return None
 
-    def __extract_so_files(self, apk_file, extract_dir):
-        """extract .so files from apk"""
-        with zipfile.ZipFile(apk_file, 'r') as zipf:
-            so_files = [f for f in zipf.namelist() if f.startswith("lib/") and f.endswith(".so")]
-            extracted = []
-            for so in so_files:
-                dest_path = os.path.join(extract_dir, os.path.basename(so))
-                with zipf.open(so) as src, open(dest_path, 'wb') as dst:
-                    shutil.copyfileobj(src, dst)
-                extracted.append(dest_path)
-            return extracted
-
-    def __analyze_so_file(self, so_path):
-        """Checks *.so files against API and ENGINE symbols"""
+    def __analyze_so_stream(self, stream, need_vulkan=True, need_gles=True, need_engine=True):
+        """
+        Checks one *.so stream against API and ENGINE symbols in a single pass.
+
+        Symbols of results that are already known are not searched for, and the
+        scan stops as soon as the remaining results can no longer change.
+        """
+        patterns = set()
+        if need_vulkan:
+            patterns.update(VULKAN_SYMBOLS)
+        if need_gles:
+            patterns.update(GLES_SYMBOLS)
+        if need_engine:
+            for sigs in ENGINES.values():
+                patterns.update(sigs)
+        # The first engine listed wins, so only a hit on it settles the engine early
+        first_engine_sigs = set(next(iter(ENGINES.values())))
+
+        def _done(found):
+            return ((not need_vulkan or found.intersection(VULKAN_SYMBOLS))
+                    and (not need_gles or found.intersection(GLES_SYMBOLS))
+                    and (not need_engine or found & first_engine_sigs))
+
+        found = PatternScanner(patterns).scan(stream, done=_done)
+        return self.__so_verdict(found)
+
+    @staticmethod
+    def __so_verdict(found):
+        """Maps the symbols found in one *.so to (uses_vulkan, uses_gles, engine)"""
+        uses_vulkan = bool(found.intersection(VULKAN_SYMBOLS))
+        uses_gles = bool(found.intersection(GLES_SYMBOLS))
+        engine = next((eng for eng, sigs in ENGINES.items() if found.intersection(sigs)), None)
+        return uses_vulkan, uses_gles, engine
+
+    def __analyze_apk(self, apk_file):
+        """Scans the lib/*.so entries of an apk straight from the zip"""
         uses_vulkan = False
         uses_gles = False
         engine = None
-
-        try:
-            with open(so_path, "rb") as f:
-                content = f.read()
-                # Graphics API detection
-                uses_vulkan = any(sig in content for sig in VULKAN_SYMBOLS)
-                uses_gles = any(sig in content for sig in GLES_SYMBOLS)
-                # Engine detection
-                for eng, sigs in ENGINES.items():
-                    if any(sig in content for sig in sigs):
-                        engine = eng
-                        break
-
-        except Exception as e:
-            logger.error(f"[!] Failed to read {so_path}: {e}")
-
+        with zipfile.ZipFile(apk_file, 'r') as zipf:
+            so_files = [f for f in zipf.namelist() if f.startswith("lib/") and f.endswith(".so")]
+            for so in so_files:
+                if uses_vulkan and uses_gles and engine:
+                    break
+                try:
+                    with zipf.open(so) as src:
+                        v, g, e = self.__analyze_so_stream(src, not uses_vulkan, not uses_gles, not engine)
+                except Exception as e:
+                    logger.error(f"[!] Failed to read {so}: {e}")
+                    continue
+                uses_vulkan |= v
+                uses_gles |= g
+                if not engine and e:
+                    engine = e
         return uses_vulkan, uses_gles, engine
 
-    def analyze_package(self, pkg):
-        """Pulls package from device and API/ENGINE information from  *.so files """
+    def analyze_package(self, pkg, on_device=True):
+        """
+        Detects the graphics API and engine of a package from its *.so files.
+
+        The symbol search runs on the device first, so only the verdict is sent
+        back over adb. If the device lacks the tools for that, the apk is pulled
+        and scanned locally.
+        """
         apk_path = self.__get_apk_path(pkg)
         self.command(["am", "kill-all"], run_with_sudo=True)
         self.command(["am", "force-stop", pkg], run_with_sudo=True)
         if not apk_path:
             return (pkg, None, None, None)
 
+        cache_key = self.__analysis_cache_key(pkg, apk_path) if self.analysis_cache else None
+        if cache_key:
+            cached = self.analysis_cache.get(cache_key)
+            if cached:
+                logger.info(f"Using cached analysis of {pkg}")
+                return (pkg, *cached)
+
+        result = self.__analyze_on_device(apk_path) if on_device else None
+        if result is None:
+            result = self.__analyze_pulled_apk(pkg, apk_path)
+        if result is None:
+            return (pkg, None, None, None)
+
+        if cache_key:
+            self.analysis_cache.put(cache_key, list(result))
+        return (pkg, *result)
+
+    def __analyze_pulled_apk(self, pkg, apk_path):
+        """Pulls the apk and scans it locally, returns None if the pull failed"""
         with tempfile.TemporaryDirectory() as tempdir:
             apk_tmpdir = os.path.join(tempdir, f"{pkg}")
             self.pull(apk_path, apk_tmpdir)
             # One apk file is pulled
             apk_file = [os.path.join(apk_tmpdir, f) for f in os.listdir(apk_tmpdir) if os.path.isdir(apk_tmpdir)]
             if not apk_file:
-                return (pkg, None, None, None)
+                return None
+            return self.__analyze_apk(apk_file[0])
 
-            so_dir = os.path.join(tempdir, "so_files")
-            os.makedirs(so_dir, exist_ok=True)
-            so_files = self.__extract_so_files(apk_file[0], so_dir)
+    def __analyze_on_device(self, apk_path):
+        """
+        Greps the native libs of an installed package on the device.
 
-            uses_vulkan = False
-            uses_gles = False
-            engine = None
+        Uses the extracted lib/<abi>/ directory of the package, or streams the
+        lib/*.so entries out of the apk with unzip when the libs are not
+        extracted. Only the distinct symbols found per library are returned.
 
-            for so in so_files:
-                v, g, e = self.__analyze_so_file(so)
-                uses_vulkan |= v
-                uses_gles |= g
-                if not engine and e:
-                    engine = e
+        Returns:
+            tuple: (uses_vulkan, uses_gles, engine), None if the device can not run the search
+        """
+        all_symbols = VULKAN_SYMBOLS + GLES_SYMBOLS + [sig for sigs in ENGINES.values() for sig in sigs]
+        grep = "grep -a -o -F " + " ".join(f"-e {shlex.quote(sig.decode())}" for sig in all_symbols)
+        pkg_dir = shlex.quote(apk_path.rpartition("/")[0])
+        apk = shlex.quote(apk_path)
+        script = "\n".join([
+            f"command -v grep >/dev/null || {{ echo {NO_DEVICE_TOOLS}; exit 0; }}",
+            f"libs=$(ls {pkg_dir}/lib/*/*.so 2>/dev/null)",
+            "if [ -n \"$libs\" ]; then",
+            f"    for so in $libs; do echo \"{SO_MARKER} $so\"; {grep} \"$so\" | sort -u; done",
+            "elif command -v unzip >/dev/null; then",
+            f"    for so in $(unzip -l {apk} | grep -o 'lib/[^ ]*\\.so$'); do",
+            f"        echo \"{SO_MARKER} $so\"; unzip -p {apk} \"$so\" | {grep} | sort -u",
+            "    done",
+            "else",
+            f"    echo {NO_DEVICE_TOOLS}",
+            "fi",
+            "",
+        ])
+        device = self.__check_device(None)
+        stdout, stderr = self._run_script(script, device)
+        if NO_DEVICE_TOOLS in stdout or stderr.strip():
+            logger.info(f"On-device analysis of {apk_path} not possible, pulling the apk instead: {stderr.strip()}")
+            return None
+
+        found_per_so = []
+        for line in stdout.splitlines():
+            if line.startswith(SO_MARKER):
+                found_per_so.append(set())
+            elif found_per_so and line:
+                found_per_so[-1].add(line.encode())
+        uses_vulkan = False
+        uses_gles = False
+        engine = None
+        for found in found_per_so:
+            # grep -o reports one match per position, add the symbols contained in it
+            found |= {sig for sig in all_symbols if any(sig in hit for hit in found)}
+            v, g, e = self.__so_verdict(found)
+            uses_vulkan |= v
+            uses_gles |= g
+            if not engine and e:
+                engine = e
+        logger.debug(f"Analysed {len(found_per_so)} native libs of {apk_path} on device")
+        return uses_vulkan, uses_gles, engine
 
-            return (pkg, uses_vulkan, uses_gles, engine)
+    def __analysis_cache_key(self, pkg, apk_path):
+        """Returns the analysis cache key of the installed apk, None if it can not be identified"""
+        results = self.command_many([
+            ['dumpsys', 'package', pkg, '|', 'grep', '-m1', 'versionCode='],
+            ['sha256sum', apk_path, '2>/dev/null', '||', 'md5sum', apk_path],
+        ], errors_handled_externally=True)
+        version_out, checksum_out = results[0][0], results[1][0]
+        m = re.search(r'versionCode=(\d+)', version_out)
+        checksum = checksum_out.split()[0] if checksum_out else None
+        if not m or not checksum:
+            logger.debug(f"Could not identify the installed apk of {pkg}, skipping analysis cache")
+            return None
+        return AnalysisCache.make_key(pkg, m.group(1), checksum)
 
     def command(self, args, run_with_sudo=False, device=None, errors_handled_externally=False, print_command=True):
         """Runs adb shell commands on device. Only returns the stdout of the results"""
         device = self.__check_device(device)
-        cmd = ['adb', '-s', device, 'shell']
+        cmd = [ADB, '-s', device, 'shell']
 
         if run_with_sudo:
             cmd += [self.configs[device]["working_sudo_command"]]
@@ -161,22 +411,150 @@ class adb(object):
 
         if print_command:
             logger.debug("Running ADB command: " + " ".join(cmd))
-        process = subprocess.run(cmd, capture_output=True, text=True)
-        stdout = process.stdout.strip()
-        stderr = process.stderr.strip()
+        stdout, stderr, _ = self._run_shell(cmd, device, run_with_sudo)
+        stdout = stdout.strip()
+        stderr = stderr.strip()
         if stderr:
-            cmd_str = " ".join(cmd)
-            if not errors_handled_externally:
-                logger.error(f"Command {cmd_str} failed on device {device}, got error: {stderr}")
+            self.__log_command_error(" ".join(cmd), device, stderr, errors_handled_externally)
+        return stdout, stderr
+
+    def command_many(self, commands, run_with_sudo=False, device=None, errors_handled_externally=False, print_command=True):
+        """
+        Runs a list of independent shell commands in a single adb round-trip.
+
+        The commands run in order as one script on the device, a failing
+        command does not stop the ones after it.
+
+        Args:
+            commands (list): Each entry is an argument list as passed to command()
+            run_with_sudo (bool): Run the whole batch as root
 
+        Returns:
+            list: One (stdout, stderr, returncode) tuple per command
+        """
+        device = self.__check_device(device)
+        if not commands:
+            return []
+        cmd_strs = [" ".join(str(x) for x in args) for args in commands]
+        if print_command:
+            logger.debug(f"Running ADB batch of {len(cmd_strs)} commands on {device}:\n" + "\n".join(cmd_strs))
+
+        marker = f"__TRACEUI_BATCH_{uuid.uuid4().hex}__"
+        script = ""
+        for cmd_str in cmd_strs:
+            script += (
+                f"( {cmd_str}\n) </dev/null\n"
+                f"__traceui_rc=$?\n"
+                f"echo; echo {marker} $__traceui_rc\n"
+                f"echo >&2; echo {marker} >&2\n"
+            )
+        stdout, stderr = self._run_script(script, device, run_with_sudo)
+
+        stdouts = self.__split_batch_output(stdout, marker)
+        stderrs = self.__split_batch_output(stderr, marker)
+        results = []
+        for index, cmd_str in enumerate(cmd_strs):
+            if index < len(stdouts):
+                out, returncode = stdouts[index]
             else:
-                emark = f"Error detected but marked as ok. "
-                logger.info(f"{emark} Command {cmd_str} failed on device {device}, got error: {stderr}")
-        return stdout, stderr
+                # The device shell died before reaching this command
+                out, returncode = "", None
+            err = stderrs[index][0] if index < len(stderrs) else ""
+            if returncode is None and not err:
+                err = "Command did not run, batch aborted"
+            out = out.strip()
+            err = err.strip()
+            if err:
+                self.__log_command_error(cmd_str, device, err, errors_handled_externally)
+            results.append((out, err, returncode))
+        return results
+
+    def __split_batch_output(self, output, marker):
+        """Splits the output of a command_many() script into (output, returncode) chunks"""
+        chunks = []
+        collected = []
+        for line in output.splitlines(keepends=True):
+            if line.startswith(marker):
+                fields = line.split()
+                returncode = int(fields[1]) if len(fields) > 1 and fields[1].lstrip("-").isdigit() else None
+                # Drop the newline emitted in front of the marker
+                chunks.append(("".join(collected)[:-1], returncode))
+                collected = []
+            else:
+                collected.append(line)
+        return chunks
+
+    def __log_command_error(self, cmd_str, device, stderr, errors_handled_externally):
+        if not errors_handled_externally:
+            logger.error(f"Command {cmd_str} failed on device {device}, got error: {stderr}")
+        else:
+            emark = f"Error detected but marked as ok. "
+            logger.info(f"{emark} Command {cmd_str} failed on device {device}, got error: {stderr}")
+
+    def _run_script(self, script, device, run_with_sudo=False):
+        """Feeds a multi-line shell script to the device shell, returns raw (stdout, stderr)"""
+        self.shell_round_trips += 1
+        shell_cmd = ['sh']
+        if run_with_sudo:
+            shell_cmd = self.configs[device]["working_sudo_command"].split() + shell_cmd
+        if self.server:
+            try:
+                stdout, stderr, _ = self.server.shell(device, " ".join(shell_cmd), stdin=script)
+                return stdout, stderr
+            except (OSError, AdbProtocolError) as e:
+                logger.warning(f"ADB server request failed on device {device}, falling back to adb binary: {e}")
+        elif self.session_mode:
+            try:
+                stdout, stderr, _ = self.get_session(device, run_with_sudo).run(script)
+                return stdout, stderr
+            except AdbSessionError as e:
+                logger.warning(f"ADB session failed on device {device}, falling back to one-shot script: {e}")
+        cmd = [ADB, '-s', device, 'shell'] + shell_cmd
+        process = subprocess.run(cmd, input=script, capture_output=True, text=True)
+        return process.stdout, process.stderr
+
+    def _run_shell(self, cmd, device, run_with_sudo=False):
+        """
+        Runs a full 'adb -s <device> shell ...' command line, either as its own
+        process or inside the persistent session of the device.
+
+        Returns:
+            tuple: Raw (stdout, stderr, returncode)
+        """
+        self.shell_round_trips += 1
+        if self.server:
+            try:
+                return self.server.shell(device, " ".join(cmd[4:]))
+            except (OSError, AdbProtocolError) as e:
+                logger.warning(f"ADB server request failed on device {device}, falling back to adb binary: {e}")
+        elif self.session_mode:
+            # Skip 'adb -s <device> shell' and the sudo prefix, the root session already runs as root
+            shell_args = cmd[5:] if run_with_sudo else cmd[4:]
+            try:
+                return self.get_session(device, run_with_sudo).run(" ".join(shell_args))
+            except AdbSessionError as e:
+                logger.warning(f"ADB session failed on device {device}, falling back to one-shot command: {e}")
+        process = subprocess.run(cmd, capture_output=True, text=True)
+        return process.stdout, process.stderr, process.returncode
+
+    def get_session(self, device=None, run_with_sudo=False):
+        """Returns the persistent shell of a device, starting it on first use"""
+        device = self.__check_device(device)
+        key = (device, bool(run_with_sudo))
+        if key not in self.sessions:
+            sudo_command = self.configs[device]["working_sudo_command"] if run_with_sudo else None
+            self.sessions[key] = AdbShellSession(device, sudo_command=sudo_command, adb_binary=ADB)
+        return self.sessions[key]
+
+    def close_sessions(self, device=None):
+        """Stops the persistent shells of one device, or of all devices if None"""
+        for key in list(self.sessions.keys()):
+            if device is None or key[0] == device:
+                self.sessions.pop(key).close()
 
     def fetch_logcat(self, device=None, filters=None):
         device = self.__check_device(device)
-        cmd = ['adb', '-s', device, 'logcat', '-d']
+        cmd = [ADB, '-s', device, 'logcat', '-d']
         if filters is not None:
             cmd += ['-s', filters]
         process = subprocess.run(cmd, capture_output=True, text=True)
@@ -187,9 +565,34 @@ class adb(object):
 
         return stdout.strip()
 
+    def open_logcat_stream(self, matcher, device=None):
+        """Starts following the logcat of a device, feeding every line to matcher, see LogcatStream"""
+        device = self.__check_device(device)
+        return LogcatStream(device, matcher, filters=matcher.filters, adb_binary=ADB).start()
+
+    def open_exec_stream(self, cmd, device=None, run_with_sudo=False):
+        """
+        Runs a shell command string on the device with a raw binary stdout,
+        use it as a context manager and read() from it.
+        """
+        device = self.__check_device(device)
+        if run_with_sudo:
+            cmd = f"{self.configs[device]['working_sudo_command']} {cmd}"
+        return _ExecStream(self, device, cmd)
+
+    def open_capture_tail(self, remote_path, local_dir, device=None):
+        """
+        Starts copying a capture file into local_dir while it is being written, see CaptureTail.
+        A later pull(remote_path, local_dir, resumable=True) only fetches what is still missing.
+        """
+        device = self.__check_device(device)
+        local_path = os.path.join(str(local_dir), os.path.basename(str(remote_path)) + PARTIAL_SUFFIX)
+        return CaptureTail(self, remote_path, local_path, device=device, block_size=DD_BLOCK,
+                           max_read=RESUMABLE_CHUNK).start()
+
     def clear_logcat(self, device=None):
         device = self.__check_device(device)
-        cmd = ['adb', '-s', device, 'logcat', '-c']
+        cmd = [ADB, '-s', device, 'logcat', '-c']
         subprocess.run(cmd, capture_output=True, text=True).stdout.strip()
 
     def run_command_get_logcat(self, args, run_with_sudo=False, device=None):
@@ -201,17 +604,11 @@ class adb(object):
         """Fills self variables"""
         only_unath = None
         self.devices = []
-        cmd = ["adb", "devices"]
-        subprocess.run(cmd, capture_output=True, text=True)  # first just to initialize adb if needed
-        out = subprocess.run(cmd, capture_output=True, text=True)  # second to actually get device list
-        for d in out.stdout.split('\n')[1:]:
-            m = re.match(r'(\S+)\s+(\w+)', d)
-            if not m:
-                continue
-            if m.group(2) == 'device':
-                self.devices.append(m.group(1))
+        for serial, state in self.__list_devices():
+            if state == 'device':
+                self.devices.append(serial)
                 only_unath = False
-            if m.group(2) == 'unauthorized' and only_unath is None:
+            if state == 'unauthorized' and only_unath is None:
                 only_unath = True
         if only_unath is True:
             logger.warning(f'You need to enable USB debug on your Android device or click to permit the connection!')
@@ -219,53 +616,148 @@ class adb(object):
         if len(self.devices) == 0:
             logger.error(f'No devices found!')
             return False
-        for d in self.devices:
-            config = {}
-            config["working_sudo_command"] = ""
-
-            su_errs = []
-            logger.debug("Sanity checking sudo command, selecting best candidate")
-            for sudo_command in self.POTENTIAL_SUDO_COMMANDS:
-                _, suerr = self.command([sudo_command, 'whoami'], False, d, True)
-                if not suerr:
-                    logger.debug(f"Found working sudo command {sudo_command}")
-                    config["working_sudo_command"] = sudo_command
-                    break
-                else:
-                    logger.warning(f"Sudo command {sudo_command} returned error {suerr}, trying alternatives.")
-                    su_errs.append(suerr)
-
-            if config["working_sudo_command"] is None:
-                err_string = ", ".join(su_errs)
-                logger.error(f"Unable to find a working sudo command for device, tried: {err_string}")
-
-            config['model'] = self.getprop('ro.product.model', d)
-            config['abi'] = self.getprop('ro.vendor.product.cpu.abilist', d)
-            config['android'] = self.getprop('ro.vendor_dlkm.build.version.release', d)
-            config['sdk'] = self.getprop('ro.vendor_dlkm.build.version.sdk', d)
-            config['soc'] = self.getprop('ro.soc.model', d)
-            config['manufacturer'] = self.getprop('ro.soc.manufacturer', d)
-            config['angle'] = self.getprop('ro.gfx.angle.supported', d) == 'angle'
-            config['skia'] = self.getprop('debug.renderengine.backend', d)
-            config['gpu'] = self.getprop('ro.hardware.egl', d)
-            root_stdout, _ = self.command([config["working_sudo_command"], 'whoami'], False, d)
-            config['root'] = root_stdout == 'root'
+        # Probe all devices concurrently, every adb call of a probe is killed once
+        # its device used up DEVICE_PROBE_TIMEOUT, so a wedged phone only costs that
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            futures = {executor.submit(self.__probe_device, d): d for d in self.devices}
+        for future, d in futures.items():
+            try:
+                self.configs[d] = future.result()
+            except subprocess.TimeoutExpired:
+                logger.error(f"Device {d} did not respond within {self.DEVICE_PROBE_TIMEOUT}s, skipping it.")
+                self.devices.remove(d)
+            except Exception as e:
+                logger.error(f"Failed to probe device {d}: {e}")
+                self.devices.remove(d)
+        if len(self.devices) == 0:
+            logger.error(f'No responsive devices found!')
+            return False
+        if len(self.devices) == 1:
+            self.select_device(self.devices[0])
+        return self.devices
+
+    def __list_devices(self):
+        """Returns (serial, state) for every device known to the adb server"""
+        if self.server:
+            try:
+                try:
+                    return self.server.devices()
+                except ConnectionRefusedError:
+                    # The server is not running yet, let the adb binary start it
+                    subprocess.run([ADB, "start-server"], capture_output=True, text=True)
+                    return self.server.devices()
+            except (OSError, AdbProtocolError) as e:
+                logger.warning(f"ADB server device listing failed, falling back to adb binary: {e}")
+        cmd = [ADB, "devices"]
+        subprocess.run(cmd, capture_output=True, text=True)  # first just to initialize adb if needed
+        out = subprocess.run(cmd, capture_output=True, text=True)  # second to actually get device list
+        devices = []
+        for d in out.stdout.split('\n')[1:]:
+            m = re.match(r'(\S+)\s+(\w+)', d)
+            if m:
+                devices.append((m.group(1), m.group(2)))
+        return devices
+
+    def __probe_device(self, d):
+        """
+        Collects the sudo command, properties and root state of one device.
+
+        Raises:
+            subprocess.TimeoutExpired: If the device took longer than DEVICE_PROBE_TIMEOUT
+        """
+        start = time.time()
+        deadline = time.monotonic() + self.DEVICE_PROBE_TIMEOUT
+        config = {}
+        config["working_sudo_command"] = ""
+        root_stdout = ""
+
+        su_errs = []
+        logger.debug(f"Sanity checking sudo command on {d}, selecting best candidate")
+        for sudo_command in self.POTENTIAL_SUDO_COMMANDS:
+            su_stdout, suerr = self.__probe_command([sudo_command, 'whoami'], d, deadline)
+            if not suerr:
+                logger.debug(f"Found working sudo command {sudo_command}")
+                config["working_sudo_command"] = sudo_command
+                root_stdout = su_stdout
+                break
+            else:
+                logger.warning(f"Sudo command {sudo_command} returned error {suerr}, trying alternatives.")
+                su_errs.append(suerr)
+
+        if not config["working_sudo_command"]:
+            err_string = ", ".join(su_errs)
+            logger.error(f"Unable to find a working sudo command for device, tried: {err_string}")
+
+        self.__store_props(d, self.__probe_command(['getprop'], d, deadline)[0])
+        config['model'] = self.getprop('ro.product.model', d)
+        config['abi'] = self.getprop('ro.vendor.product.cpu.abilist', d)
+        config['android'] = self.getprop('ro.vendor_dlkm.build.version.release', d)
+        config['sdk'] = self.getprop('ro.vendor_dlkm.build.version.sdk', d)
+        config['soc'] = self.getprop('ro.soc.model', d)
+        config['manufacturer'] = self.getprop('ro.soc.manufacturer', d)
+        config['angle'] = self.getprop('ro.gfx.angle.supported', d) == 'angle'
+        config['skia'] = self.getprop('debug.renderengine.backend', d)
+        config['gpu'] = self.getprop('ro.hardware.egl', d)
+        # The sudo probe above already ran whoami through the working sudo command
+        config['root'] = root_stdout == 'root'
+
+        if not config['android']:
+            config['android'] = self.getprop('ro.build.version.release', d)
 
             if not config['android']:
-                config['android'] = config['android'] = self.getprop('ro.build.version.release', d)
+                logger.warning(f"Failed to fetch android version from device properties. Force setting to 13. This should be fixed.")
 
-                if not config['android']:
-                    logger.warning(f"Failed to fetch android version from device properties. Force setting to 13. This should be fixed.")
+        logger.debug(f"Probed device {d} ({config['model']}) in {time.time() - start:.2f}s")
+        return config
 
-            self.configs[d] = config
-        if len(self.devices) == 1:
-            self.select_device(self.devices[0])
-        return self.devices
+    def __probe_command(self, args, device, deadline):
+        """
+        Runs a shell command of the device probe, bypassing the persistent
+        sessions, and gives up on it at the deadline.
+
+        Returns:
+            tuple: Stripped (stdout, stderr)
+
+        Raises:
+            subprocess.TimeoutExpired: If the command did not finish by the deadline
+        """
+        self.shell_round_trips += 1
+        cmd_str = " ".join(str(x) for x in args)
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise subprocess.TimeoutExpired(cmd_str, 0)
+        if self.server:
+            # A client of its own, so the timeout covers every socket operation of the call
+            client = AdbServerClient(self.server.host, self.server.port, timeout=timeout)
+            try:
+                stdout, stderr, _ = client.shell(device, cmd_str)
+                return stdout.strip(), stderr.strip()
+            except socket.timeout:
+                raise subprocess.TimeoutExpired(cmd_str, timeout)
+            except (OSError, AdbProtocolError) as e:
+                logger.warning(f"ADB server request failed on device {device}, falling back to adb binary: {e}")
+                timeout = max(0.0, deadline - time.monotonic())
+        cmd = [ADB, '-s', device, 'shell'] + [str(x) for x in args]
+        # Own process group, so a hung adb is killed together with anything it started
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   start_new_session=hasattr(os, "killpg"))
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            process.communicate()
+            raise
+        if stderr.strip():
+            self.__log_command_error(cmd_str, device, stderr.strip(), True)
+        return stdout.strip(), stderr.strip()
 
     def call(self, cmd, device=None):
         """Runs adb shell commands. Returns the full result"""
         device = self.__check_device(device)
-        fullcmd = ['adb', '-s', device] + cmd
+        fullcmd = [ADB, '-s', device] + cmd
         out = subprocess.run(fullcmd, capture_output=True, text=True)
         return out
 
@@ -276,31 +768,104 @@ class adb(object):
         assert device in self.devices
         self.device = device
 
+    def for_device(self, device):
+        """
+        Returns a new adb object bound to one of the devices found by init().
+
+        It reuses the probed config and the host-side caches, but has its own
+        selected device, restore_props, restore_settings and added_files, so
+        jobs on different devices can run concurrently without resetting or
+        cleaning up each other.
+        """
+        assert device in self.devices
+        bound = adb(session_mode=self.session_mode, transport=self.transport)
+        bound.devices = [device]
+        bound.configs = {device: self.configs[device]}
+        bound.analysis_cache = self.analysis_cache
+        bound.local_hashes = self.local_hashes
+        bound.device = device
+        return bound
+
     def getprop(self, prop=None, device=None, grep_term=None):
-        """Querries getprop using either a specific property or a grep term"""
+        """
+        Querries getprop using either a specific property or a grep term.
+
+        Values are served from a per-device snapshot of the full getprop dump,
+        taken on first use. Use refresh_props() to re-read the device.
+        """
         device = self.__check_device(device)
-        stdout = ""
+        props = self.prop_cache.get(device)
+        if props is None:
+            props = self.refresh_props(device)
         if prop:
-            stdout, stderr = self.command(['getprop', prop], False, device)
-        elif grep_term:
-            stdout, stderr = self.command(
-                [f"getprop | grep {grep_term}"],
-                False,
-                device,
-                errors_handled_externally=True,
-                print_command=False,
-            )
-        return stdout
+            return props.get(str(prop), "")
+        if grep_term:
+            pattern = re.compile(grep_term)
+            lines = [f"[{k}]: [{v}]" for k, v in props.items()]
+            return "\n".join(line for line in lines if pattern.search(line))
+        return ""
+
+    def refresh_props(self, device=None):
+        """Takes a new getprop snapshot of the device and returns it as a dict"""
+        device = self.__check_device(device)
+        stdout, _ = self.command(['getprop'], False, device, print_command=False)
+        return self.__store_props(device, stdout)
+
+    def __store_props(self, device, stdout):
+        """Parses a full getprop dump into the snapshot of the device"""
+        props = {}
+        key = None
+        for line in stdout.splitlines():
+            m = PROP_LINE.match(line)
+            if m:
+                key = m.group(1)
+                props[key] = m.group(2)
+                if props[key].endswith("]"):
+                    props[key] = props[key][:-1]
+                    key = None
+            elif key is not None:
+                # Continuation of a multi-line value
+                props[key] += "\n" + line
+                if props[key].endswith("]"):
+                    props[key] = props[key][:-1]
+                    key = None
+        self.prop_cache[device] = props
+        logger.debug(f"Cached {len(props)} properties from device {device}")
+        return props
+
+    def invalidate_props(self, device=None):
+        """Drops the getprop snapshot of one device, or of all devices if None"""
+        if device is None:
+            self.prop_cache = {}
+        else:
+            self.prop_cache.pop(device, None)
+
+    def __update_prop_cache(self, device, props):
+        if device in self.prop_cache:
+            for prop, value in props.items():
+                self.prop_cache[device][str(prop)] = str(value)
 
     def setprop(self, prop, value, device=None):
         """Runs adb setprop"""
         device = self.__check_device(device)
         if not prop in self.restore_props:
             self.restore_props[prop] = self.getprop(prop, device)
+        self.command(self.__setprop_args(prop, value), False, device)
+        self.__update_prop_cache(device, {prop: value})
+
+    def setprop_many(self, props, device=None):
+        """Runs adb setprop for every prop -> value pair in a single round-trip"""
+        device = self.__check_device(device)
+        for prop in props:
+            if not prop in self.restore_props:
+                self.restore_props[prop] = self.getprop(prop, device)
+        self.command_many([self.__setprop_args(prop, value) for prop, value in props.items()], False, device)
+        self.__update_prop_cache(device, props)
+
+    def __setprop_args(self, prop, value):
         if value == '':
-            self.command([f"setprop {prop} ''"], False, device)
-            return
-        self.command(['setprop', prop, value], False, device)
+            return [f"setprop {prop} ''"]
+        return ['setprop', prop, value]
 
     def reset_props_by_grep(self, grep_term, device=None):
         """Clears properties matching grep_term and tracks prior values for restoration."""
@@ -324,36 +889,100 @@ class adb(object):
         if not keepfiles:
             for f in self.added_files:
                 logger.debug(f"Cleaning up file: {f} on device")
-                self.command(['rm', f], True, device)
+            self.command_many([['rm', f] for f in self.added_files], True, device)
+            self.layers.forget(self.added_files, device)
             self.added_files = []
 
     def intermediate_cleanup(self, device=None):
         """Cleans up the device, resets all props set with the setprop function but does not delete any files"""
         device = self.__check_device(device)
-        for n in list(self.restore_props.keys()):
-            self.command(['setprop', n, self.restore_props[n]], False, device)
-            del self.restore_props[n]
+        self.command_many([self.__setprop_args(n, v) for n, v in self.restore_props.items()], False, device)
+        self.__update_prop_cache(device, self.restore_props)
+        self.restore_props = {}
+
+    def push(self, file, path, device=None, track=True, progress_callback=None, stop_event=None, dedup=False, resumable=False):
+        """
+        Pushes a file to the device.
 
-    def push(self, file, path, device=None, track=True, progress_callback=None, stop_event=None):
-        """Pushes a file to the device"""
+        With dedup set, the push is skipped when the destination already holds a
+        file with the same sha256, looked up in the push manifest of the device
+        or hashed with sha256sum on the device. With resumable set, the file is
+        sent in verified chunks and an interrupted push continues where it stopped.
+        """
         device = self.__check_device(device)
         basename = os.path.basename(file)
         total_size = os.path.getsize(file)
-        remote_temp_path = f"/sdcard/{basename}"
-        logger.info(f"Pushing file from local path {file} to /sdcard/")
+        file_path = str(path) + '/' + str(basename)
+        local_hash = None
+        if dedup:
+            local_hash = self.local_sha256(file)
+            if self.__remote_file_matches(file_path, local_hash, total_size, device):
+                logger.info(f"{file_path} is already up to date on device {device}, skipping push")
+                if track and file_path not in self.added_files:
+                    self.added_files.append(file_path)
+                self._emit_progress(progress_callback, 100, f"{basename} is already on the device")
+                return True
+
+        # Push straight to the destination if the shell user can write there,
+        # otherwise stage on /sdcard and move it into place as root
+        direct = self.__shell_can_write(path, file_path, device)
+        push_target = file_path if direct else f"/sdcard/{basename}"
+        push_dir = str(path) if direct else "/sdcard"
+        logger.info(f"Pushing file from local path {file} to {push_dir}/")
         self._emit_progress(progress_callback, 0, f"Preparing to push {basename}")
 
-        push_cmd = ['adb', '-s', device, 'push', '-p', file, '/sdcard/']
-        push_return = self._run_subprocess_with_progress(
-            push_cmd,
-            progress_callback,
-            f"Pushing {basename} to /sdcard/",
-            stop_event=stop_event,
-            total_size=total_size,
-            poll_path=remote_temp_path,
-            poll_remote=True,
-            device=device,
-        )
+        timings = {"push": 0.0, "move": 0.0, "chmod": 0.0}
+        codec = None if resumable else self.__choose_codec(device, total_size)
+        start = time.time()
+        if resumable:
+            push_return = self.__transfer_resumable(
+                "push",
+                device,
+                file,
+                push_target,
+                progress_callback,
+                f"Pushing {basename} to {push_dir}/",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        elif codec:
+            push_return = self.__transfer_compressed(
+                "push",
+                codec,
+                device,
+                file,
+                push_target,
+                progress_callback,
+                f"Pushing {basename} to {push_dir}/",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        elif self.server:
+            push_return = self.__transfer_with_server(
+                self.server.push,
+                device,
+                file,
+                push_target,
+                progress_callback,
+                f"Pushing {basename} to {push_dir}/",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        else:
+            push_cmd = [ADB, '-s', device, 'push', '-p', file, push_target]
+            push_return = self._run_subprocess_with_progress(
+                push_cmd,
+                progress_callback,
+                f"Pushing {basename} to {push_dir}/",
+                stop_event=stop_event,
+                total_size=total_size,
+                poll_path=push_target,
+                poll_remote=True,
+                device=device,
+            )
+        timings["push"] = time.time() - start
+        if not codec and not resumable and not push_return:
+            self.__record_throughput(device, total_size, timings["push"])
         if push_return == "cancelled":
             logger.info(f"Push for {basename} cancelled by user")
             return False
@@ -361,13 +990,27 @@ class adb(object):
             logger.error(f"adb push failed for {basename} with return code {push_return}")
             return False
 
-        self.command(['mkdir', '-p', path], True, device)  # make sure destination exists
-        logger.debug(f"Moving file from device path /sdcard/ to device path {path}")
-        self.command(['mv', '/sdcard/%s' % basename, path], True, device)
-        file_path = str(path) + '/' + str(basename)
+        if not direct:
+            logger.debug(f"Moving file from device path /sdcard/ to device path {path}")
+            start = time.time()
+            self.command_many([
+                ['mkdir', '-p', path],  # make sure destination exists
+                ['mv', push_target, path],
+            ], True, device)
+            timings["move"] = time.time() - start
 
-        self.command(['chmod', 'a+r', file_path], True, device)
+        start = time.time()
         self._emit_progress(progress_callback, 95, f"Applying permissions to {file_path}")
+        _, (stat_out, _, _) = self.command_many([
+            ['chmod', 'a+r', file_path],
+            ['stat', '-c', "'%s %Y'", file_path],
+        ], True, device)
+        timings["chmod"] = time.time() - start
+        self.push_timings = timings
+        logger.info(f"Pushed {basename} to {path} ({'direct' if direct else 'via /sdcard'}): "
+                    f"push {timings['push']:.2f}s, move {timings['move']:.2f}s, chmod {timings['chmod']:.2f}s")
+        if dedup:
+            self.__record_push(file_path, local_hash, stat_out, device)
 
         if track and file_path not in self.added_files:
             self.added_files.append(file_path)
@@ -375,30 +1018,133 @@ class adb(object):
         self._emit_progress(progress_callback, 100, f"Finished pushing {basename}")
         return True
 
-    def pull(self, file, path, device=None, progress_callback=None, stop_event=None):
-        """Pulls a file from the device (adb pull)"""
+    def __shell_can_write(self, path, file_path, device):
+        """Checks whether the shell user can create or replace file_path in path"""
+        (_, _, rc), = self.command_many([
+            ['mkdir', '-p', path, '2>/dev/null;', 'test', '-w', path,
+             '&&', '{', '[', '!', '-e', file_path, ']', '||', 'test', '-w', file_path, ';', '}'],
+        ], device=device, errors_handled_externally=True, print_command=False)
+        return rc == 0
+
+    def local_sha256(self, file):
+        """Returns the sha256 of a local file, cached while its size, mtime and ctime are unchanged"""
+        st = os.stat(file)
+        # ctime catches rewrites whose mtime was restored, e.g. by cp -p or rsync -t
+        key = (os.path.abspath(file), st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+        if key not in self.local_hashes:
+            digest = hashlib.sha256()
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self.local_hashes[key] = digest.hexdigest()
+        return self.local_hashes[key]
+
+    def __read_push_manifest(self, manifest_out):
+        """Parses the push manifest into {path: (sha256, size, mtime)}"""
+        entries = {}
+        for line in manifest_out.splitlines():
+            fields = line.split(" ", 3)
+            if len(fields) == 4:
+                entries[fields[3]] = tuple(fields[:3])
+        return entries
+
+    def __remote_file_matches(self, file_path, local_hash, size, device):
+        """Checks whether file_path on the device already has the given content"""
+        (stat_out, _, stat_rc), (manifest_out, _, _) = self.command_many([
+            ['stat', '-c', "'%s %Y'", file_path],
+            ['cat', PUSH_MANIFEST],
+        ], True, device, errors_handled_externally=True, print_command=False)
+        fields = stat_out.split()
+        if stat_rc or len(fields) != 2 or fields[0] != str(size):
+            return False
+        entry = self.__read_push_manifest(manifest_out).get(file_path)
+        if entry and entry[1:] == tuple(fields):
+            return entry[0] == local_hash
+        # Same size but unknown or modified since it was recorded, hash it on the device
+        hash_out, _ = self.command(['sha256sum', file_path], True, device, errors_handled_externally=True, print_command=False)
+        remote_hash = hash_out.split()[0] if hash_out else None
+        if remote_hash != local_hash:
+            return False
+        self.__record_push(file_path, local_hash, stat_out, device, manifest_out)
+        return True
+
+    def __record_push(self, file_path, sha256, stat_out, device, manifest_out=None):
+        """Stores the hash, size and mtime of a pushed file in the push manifest"""
+        fields = stat_out.split()
+        if not sha256 or len(fields) != 2:
+            return
+        if manifest_out is None:
+            manifest_out, _ = self.command(['cat', PUSH_MANIFEST], True, device, errors_handled_externally=True, print_command=False)
+        entries = self.__read_push_manifest(manifest_out)
+        entries.pop(file_path, None)
+        entries[file_path] = (sha256, fields[0], fields[1])
+        lines = [f"{h} {sz} {mt} {p}" for p, (h, sz, mt) in list(entries.items())[-PUSH_MANIFEST_MAX_ENTRIES:]]
+        script = f"cat > {PUSH_MANIFEST} <<'__TRACEUI_EOF__'\n" + "\n".join(lines) + "\n__TRACEUI_EOF__\n"
+        self._run_script(script, device, run_with_sudo=True)
+
+    def pull(self, file, path, device=None, progress_callback=None, stop_event=None, resumable=False):
+        """
+        Pulls a file from the device (adb pull).
+
+        With resumable set, the file is fetched in verified chunks and an
+        interrupted pull continues from its partial local copy.
+        """
         device = self.__check_device(device)
         subprocess.run(['mkdir', '-p', path], capture_output=True, text=True).stdout.strip()
         logger.debug(f"Pulling file from device path {file} to local path {path}")
         self._emit_progress(progress_callback, 0, f"Preparing to pull {file}")
-        total_size = None
-        try:
-            size_out, _ = self.command(['stat', '-c%s', file], device=device)
-            total_size = int(size_out.strip())
-        except Exception:
-            total_size = None
+        total_size = self.remote_size(file, device)
         local_dest = os.path.join(path, os.path.basename(file))
-        pull_cmd = ['adb', '-s', device, 'pull', '-p', file, path]
-        pull_return = self._run_subprocess_with_progress(
-            pull_cmd,
-            progress_callback,
-            f"Pulling {os.path.basename(file)} to {path}",
-            stop_event=stop_event,
-            total_size=total_size,
-            poll_path=local_dest,
-            poll_remote=False,
-            device=device,
-        )
+        codec = None if resumable else self.__choose_codec(device, total_size)
+        start = time.time()
+        if resumable:
+            pull_return = self.__transfer_resumable(
+                "pull",
+                device,
+                file,
+                local_dest,
+                progress_callback,
+                f"Pulling {os.path.basename(file)} to {path}",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        elif codec:
+            pull_return = self.__transfer_compressed(
+                "pull",
+                codec,
+                device,
+                file,
+                local_dest,
+                progress_callback,
+                f"Pulling {os.path.basename(file)} to {path}",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        elif self.server:
+            pull_return = self.__transfer_with_server(
+                self.server.pull,
+                device,
+                file,
+                local_dest,
+                progress_callback,
+                f"Pulling {os.path.basename(file)} to {path}",
+                stop_event=stop_event,
+                total_size=total_size,
+            )
+        else:
+            pull_cmd = [ADB, '-s', device, 'pull', '-p', file, path]
+            pull_return = self._run_subprocess_with_progress(
+                pull_cmd,
+                progress_callback,
+                f"Pulling {os.path.basename(file)} to {path}",
+                stop_event=stop_event,
+                total_size=total_size,
+                poll_path=local_dest,
+                poll_remote=False,
+                device=device,
+            )
+        if not codec and not resumable and not pull_return:
+            self.__record_throughput(device, total_size, time.time() - start)
         if pull_return == "cancelled":
             logger.info(f"Pull for {file} cancelled by user")
             return False
@@ -409,6 +1155,401 @@ class adb(object):
         self._emit_progress(progress_callback, 100, f"Finished pulling {file}")
         return True
 
+    def pull_many(self, files, path, device=None):
+        """
+        Pulls a list of device files into one local directory.
+
+        The files of each remote directory are streamed as one tar archive from
+        'exec-out tar' and unpacked while it arrives. Files the archive did not
+        deliver are pulled one by one as a fallback.
+
+        Returns:
+            list: Local paths of the pulled files, in the order of files, failed files are left out
+        """
+        device = self.__check_device(device)
+        os.makedirs(path, exist_ok=True)
+        by_dir = {}
+        for remote in files:
+            remote_dir, _, name = str(remote).rpartition("/")
+            by_dir.setdefault(remote_dir or "/", []).append(name)
+
+        pulled = set()
+        for remote_dir, names in by_dir.items():
+            for i in range(0, len(names), PULL_MANY_BATCH):
+                pulled |= self.__pull_tar(remote_dir, names[i:i + PULL_MANY_BATCH], path, device)
+
+        results = []
+        for remote in files:
+            name = os.path.basename(str(remote))
+            if name not in pulled:
+                logger.debug(f"{remote} was not in the tar stream, pulling it on its own")
+                if not self.pull(str(remote), path, device):
+                    continue
+            results.append(os.path.join(path, name))
+        return results
+
+    def __pull_tar(self, remote_dir, names, path, device):
+        """Streams names from remote_dir through tar into path, returns the names that were written"""
+        cmd = f"tar -cf - -C {shlex.quote(remote_dir)} " + " ".join(shlex.quote(n) for n in names)
+        wanted = set(names)
+        written = set()
+        sock = None
+        process = None
+        try:
+            if self.server:
+                sock = self.server.open_exec(device, cmd)
+                stream = sock.makefile("rb")
+            else:
+                process = subprocess.Popen([ADB, '-s', device, 'exec-out', cmd],
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                stream = process.stdout
+            with tarfile.open(fileobj=stream, mode="r|") as archive:
+                for member in archive:
+                    name = os.path.basename(member.name)
+                    if not member.isfile() or name not in wanted:
+                        continue
+                    with archive.extractfile(member) as src, open(os.path.join(path, name), "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    written.add(name)
+        except (OSError, tarfile.TarError, AdbProtocolError) as e:
+            logger.warning(f"Bulk pull from {remote_dir} stopped early: {e}")
+        finally:
+            if sock is not None:
+                sock.close()
+            if process is not None:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+                process.stdout.close()
+        logger.debug(f"Pulled {len(written)} of {len(names)} files from {remote_dir} as one tar stream")
+        return written
+
+    def remote_size(self, path, device=None):
+        """Returns the size in bytes of a file on the device, None if unknown"""
+        device = self.__check_device(device)
+        if self.server:
+            try:
+                st = self.server.stat(device, path)
+                return st[1] if st else None
+            except (OSError, AdbProtocolError) as e:
+                logger.debug(f"ADB server stat failed for {path}, falling back to shell stat: {e}")
+        try:
+            size_out, _ = self.command(['stat', '-c%s', path], device=device, errors_handled_externally=True, print_command=False)
+            return int(size_out.strip())
+        except ValueError:
+            return None
+
+    def __transfer_with_server(self, transfer, device, source, dest, progress_callback, description, stop_event=None, total_size=None):
+        """
+        Runs a sync push/pull through the adb server. Returns the same values as
+        _run_subprocess_with_progress: 0 on success, "cancelled" or an error code.
+        """
+        state = {"last_percent": 0}
+
+        def _on_bytes(transferred):
+            if not (progress_callback and total_size):
+                return
+            percent = int(min(100, transferred * 100 / total_size))
+            if percent != state["last_percent"]:
+                state["last_percent"] = percent
+                self._emit_progress(progress_callback, percent, f"{description} ({percent}%)")
+
+        try:
+            if not transfer(device, source, dest, progress=_on_bytes, stop_event=stop_event):
+                self._emit_progress(progress_callback, state["last_percent"], f"{description} (cancelled)")
+                return "cancelled"
+        except (OSError, AdbProtocolError) as e:
+            logger.error(f"{description} failed: {e}")
+            return 1
+        return 0
+
+    def __record_throughput(self, device, size, seconds):
+        """Remembers the raw link throughput of a device from a finished transfer"""
+        if size and size >= THROUGHPUT_MIN_SAMPLE and seconds > 0:
+            self.link_throughput[device] = size / seconds
+            logger.debug(f"Measured {size / seconds / MiB:.1f} MiB/s to device {device}")
+
+    def __device_codecs(self, device):
+        """Returns the compressors available on the device, probed once per device"""
+        if device not in self.device_codecs:
+            results = self.command_many([['command', '-v', codec] for codec in transfer_codec.CODECS],
+                                        device=device, errors_handled_externally=True, print_command=False)
+            self.device_codecs[device] = [codec for codec, (_, _, rc) in zip(transfer_codec.CODECS, results) if rc == 0]
+        return self.device_codecs[device]
+
+    def __choose_codec(self, device, size):
+        """
+        Picks the compression for a transfer, None for a plain one.
+
+        In 'auto' mode files of at least COMPRESSION_MIN_SIZE bytes are compressed
+        once a previous plain transfer measured the link below
+        COMPRESSION_MAX_THROUGHPUT, unless a compressed transfer to the device
+        moved fewer file bytes per second than the plain one. A codec name
+        forces that codec.
+        """
+        mode = os.environ.get(COMPRESSION_ENV, "auto")
+        if mode == "off" or not size:
+            return None
+        if mode == "auto":
+            throughput = self.link_throughput.get(device)
+            if size < self.COMPRESSION_MIN_SIZE or throughput is None or throughput >= self.COMPRESSION_MAX_THROUGHPUT:
+                return None
+            if self.compressed_throughput.get(device, throughput) < throughput:
+                # Compressing turned out slower than the plain link, e.g. for incompressible data
+                return None
+        codecs = [c for c in transfer_codec.host_codecs() if c in self.__device_codecs(device)]
+        if mode in transfer_codec.CODECS:
+            codecs = [c for c in codecs if c == mode]
+        return codecs[0] if codecs else None
+
+    def __transfer_compressed(self, direction, codec, device, source, dest, progress_callback, description, stop_event=None, total_size=None):
+        """
+        Streams a file through codec, compressing on the sending side and
+        decompressing on the receiving side. Returns the same values as
+        _run_subprocess_with_progress: 0 on success, "cancelled" or an error code.
+        """
+        state = {"last_percent": 0, "logical": 0, "wire": 0}
+        description = f"{description} [{codec}]"
+
+        def _report():
+            if not (progress_callback and total_size):
+                return
+            percent = int(min(100, state["logical"] * 100 / total_size))
+            if percent != state["last_percent"]:
+                state["last_percent"] = percent
+                self._emit_progress(progress_callback, percent,
+                                    f"{description} ({percent}%, {state['logical'] / MiB:.1f} MiB, "
+                                    f"{state['wire'] / MiB:.1f} MiB compressed)")
+
+        start = time.time()
+        if direction == "pull":
+            stream = _ExecStream(self, device, transfer_codec.device_compress_command(codec, shlex.quote(source)), write=False)
+            codec_stream = transfer_codec.decompressor(codec)
+        else:
+            stream = _ExecStream(self, device, transfer_codec.device_decompress_command(codec, shlex.quote(dest)), write=True)
+            codec_stream = transfer_codec.compressor(codec)
+        try:
+            with stream:
+                if direction == "pull":
+                    with open(dest, "wb") as out:
+                        for chunk in iter(lambda: stream.read(TRANSFER_CHUNK), b""):
+                            if stop_event and stop_event.is_set():
+                                stream.abort()
+                                break
+                            state["wire"] += len(chunk)
+                            data = codec_stream.decompress(chunk)
+                            out.write(data)
+                            state["logical"] += len(data)
+                            _report()
+                        data = codec_stream.flush()
+                        out.write(data)
+                        state["logical"] += len(data)
+                else:
+                    with open(source, "rb") as src:
+                        for chunk in iter(lambda: src.read(TRANSFER_CHUNK), b""):
+                            if stop_event and stop_event.is_set():
+                                stream.abort()
+                                break
+                            data = codec_stream.compress(chunk)
+                            stream.write(data)
+                            state["wire"] += len(data)
+                            state["logical"] += len(chunk)
+                            _report()
+                        if not stream.aborted:
+                            data = codec_stream.flush()
+                            stream.write(data)
+                            state["wire"] += len(data)
+        except (OSError, zlib.error, AdbProtocolError) as e:
+            logger.error(f"{description} failed: {e}")
+            return 1
+        if stream.aborted:
+            self._emit_progress(progress_callback, state["last_percent"], f"{description} (cancelled)")
+            return "cancelled"
+
+        received = state["logical"] if direction == "pull" else self.remote_size(dest, device)
+        if total_size is not None and received != total_size:
+            logger.error(f"{description} failed: got {received} of {total_size} bytes")
+            return 1
+        elapsed = time.time() - start
+        if elapsed > 0 and state["logical"] >= THROUGHPUT_MIN_SAMPLE:
+            self.compressed_throughput[device] = state["logical"] / elapsed
+        ratio = state["wire"] / state["logical"] if state["logical"] else 1
+        logger.debug(f"{description}: {state['logical'] / MiB:.1f} MiB sent as {state['wire'] / MiB:.1f} MiB "
+                     f"({ratio:.0%}) in {elapsed:.2f}s")
+        return 0
+
+    def __device_chunk_hashes(self, path, device, first, count):
+        """Returns the md5 of count RESUMABLE_CHUNK sized chunks of a device file, starting at chunk first"""
+        if count <= 0:
+            return []
+        blocks = RESUMABLE_CHUNK // DD_BLOCK
+        script = (f"i={first}; while [ $i -lt {first + count} ]; do "
+                  f"dd if={shlex.quote(path)} bs={DD_BLOCK} skip=$((i * {blocks})) count={blocks} 2>/dev/null | md5sum; "
+                  f"i=$((i + 1)); done\n")
+        out, _ = self._run_script(script, device)
+        return [line.split()[0] for line in out.splitlines() if line.strip()]
+
+    @staticmethod
+    def __local_chunk_hashes(path, count):
+        """Returns the md5 of the first count RESUMABLE_CHUNK sized chunks of a local file"""
+        hashes = []
+        with open(path, "rb") as f:
+            for _ in range(count):
+                digest = hashlib.md5()
+                remaining = RESUMABLE_CHUNK
+                while remaining:
+                    data = f.read(min(TRANSFER_CHUNK, remaining))
+                    if not data:
+                        break
+                    digest.update(data)
+                    remaining -= len(data)
+                hashes.append(digest.hexdigest())
+        return hashes
+
+    def __wait_for_device(self, device):
+        """Waits up to DEVICE_PROBE_TIMEOUT seconds for a device to come back after a failed transfer"""
+        try:
+            subprocess.run([ADB, '-s', device, 'wait-for-device'], capture_output=True, timeout=self.DEVICE_PROBE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Device {device} did not come back within {self.DEVICE_PROBE_TIMEOUT}s")
+
+    def __transfer_chunk(self, direction, device, source, partial, index, stop_event, on_bytes):
+        """
+        Copies chunk index of source into partial with dd on the device side.
+
+        Returns:
+            The md5 of the chunk as received, None if the transfer failed, or
+            "cancelled"
+        """
+        blocks = RESUMABLE_CHUNK // DD_BLOCK
+        try:
+            if direction == "pull":
+                digest = hashlib.md5()
+                cmd = f"dd if={shlex.quote(source)} bs={DD_BLOCK} skip={index * blocks} count={blocks} 2>/dev/null"
+                stream = _ExecStream(self, device, cmd)
+                with stream, open(partial, "r+b") as out:
+                    out.seek(index * RESUMABLE_CHUNK)
+                    for data in iter(lambda: stream.read(TRANSFER_CHUNK), b""):
+                        if stop_event and stop_event.is_set():
+                            stream.abort()
+                            break
+                        digest.update(data)
+                        out.write(data)
+                        on_bytes(len(data))
+                if stream.aborted:
+                    return "cancelled"
+                return digest.hexdigest()
+
+            # conv=notrunc keeps the verified chunks in front of the seek offset
+            cmd = f"dd of={shlex.quote(partial)} bs={DD_BLOCK} seek={index * blocks} conv=notrunc 2>/dev/null"
+            stream = _ExecStream(self, device, cmd, write=True)
+            with stream, open(source, "rb") as src:
+                src.seek(index * RESUMABLE_CHUNK)
+                remaining = RESUMABLE_CHUNK
+                while remaining:
+                    data = src.read(min(TRANSFER_CHUNK, remaining))
+                    if not data:
+                        break
+                    if stop_event and stop_event.is_set():
+                        stream.abort()
+                        break
+                    stream.write(data)
+                    remaining -= len(data)
+                    on_bytes(len(data))
+        except (OSError, AdbProtocolError) as e:
+            logger.warning(f"Transfer of chunk {index} failed: {e}")
+            return None
+        if stream.aborted:
+            return "cancelled"
+        hashes = self.__device_chunk_hashes(partial, device, index, 1)
+        return hashes[0] if hashes else None
+
+    def __transfer_resumable(self, direction, device, source, dest, progress_callback, description, stop_event=None, total_size=None):
+        """
+        Transfers a file in RESUMABLE_CHUNK sized chunks, checks every chunk
+        against the md5 of the source and the whole file against its sha256.
+
+        Data is written to dest + PARTIAL_SUFFIX, which is renamed to dest once
+        verified. A failed or cancelled transfer leaves the partial file behind
+        and the next call resumes after the last chunk of it that still matches
+        the source. Returns the same values as _run_subprocess_with_progress:
+        0 on success, "cancelled" or an error code.
+        """
+        if total_size is None:
+            logger.error(f"{description} failed: size of {source} is unknown")
+            return 1
+        partial = dest + PARTIAL_SUFFIX
+        count = -(-total_size // RESUMABLE_CHUNK)
+        if direction == "pull":
+            source_hashes = self.__device_chunk_hashes(source, device, 0, count)
+            existing = os.path.getsize(partial) if os.path.exists(partial) else 0
+            done_hashes = self.__local_chunk_hashes(partial, min(existing // RESUMABLE_CHUNK, count)) if existing else []
+        else:
+            source_hashes = self.__local_chunk_hashes(source, count)
+            existing = self.remote_size(partial, device) or 0
+            done_hashes = self.__device_chunk_hashes(partial, device, 0, min(existing // RESUMABLE_CHUNK, count))
+        if len(source_hashes) != count:
+            logger.error(f"{description} failed: could not checksum {source}")
+            return 1
+
+        # Chunks of the partial file that match the source are kept, even behind a mismatch,
+        # so a tracer rewriting its header only costs the first chunk
+        pending = [i for i in range(count) if i >= len(done_hashes) or done_hashes[i] != source_hashes[i]]
+        if existing > total_size:
+            if direction == "pull":
+                with open(partial, "r+b") as f:
+                    f.truncate(total_size)
+            else:
+                self.command(['truncate', '-s', str(total_size), partial], device=device, print_command=False)
+        elif direction == "pull" and not existing:
+            open(partial, "wb").close()
+        verified = (count - len(pending)) * RESUMABLE_CHUNK
+        if verified:
+            logger.info(f"{description}: resuming with {min(verified, total_size) / MiB:.0f} MiB already verified")
+
+        state = {"done": 0, "base": min(verified, total_size), "last_percent": -1}
+
+        def _on_bytes(length):
+            state["done"] += length
+            percent = int(min(100, (state["base"] + state["done"]) * 100 / total_size)) if total_size else 100
+            if percent != state["last_percent"]:
+                state["last_percent"] = percent
+                self._emit_progress(progress_callback, percent, f"{description} ({percent}%)")
+
+        for index in pending:
+            done_before = state["done"]
+            for attempt in range(self.RESUMABLE_RETRIES + 1):
+                state["done"] = done_before
+                received = self.__transfer_chunk(direction, device, source, partial, index, stop_event, _on_bytes)
+                if received == "cancelled":
+                    self._emit_progress(progress_callback, max(state["last_percent"], 0), f"{description} (cancelled)")
+                    return "cancelled"
+                if received == source_hashes[index]:
+                    break
+                logger.warning(f"{description}: chunk {index + 1}/{count} failed verification "
+                               f"(attempt {attempt + 1}/{self.RESUMABLE_RETRIES + 1})")
+                self.__wait_for_device(device)
+            else:
+                logger.error(f"{description} failed at offset {index * RESUMABLE_CHUNK}, rerun to resume")
+                return 1
+
+        remote_path = source if direction == "pull" else partial
+        hash_out, _ = self.command(['sha256sum', remote_path], device=device, errors_handled_externally=True, print_command=False)
+        remote_hash = hash_out.split()[0] if hash_out else None
+        local_hash = self.local_sha256(partial if direction == "pull" else source)
+        if remote_hash != local_hash:
+            logger.error(f"{description} failed: sha256 {local_hash} on the host, {remote_hash} on the device")
+            if direction == "pull":
+                os.remove(partial)
+            else:
+                self.command(['rm', '-f', partial], device=device, print_command=False)
+            return 1
+        if direction == "pull":
+            os.replace(partial, dest)
+        else:
+            self.command(['mv', partial, dest], device=device, print_command=False)
+        return 0
+
     def _emit_progress(self, callback, percent, message):
         """Emit progress updates for adb transfers."""
         if callback:
@@ -417,35 +1558,49 @@ class adb(object):
     def _run_subprocess_with_progress(self, cmd, progress_callback, description, stop_event=None, total_size=None, poll_path=None, poll_remote=False, device=None):
         """
         Execute a subprocess command, streaming percentage progress to callback when available.
+
+        Progress is parsed from the '[ 42%]' lines adb prints for 'push -p' / 'pull -p'.
+        adb only prints them to a terminal, so its output goes to a pty where
+        available. Only when adb stays silent, the size of poll_path is polled
+        instead, at most once every PROGRESS_POLL_INTERVAL seconds.
         """
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-        )
+        if pty is not None:
+            output_fd, terminal_fd = pty.openpty()
+            try:
+                process = subprocess.Popen(cmd, stdout=terminal_fd, stderr=terminal_fd,
+                                           env=dict(os.environ, TERM=PROGRESS_TERM))
+            except OSError:
+                os.close(output_fd)
+                raise
+            finally:
+                os.close(terminal_fd)
+        else:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            output_fd = process.stdout.fileno()
         state = {
             "last_percent": 0,
-            "last_emit_time": time.time(),
-            "last_log_dump": time.time(),
+            "last_progress_time": time.time(),
+            "last_poll_time": time.time(),
         }
-        heartbeat_interval = 1
+        output = []
 
         def _emit_percent(percent):
+            state["last_progress_time"] = time.time()
             if percent is None or percent == state["last_percent"]:
                 return
             self._emit_progress(progress_callback, percent, f"{description} ({percent}%)")
             state["last_percent"] = percent
-            state["last_emit_time"] = time.time()
 
         def _percent_from_poll():
             if not (total_size and poll_path):
                 return None
             try:
                 if poll_remote:
-                    size_out, _ = self.command(['stat', '-c%s', poll_path], device=device, errors_handled_externally=True, print_command=False)
-                    polled_size = int(size_out.strip()) if size_out else None
+                    polled_size = self.remote_size(poll_path, device)
                 else:
                     polled_size = os.path.getsize(poll_path) if os.path.exists(poll_path) else None
                 if polled_size is None:
@@ -455,59 +1610,197 @@ class adb(object):
                 logger.debug(f"Failed to poll transfer progress for {poll_path}: {e}")
                 return None
 
-        if progress_callback:
-            _emit_percent(0)
-
-        # Poll stdout without blocking so we can emit heartbeats regularly
-        while process.poll() is None:
-            if stop_event and stop_event.is_set():
-                process.terminate()
-                self._emit_progress(progress_callback, state["last_percent"], f"{description} (cancelled)")
-                return "cancelled"
-
-            if progress_callback and time.time() - state["last_emit_time"] >= heartbeat_interval:
-                polled_percent = _percent_from_poll()
-                _emit_percent(polled_percent)
+        def _parse_output(data):
+            # adb redraws its progress line with '\r', so split on both line endings
+            lines = re.split(rb'[\r\n]', data)
+            for line in lines:
+                m = TRANSFER_PROGRESS.search(line)
+                if m:
+                    _emit_percent(min(100, int(m.group(1))))
+                elif line.strip():
+                    output.append(line.decode(errors="replace"))
+
+        selector = selectors.DefaultSelector()
+        selector.register(output_fd, selectors.EVENT_READ)
+        pending = b""
+        try:
+            # Sleep in select() until adb prints something, the stop event is checked in between
+            while True:
+                if stop_event and stop_event.is_set():
+                    process.terminate()
+                    process.wait()
+                    self._emit_progress(progress_callback, state["last_percent"], f"{description} (cancelled)")
+                    return "cancelled"
+
+                if selector.select(timeout=PROGRESS_SELECT_TIMEOUT):
+                    try:
+                        data = os.read(output_fd, 65536)
+                    except OSError:
+                        # EIO, the pty of an exited adb has no writer left
+                        data = b""
+                    if not data:
+                        break
+                    # Keep an unterminated tail until the rest of the line arrives
+                    pending += data
+                    cut = max(pending.rfind(b"\r"), pending.rfind(b"\n")) + 1
+                    _parse_output(pending[:cut])
+                    pending = pending[cut:]
+                    continue
+
+                now = time.time()
+                if (progress_callback
+                        and now - state["last_progress_time"] >= self.PROGRESS_POLL_INTERVAL
+                        and now - state["last_poll_time"] >= self.PROGRESS_POLL_INTERVAL):
+                    state["last_poll_time"] = now
+                    _emit_percent(_percent_from_poll())
+        finally:
+            selector.close()
+            if process.stdout:
+                process.stdout.close()
+            else:
+                os.close(output_fd)
 
+        _parse_output(pending)
         process.wait()
+        if process.returncode and output:
+            logger.debug(f"{description} output: " + " | ".join(output[-5:]))
         return process.returncode
 
+    def wait_for_process_exit(self, process_name, device=None, timeout=None, stop_event=None, poll_interval=0.1):
+        """
+        Blocks until no process whose name contains process_name runs on the device.
+
+        A single device shell loops on ps and reports back once the process is
+        gone, instead of one adb round trip per check. Names match as substrings,
+        so app processes like '<package>:replay' are found too.
+
+        Args:
+            timeout (float): Wall-clock seconds to wait, None waits forever
+            stop_event (threading.Event): Stops waiting when set
+
+        Returns:
+            float: Host time at which the exit was seen, None if cancelled or timed out
+        """
+        device = self.__check_device(device)
+        loop = (f"while ps -A -o NAME | grep -qF -- {shlex.quote(process_name)}; do sleep {poll_interval}; done; "
+                f"echo {PROCESS_EXITED}")
+        process = subprocess.Popen(
+            [ADB, '-s', device, 'shell', loop],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + timeout if timeout is not None else None
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ)
+        output = b""
+        try:
+            while True:
+                if stop_event and stop_event.is_set():
+                    logger.debug(f"Stopped waiting for {process_name} to exit")
+                    return None
+                wait = PROGRESS_SELECT_TIMEOUT
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        logger.warning(f"Timed out after {timeout}s waiting for {process_name} to exit on device {device}")
+                        return None
+                if not selector.select(timeout=wait):
+                    continue
+                data = os.read(process.stdout.fileno(), 4096)
+                output += data
+                if PROCESS_EXITED.encode() in output:
+                    return time.time()
+                if not data:
+                    logger.error(f"Lost the device shell while waiting for {process_name} to exit on device {device}")
+                    return None
+        finally:
+            selector.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            process.stdout.close()
+
     def apps(self, all=False, device=None):
         """Returns a list of packages/apps"""
-        packages = []
         device = self.__check_device(device)
         cmdlist = ['cmd', 'package', 'list', 'packages']
         if not all:
             cmdlist.append('-3')  # only thirdparty apps
         else:
             cmdlist.append('-e')  # only enabled apps
-        out, _ = self.command(cmdlist)
-        for d in out.split('\n'):
-            m = re.match(r'package:(.+)', d)
-            name = m.group(1)
-            package = {}
-            package['name'] = name
-            info, _ = self.command(['dumpsys', 'package', name])
-            for i in info.split('\n'):
-                if 'primaryCpuAbi=' in i:
-                    package['abi'] = i.split('=')[1]
-                # elif 'versionCode=' in i: packages[name]['version'] = i.split('=')[1]
-                elif 'versionName=' in i:
-                    package['version'] = i.split('=')[1]
-                elif 'resourcePath=' in i:
-                    package['path'] = i.split('resourcePath=')[1]
-            packages.append(package)
-        return packages
-
-    def install(self, package_apk, device=None):
-        """Runs adb install"""
+        out, _ = self.command(cmdlist, device=device)
+        names = [m.group(1) for m in re.finditer(r'^package:(.+)$', out, re.MULTILINE)]
+        inventory = self.app_inventory(device)
+        if any(name not in inventory for name in names):
+            # Installed outside of traceui since the inventory was built
+            inventory = self.app_inventory(device, refresh=True)
+        return [dict(inventory.get(name) or {'name': name}) for name in names]
+
+    def app_inventory(self, device=None, refresh=False):
+        """
+        Returns the AppInventory of a device, parsed from one 'dumpsys package packages'.
+
+        The inventory is cached per device until refresh is set, or an install or
+        uninstall through this class invalidates it.
+        """
         device = self.__check_device(device)
-        subprocess.run(['adb', '-s', device, 'install', '-g', '-t', '-r', '-d', package_apk])
+        if refresh or device not in self.app_inventories:
+            out, _ = self.command(['dumpsys', 'package', 'packages'], device=device, print_command=False)
+            self.app_inventories[device] = AppInventory(parse_dumpsys_packages(out))
+            logger.debug(f"Loaded {len(self.app_inventories[device].packages)} packages from device {device}")
+        return self.app_inventories[device]
+
+    def invalidate_apps(self, device=None):
+        """Drops the cached app inventory of one device, or of all devices if None"""
+        if device is None:
+            self.app_inventories.clear()
+        else:
+            self.app_inventories.pop(device, None)
+
+    def install(self, package_apk, device=None, package_name=None):
+        """
+        Runs adb install.
+
+        With package_name set, the install is skipped when the device already
+        has the same build of the package: it reports a versionCode and its
+        installed apk has the sha256 of package_apk. A matching build is
+        remembered per device for the rest of the session.
+        """
+        device = self.__check_device(device)
+        local_hash = None
+        if package_name:
+            local_hash = self.local_sha256(str(package_apk))
+            key = (device, package_name)
+            if self.installed_apks.get(key) == local_hash or self.__installed_apk_matches(package_name, local_hash, device):
+                logger.info(f"{package_name} on device {device} already matches {package_apk}, skipping install")
+                self.installed_apks[key] = local_hash
+                return
+        process = subprocess.run([ADB, '-s', device, 'install', '-g', '-t', '-r', '-d', package_apk])
+        self.invalidate_apps(device)
+        if package_name and process.returncode == 0:
+            self.installed_apks[(device, package_name)] = local_hash
+
+    def __installed_apk_matches(self, package_name, local_hash, device):
+        """Checks whether the installed apk of a package has the given sha256"""
+        (version_out, _, _), (path_out, _, _) = self.command_many([
+            ['dumpsys', 'package', package_name, '|', 'grep', '-m1', 'versionCode='],
+            ['pm', 'path', package_name],
+        ], device=device, errors_handled_externally=True, print_command=False)
+        if 'versionCode=' not in version_out:
+            return False
+        apk_paths = [line.split(':', 1)[1] for line in path_out.splitlines() if line.startswith('package:')]
+        if len(apk_paths) != 1:
+            # Not installed or split apks, which never match a single local apk
+            return False
+        hash_out, _ = self.command(['sha256sum', apk_paths[0]], device=device, errors_handled_externally=True, print_command=False)
+        return bool(hash_out) and hash_out.split()[0] == local_hash
 
     def uninstall(self, package_name, device=None):
         """Runs adb uninstall"""
         device = self.__check_device(device)
-        subprocess.run(['adb', '-s', device, 'uninstall', package_name])
+        subprocess.run([ADB, '-s', device, 'uninstall', package_name])
+        self.invalidate_apps(device)
+        self.installed_apks.pop((device, package_name), None)
 
     def __check_device(self, device):
         """Checks that a device is connected"""
@@ -529,28 +1822,29 @@ class adb(object):
         List stale files in the device working directory and optionally delete them.
 
         If ``files`` is provided, those paths are used for deletion instead of
-        running a fresh device scan.
+        running a fresh device scan. Traces replayed within the last
+        ``older_than_days`` days are kept even if their files are older.
         """
         if files is None:
-            stdout, _ = self.command(['ls', working_dir], True, errors_handled_externally=True)
-            if not stdout:
-                return []
-
             stdout, _ = self.command(
-                [f'find "{working_dir}" -mindepth 1 -type f -mtime +{int(older_than_days)} | sort'],
+                [f'[ -d "{working_dir}" ] && find "{working_dir}" -mindepth 1 -type f -mtime +{int(older_than_days)} | sort'],
                 True,
                 errors_handled_externally=True,
             )
             files = [line.strip() for line in stdout.splitlines() if line.strip()]
+            if files:
+                recent = time.time() - older_than_days * 24 * 60 * 60
+                used = self.storage.last_used(working_dir)
+                files = [f for f in files if used.get(f, 0) < recent and not f.endswith(f"/{LRU_INDEX_NAME}")]
         else:
             files = [str(file_path).strip() for file_path in files if str(file_path).strip()]
         if files:
             logger.debug(
                 f"Files older than {older_than_days} days in {working_dir}:\n" + "\n".join(files)
             )
-        if delete:
-            for file_path in files:
-                self.command(['rm', '-f', file_path], True, errors_handled_externally=True)
+        if delete and files:
+            self.storage.delete(files)
+            self.storage.forget(working_dir, files)
         return files
 
 
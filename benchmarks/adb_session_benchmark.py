@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+"""
+Compares one-shot adb shell commands with the persistent session mode by
+running the gfxreconstruct capture setup against a fake device.
+
+Usage: python benchmarks/adb_session_benchmark.py [--latency 0.05] [--runs 3]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "plugins"))
+
+import adblib  # noqa: E402
+from benchmarks.fake_device import FakeDevice, FAKE_PACKAGE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Extra seconds per adb process spawn, emulating the USB handshake.")
+    parser.add_argument("--runs", type=int, default=3)
+    return parser.parse_args()
+
+
+def make_layer(root):
+    layer = root / "artifacts" / "android" / "layer" / "arm64-v8a" / "libVkLayer_gfxreconstruct.so"
+    layer.parent.mkdir(parents=True, exist_ok=True)
+    layer.write_bytes(b"\0" * 1024)
+    return root / "artifacts"
+
+
+def run_capture_setup(fake, session_mode, basepath):
+    a = adblib.adb(session_mode=session_mode)
+    a.init()
+    gfxr = importlib.import_module("gfxreconstruct").tracetool(a)
+    gfxr.basepath = basepath
+
+    fake.reset()
+    a.shell_round_trips = 0
+    start = time.perf_counter()
+    gfxr.trace_setup_device(FAKE_PACKAGE)
+    gfxr.trace_setup_check(FAKE_PACKAGE)
+    gfxr.trace_reset_device()
+    elapsed = time.perf_counter() - start
+    spawned = fake.invocations()
+    a.close_sessions()
+    return a.shell_round_trips, spawned, elapsed
+
+
+def main():
+    args = parse_args()
+    fake = FakeDevice(latency=args.latency)
+    adblib.ADB = str(fake.adb_path)
+    cwd = os.getcwd()
+    # ConfigSettings writes config.ini into the working directory
+    os.chdir(fake.root)
+    try:
+        basepath = make_layer(fake.root)
+        print(f"{'mode':<10} {'commands':>9} {'adb spawns':>11} {'wall time':>10}")
+        for session_mode in (False, True):
+            for _ in range(args.runs):
+                commands, spawned, elapsed = run_capture_setup(fake, session_mode, basepath)
+                label = "session" if session_mode else "one-shot"
+                print(f"{label:<10} {commands:>9} {spawned:>11} {elapsed:>9.3f}s")
+    finally:
+        os.chdir(cwd)
+        fake.cleanup()
+
+
+if __name__ == "__main__":
+    main()
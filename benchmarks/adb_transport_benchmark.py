@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""
+Compares the adb binary transport with the native adb server client by
+running the gfxreconstruct capture setup and a burst of remote stat calls
+(as used for transfer progress polling) against a fake device.
+
+Usage: python benchmarks/adb_transport_benchmark.py [--latency 0.05] [--stats 50]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "plugins"))
+
+import adblib  # noqa: E402
+from benchmarks.fake_adb_server import FakeAdbServer  # noqa: E402
+from benchmarks.fake_device import FakeDevice, FAKE_PACKAGE  # noqa: E402
+from benchmarks.adb_session_benchmark import make_layer  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Extra seconds per adb process spawn, emulating the USB handshake.")
+    parser.add_argument("--stats", type=int, default=50,
+                        help="Number of remote stat calls in the polling phase.")
+    return parser.parse_args()
+
+
+def run(fake, server, transport, basepath, stats):
+    a = adblib.adb(transport=transport)
+    a.init()
+    gfxr = importlib.import_module("gfxreconstruct").tracetool(a)
+    gfxr.basepath = basepath
+
+    fake.reset()
+    server.reset()
+    start = time.perf_counter()
+    gfxr.trace_setup_device(FAKE_PACKAGE)
+    gfxr.trace_setup_check(FAKE_PACKAGE)
+    gfxr.trace_reset_device()
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(stats):
+        a.remote_size("/sdcard/capture.gfxr")
+    stat_time = time.perf_counter() - start
+    spawned = fake.invocations()
+    if a.server:
+        a.server.close()
+    return spawned, len(server.requests), setup_time, stat_time
+
+
+def main():
+    args = parse_args()
+    fake = FakeDevice(latency=args.latency)
+    server = FakeAdbServer(fake)
+    server.start()
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+    (server.fs_root / "sdcard").mkdir()
+    (server.fs_root / "sdcard" / "capture.gfxr").write_bytes(b"\0" * 4096)
+    adblib.ADB = str(fake.adb_path)
+    cwd = os.getcwd()
+    # ConfigSettings writes config.ini into the working directory
+    os.chdir(fake.root)
+    try:
+        basepath = make_layer(fake.root)
+        print(f"{'transport':<10} {'adb spawns':>11} {'server requests':>16} {'setup':>9} {f'{args.stats} stats':>10}")
+        for transport in adblib.TRANSPORTS:
+            spawned, requests, setup_time, stat_time = run(fake, server, transport, basepath, args.stats)
+            print(f"{transport:<10} {spawned:>11} {requests:>16} {setup_time:>8.3f}s {stat_time:>9.3f}s")
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        fake.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+"""
+Runs replay-like jobs from several worker processes against a fleet of fake
+devices, every job taking a device lease first, and checks that no device
+is ever used by two jobs at once and how evenly the jobs are spread.
+
+Usage: python benchmarks/device_lease_benchmark.py [--workers 6] [--jobs 60] [--job-time 0.05]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import adblib  # noqa: E402
+from benchmarks.fake_device import FakeDevice  # noqa: E402
+from core.device_lease import LeaseManager, match_devices  # noqa: E402
+
+FLEET = {
+    "pixel0": {"model": "Pixel 8", "gpu": "mali"},
+    "pixel1": {"model": "Pixel 8", "gpu": "mali"},
+    "galaxy0": {"model": "Galaxy S23", "gpu": "adreno", "abi": "arm64-v8a"},
+    "galaxy1": {"model": "Galaxy S23", "gpu": "adreno", "abi": "arm64-v8a"},
+    "tablet0": {"model": "Tab S9", "gpu": "adreno", "abi": "arm64-v8a"},
+}
+REQUIREMENTS = [
+    {},
+    {"gpu": "mali"},
+    {"gpu": "adreno"},
+    {"model": "Galaxy S23"},
+    {"abi": "armeabi-v7a"},
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=6, help="Concurrent traceui processes.")
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--job-time", type=float, default=0.05, help="Seconds a job keeps its device.")
+    parser.add_argument("--poll", type=float, default=0.01, help="Lease poll interval in seconds.")
+    return parser.parse_args()
+
+
+def run_job(job):
+    """Runs in a worker process, like one traceui_cli invocation"""
+    index, requirements, configs, lease_dir, in_use_dir, job_time, poll = job
+    a = adblib.adb()
+    a.configs = configs
+    a.devices = list(configs)
+    manager = LeaseManager(lease_dir, poll_interval=poll)
+    start = time.perf_counter()
+    lease = manager.acquire(match_devices(configs, requirements), f"job {index}")
+    waited = time.perf_counter() - start
+    marker = os.path.join(in_use_dir, lease.device)
+    clash = False
+    try:
+        # Another job holding the same device would have created the marker already
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        clash = True
+    with lease:
+        a.for_device(lease.device).setprop("debug.traceui.job", str(index))
+        time.sleep(job_time)
+        if not clash:
+            os.remove(marker)
+    return index, lease.device, waited, clash, lease.device in match_devices(configs, requirements)
+
+
+def main():
+    args = parse_args()
+    fake = FakeDevice(fleet=FLEET)
+    adblib.ADB = str(fake.adb_path)
+    a = adblib.adb()
+    a.init()
+    configs = {serial: a.configs[serial] for serial in a.devices}
+    random.seed(1)
+    with tempfile.TemporaryDirectory(prefix="traceui_leases_") as lease_dir, \
+            tempfile.TemporaryDirectory(prefix="traceui_in_use_") as in_use_dir:
+        jobs = [(index, random.choice(REQUIREMENTS), configs, lease_dir, in_use_dir, args.job_time, args.poll)
+                for index in range(args.jobs)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(run_job, jobs, chunksize=1)
+        wall = time.perf_counter() - start
+        usage = LeaseManager(lease_dir).usage(list(configs))
+
+    clashes = sum(1 for result in results if result[3])
+    mismatches = sum(1 for result in results if not result[4])
+    waits = [result[2] for result in results]
+    ideal = max(args.jobs * args.job_time / len(configs), args.jobs * args.job_time / args.workers)
+    print(f"{'device':<10} {'model':<12} {'gpu':<8} {'jobs':>5} {'busy':>8}")
+    for serial, (leases, busy) in usage.items():
+        print(f"{serial:<10} {configs[serial]['model']:<12} {configs[serial]['gpu']:<8} {leases:>5} {busy:>7.2f}s")
+    print(f"{args.jobs} jobs from {args.workers} processes in {wall:.2f}s (ideal {ideal:.2f}s)")
+    print(f"wait mean {sum(waits) / len(waits):.3f}s, max {max(waits):.3f}s")
+    print(f"devices used by two jobs at once: {clashes}, jobs on a device not meeting their requirements: {mismatches}")
+    fake.cleanup()
+    return 1 if clashes or mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
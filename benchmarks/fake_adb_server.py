@@ -0,0 +1,233 @@
+"""
+Fake adb server speaking the host protocol on a local TCP port, used by the
+benchmarks together with FakeDevice.
+
+Shell services run the FakeDevice rc in a local POSIX shell and sync
+requests are served from a sandbox directory standing in for the device
+filesystem, so AdbServerClient can be exercised without a real adb server.
+"""
+
+import socketserver
+import struct
+import subprocess
+import threading
+
+from benchmarks.fake_device import FAKE_SERIAL
+
+DEFAULT_FEATURES = ("shell_v2", "cmd", "stat_v2")
+
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            while True:
+                service = self._read_request()
+                self.server.count(service)
+                if service == "host:version":
+                    self._okay_payload("0029")
+                    return
+                if service == "host:devices":
+                    self._okay_payload(f"{FAKE_SERIAL}\tdevice\n")
+                    return
+                if service.startswith("host-serial:") and service.endswith(":features"):
+                    self._okay_payload(",".join(self.server.features))
+                    return
+                if service.startswith("host:transport:"):
+                    self.request.sendall(b"OKAY")
+                    continue
+                if service.startswith("shell,v2,raw:"):
+                    self.request.sendall(b"OKAY")
+                    self._shell_v2(service.split(":", 1)[1])
+                    return
+                if service.startswith("exec:"):
+                    self.request.sendall(b"OKAY")
+                    self._exec(service.split(":", 1)[1])
+                    return
+                if service == "sync:":
+                    self.request.sendall(b"OKAY")
+                    self._sync()
+                    return
+                self._fail(f"unknown service {service}")
+                return
+        except (EOFError, OSError):
+            pass
+
+    def _read_request(self):
+        length = int(_recv_exact(self.request, 4), 16)
+        return _recv_exact(self.request, length).decode()
+
+    def _okay_payload(self, payload):
+        data = payload.encode()
+        self.request.sendall(b"OKAY" + b"%04x" % len(data) + data)
+
+    def _fail(self, message):
+        data = message.encode()
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def _device_shell(self, cmd):
+        rc = self.server.rc_path
+        if cmd.strip() in ("", "sh", "su -c sh", "su 0 sh"):
+            return ["sh", "-c", f"cat '{rc}' - | sh"]
+        return ["sh", "-c", f". '{rc}'; {cmd}"]
+
+    def _shell_v2(self, cmd):
+        stdin = b""
+        process = subprocess.Popen(self._device_shell(cmd), stdin=subprocess.PIPE, cwd=self.server.fs_root,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Collect stdin packets until the client closes stdin
+        while True:
+            header = _recv_exact(self.request, 5)
+            packet_id, length = struct.unpack("<BI", header)
+            payload = _recv_exact(self.request, length)
+            if packet_id == SHELL_STDIN:
+                stdin += payload
+            elif packet_id == SHELL_CLOSE_STDIN:
+                break
+        stdout, stderr = process.communicate(stdin)
+        for packet_id, data in ((SHELL_STDOUT, stdout), (SHELL_STDERR, stderr)):
+            if data:
+                self.request.sendall(struct.pack("<BI", packet_id, len(data)) + data)
+        self.request.sendall(struct.pack("<BI", SHELL_EXIT, 1) + bytes([process.returncode & 0xff]))
+
+    def _exec(self, cmd):
+        process = subprocess.Popen(self._device_shell(cmd), stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def _feed():
+            # Like exec-in, the client half-closes the socket at the end of its input
+            try:
+                for data in iter(lambda: self.request.recv(65536), b""):
+                    process.stdin.write(data)
+            except OSError:
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        threading.Thread(target=_feed, daemon=True).start()
+        for data in iter(lambda: process.stdout.read(65536), b""):
+            self.request.sendall(data)
+        process.wait()
+
+    def _sync(self):
+        while True:
+            header = _recv_exact(self.request, 8)
+            request_id, length = header[:4], struct.unpack("<I", header[4:])[0]
+            payload = _recv_exact(self.request, length).decode()
+            self.server.count(request_id.decode())
+            if request_id == b"QUIT":
+                return
+            if request_id == b"STAT":
+                path = self.server.local_path(payload)
+                if path.exists():
+                    st = path.stat()
+                    # Like adbd, v1 replies truncate the size to 32 bits
+                    reply = struct.pack("<III", st.st_mode, st.st_size & 0xffffffff, int(st.st_mtime))
+                else:
+                    reply = struct.pack("<III", 0, 0, 0)
+                self.request.sendall(b"STAT" + reply)
+            elif request_id == b"STA2":
+                path = self.server.local_path(payload)
+                self.request.sendall(b"STA2" + self._stat_v2(path))
+            elif request_id == b"RECV":
+                path = self.server.local_path(payload)
+                if not path.is_file():
+                    self._sync_fail(f"remote object '{payload}' does not exist")
+                    continue
+                with open(path, "rb") as infile:
+                    while True:
+                        chunk = infile.read(64 * 1024)
+                        if not chunk:
+                            break
+                        self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            elif request_id == b"SEND":
+                path = self.server.local_path(payload.rsplit(",", 1)[0])
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "wb") as outfile:
+                    while True:
+                        chunk_header = _recv_exact(self.request, 8)
+                        chunk_id = chunk_header[:4]
+                        chunk_length = struct.unpack("<I", chunk_header[4:])[0]
+                        if chunk_id == b"DONE":
+                            break
+                        outfile.write(_recv_exact(self.request, chunk_length))
+                self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+            else:
+                self._sync_fail(f"unknown sync request {request_id!r}")
+
+    @staticmethod
+    def _stat_v2(path):
+        if not path.exists():
+            return struct.pack("<IQQIIIIQqqq", 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        st = path.stat()
+        return struct.pack("<IQQIIIIQqqq", 0, st.st_dev, st.st_ino, st.st_mode, st.st_nlink, st.st_uid,
+                           st.st_gid, st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+    def _sync_fail(self, message):
+        data = message.encode()
+        self.request.sendall(b"FAIL" + struct.pack("<I", len(data)) + data)
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """
+    Serves the adb host protocol for one FakeDevice on 127.0.0.1.
+
+    Every service request is counted, so callers can compare round trips with
+    the process spawns of the fake adb binary.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fake_device, port=0, features=DEFAULT_FEATURES):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.features = list(features)
+        self.rc_path = fake_device.root / "device.rc"
+        self.fs_root = fake_device.root / "fs"
+        self.fs_root.mkdir(exist_ok=True)
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def local_path(self, remote):
+        return self.fs_root / remote.lstrip("/")
+
+    def count(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def reset(self):
+        with self._lock:
+            self.requests = []
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,165 @@
+"""
+Fake adb binary backed by a local POSIX shell, used by the benchmarks.
+
+The device commands traceui relies on are replaced by shell functions that
+answer like a rooted arm64 phone, so the full plugin flows can be driven
+without touching the host filesystem or needing real hardware.
+
+With files=True the file commands run for real instead, on host paths
+standing in for device paths, so tests can check what lands on the device.
+"""
+
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+FAKE_SERIAL = "fake0"
+FAKE_PACKAGE = "com.example.game"
+FAKE_PROPS = {"model": "Fake Phone", "abi": "arm64-v8a,armeabi-v7a", "gpu": "mali"}
+
+DEVICE_RC_TEMPLATE = r"""
+getprop() {
+    if [ $# -eq 0 ]; then
+        echo "[ro.product.model]: [__MODEL__]"
+        echo "[ro.vendor.product.cpu.abilist]: [__ABI__]"
+        echo "[ro.build.version.release]: [14]"
+        echo "[ro.hardware.egl]: [__GPU__]"
+        return 0
+    fi
+    case "$1" in
+        ro.product.model) echo "__MODEL__" ;;
+        ro.vendor.product.cpu.abilist) echo "__ABI__" ;;
+        ro.build.version.release) echo "14" ;;
+        ro.hardware.egl) echo "__GPU__" ;;
+        *) echo "" ;;
+    esac
+}
+su() {
+    case "$1" in -c|0) shift ;; esac
+    # 'su 0 sh' starts the root session, the fake shell already is one
+    if [ $# -eq 0 ] || [ "$*" = "sh" ]; then return 0; fi
+    eval "$*"
+}
+whoami() { echo root; }
+pm() { echo "package:/data/app/__PACKAGE__/base.apk"; }
+ls() { for f in "$@"; do case "$f" in -*) ;; *) echo "$f" ;; esac; done; }
+setprop() { :; }
+settings() { case "$1" in get) echo "" ;; esac; }
+setenforce() { :; }
+chcon() { :; }
+chown() { :; }
+chmod() { :; }
+mkdir() { :; }
+touch() { :; }
+rm() { :; }
+mv() { :; }
+stat() { echo 0; }
+am() { :; }
+appops() { :; }
+""".replace("__PACKAGE__", FAKE_PACKAGE)
+
+
+def device_rc(model, abi, gpu):
+    """Device rc answering getprop like a phone with this model, abi list and gpu"""
+    return DEVICE_RC_TEMPLATE.replace("__MODEL__", model).replace("__ABI__", abi).replace("__GPU__", gpu)
+
+
+DEVICE_RC = device_rc(**FAKE_PROPS)
+# Brings back the real file commands, see FakeDevice(files=True)
+FILE_COMMANDS_RC = "unset -f ls stat rm mv mkdir chmod touch\n"
+
+ADB_SCRIPT = r"""#!/bin/sh
+# Fake adb: every invocation is logged so the caller can count round-trips
+echo "$*" >> "__ROOT__/invocations.log"
+[ -n "$FAKE_ADB_LATENCY" ] && sleep "$FAKE_ADB_LATENCY"
+if [ "$1" = "devices" ]; then
+    printf 'List of devices attached\n__DEVICES__'
+    exit 0
+fi
+# Devices of a fleet have their own rc
+rc="__ROOT__/$2.rc"
+[ -f "$rc" ] || rc="__ROOT__/device.rc"
+shift 2
+sub="$1"
+shift
+case "$sub" in
+    shell)
+        case "$*" in
+            ""|"sh"|"su -c sh"|"su 0 sh")
+                exec sh -c "cat '$rc' - | sh"
+                ;;
+        esac
+        exec sh -c ". '$rc'; $*"
+        ;;
+    exec-out|exec-in)
+        exec sh -c ". '$rc'; $*"
+        ;;
+    push|pull)
+        # Like adb, progress lines are only drawn on a terminal
+        if [ -t 1 ] && [ "${TERM:-dumb}" != "dumb" ]; then
+            for percent in 0 10 20 30 40 50 60 70 80 90 100; do
+                printf '\r[%3d%%] %s' "$percent" "$*"
+                [ -n "$FAKE_ADB_TRANSFER_STEP" ] && sleep "$FAKE_ADB_TRANSFER_STEP"
+            done
+            printf '\r'
+        elif [ -n "$FAKE_ADB_TRANSFER_STEP" ]; then
+            sleep "$(awk "BEGIN { print $FAKE_ADB_TRANSFER_STEP * 11 }")"
+        fi
+        if [ -n "__FILES__" ]; then
+            # Device paths are host paths, copy for real
+            [ "$1" = "-p" ] && shift
+            dst="$2"
+            [ -d "$dst" ] && dst="$dst/$(basename "$1")"
+            cp "$1" "$dst" || exit 1
+        fi
+        echo "$*: 1 file ${sub}ed."
+        ;;
+esac
+exit 0
+"""
+
+
+class FakeDevice(object):
+    """
+    Temporary directory holding a fake ``adb`` executable and its device rc.
+
+    By default it emulates one device, FAKE_SERIAL. A fleet maps serials to
+    partial FAKE_PROPS overrides, e.g. {"p1": {"model": "Pixel"}}, and every
+    device of it answers getprop with its own model, abi list and gpu.
+    With files set, push, pull and the file commands work on the host
+    filesystem, and fs is a scratch directory to use for device paths.
+    """
+
+    def __init__(self, latency=0.0, fleet=None, files=False):
+        self._tempdir = tempfile.TemporaryDirectory(prefix="traceui_fake_adb_")
+        self.root = Path(self._tempdir.name)
+        self.adb_path = self.root / "adb"
+        self.log_path = self.root / "invocations.log"
+        real_files = FILE_COMMANDS_RC if files else ""
+        (self.root / "device.rc").write_text(DEVICE_RC + real_files)
+        for serial, props in (fleet or {}).items():
+            (self.root / f"{serial}.rc").write_text(device_rc(**dict(FAKE_PROPS, **props)) + real_files)
+        self.fs = self.root / "fs"
+        self.fs.mkdir()
+        self.serials = list(fleet) if fleet else [FAKE_SERIAL]
+        device_list = "".join(f"{serial}\\tdevice\\n" for serial in self.serials)
+        self.adb_path.write_text(
+            ADB_SCRIPT.replace("__ROOT__", str(self.root)).replace("__DEVICES__", device_list)
+            .replace("__FILES__", "1" if files else "")
+        )
+        self.adb_path.chmod(self.adb_path.stat().st_mode | stat.S_IXUSR)
+        os.environ["FAKE_ADB_LATENCY"] = str(latency) if latency else ""
+
+    def invocations(self):
+        """Number of adb processes spawned so far"""
+        if not self.log_path.exists():
+            return 0
+        return len(self.log_path.read_text().splitlines())
+
+    def reset(self):
+        if self.log_path.exists():
+            self.log_path.unlink()
+
+    def cleanup(self):
+        self._tempdir.cleanup()
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+"""
+Compares the pure Python and the NumPy k-means of core.frame_selection on
+synthetic per-frame counter data, and checks both select the same frames
+with the same weights.
+
+Usage: python benchmarks/frame_selection_benchmark.py [--frames 10000 100000 1000000] [--clusters 3]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from core import frame_selection  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--clusters", type=int, default=3, help="Number of frames to select.")
+    parser.add_argument("--python-max", type=int, default=1000000,
+                        help="Largest input to run the slow pure Python engine on.")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def make_samples(num_frames, seed):
+    """
+    Raw samples shaped like process_hwc output: a game moving between a few
+    scenes, each with its own counter levels, plus per-frame noise and some
+    frames without GPU activity.
+    """
+    rng = numpy.random.default_rng(seed)
+    scene_levels = rng.uniform(0.2, 5.0, size=(6, 7))
+    scene_levels[:, frame_selection.GPU_ACTIVE_SAMPLE_INDEX] *= 1e7
+    scene_lengths = rng.integers(200, 2000, size=num_frames // 200 + 1)
+    scenes = numpy.repeat(rng.integers(0, len(scene_levels), size=len(scene_lengths)), scene_lengths)[:num_frames]
+    samples = scene_levels[scenes] * rng.normal(1.0, 0.05, size=(num_frames, 7))
+    samples[rng.integers(0, num_frames, size=num_frames // 1000), frame_selection.GPU_ACTIVE_SAMPLE_INDEX] = 0
+    return samples
+
+
+def run_engine(samples, clusters, as_lists):
+    if as_lists:
+        samples = samples.tolist()
+    start = time.perf_counter()
+    # The random initial centers of tiny inputs must match between engines
+    random.seed(0)
+    normalized = frame_selection.normalize_samples(samples)
+    frames = frame_selection.pick_frames(clusters, normalized, samples, 0)
+    return frames, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    # Keep the per-iteration debug lines out of the timings
+    frame_selection.logger.setLevel("WARNING")
+    print(f"{'frames':>9} {'python':>10} {'numpy':>9} {'speedup':>8}  same result")
+    mismatches = 0
+    for num_frames in args.frames:
+        samples = make_samples(num_frames, args.seed)
+        numpy_frames, numpy_time = run_engine(samples, args.clusters, as_lists=False)
+        if num_frames > args.python_max:
+            print(f"{num_frames:>9} {'skipped':>10} {numpy_time:>8.2f}s {'':>8}  -")
+            continue
+        python_frames, python_time = run_engine(samples, args.clusters, as_lists=True)
+        same = python_frames == numpy_frames
+        mismatches += not same
+        print(f"{num_frames:>9} {python_time:>9.2f}s {numpy_time:>8.2f}s {python_time / numpy_time:>7.0f}x  {same}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""
+Compares the chunked PatternScanner used for the APK native lib scan with
+the baseline scan, which read the whole *.so and ran one substring search
+per symbol, and checks both find the same symbols.
+
+Usage: python benchmarks/pattern_scan_benchmark.py [--size-mib 64] [--runs 3]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import adblib  # noqa: E402
+from core.pattern_scan import PatternScanner  # noqa: E402
+
+PATTERNS = set(adblib.VULKAN_SYMBOLS) | set(adblib.GLES_SYMBOLS)
+for _sigs in adblib.ENGINES.values():
+    PATTERNS.update(_sigs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mib", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=3)
+    return parser.parse_args()
+
+
+def make_data(size, hits):
+    """Random bytes without letters, so no symbol occurs, plus the given symbols near the end"""
+    no_letters = bytes.maketrans(bytes(range(65, 91)) + bytes(range(97, 123)), bytes(52))
+    data = bytearray(os.urandom(size).translate(no_letters))
+    for index, pattern in enumerate(sorted(hits)):
+        offset = size - 4096 * (index + 1)
+        data[offset:offset + len(pattern)] = pattern
+    return bytes(data)
+
+
+def baseline_scan(stream):
+    content = stream.read()
+    return {p for p in PATTERNS if p in content}
+
+
+def scanner_scan(stream):
+    return PatternScanner(PATTERNS).scan(stream)
+
+
+def best_time(scan, data, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        found = scan(io.BytesIO(data))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return found, best
+
+
+def main():
+    args = parse_args()
+    size = args.size_mib * 1024 * 1024
+    cases = [
+        ("no symbols", set()),
+        ("vulkan + unity", {b"vkCreateInstance", b"libunity"}),
+        ("all symbols", PATTERNS),
+    ]
+    print(f"{'data':<16} {'baseline':>9} {'scanner':>9}  same result")
+    mismatches = 0
+    for name, hits in cases:
+        data = make_data(size, hits)
+        baseline_found, baseline_time = best_time(baseline_scan, data, args.runs)
+        scanner_found, scanner_time = best_time(scanner_scan, data, args.runs)
+        same = baseline_found == scanner_found == hits
+        mismatches += not same
+        print(f"{name:<16} {baseline_time:>8.2f}s {scanner_time:>8.2f}s  {same}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
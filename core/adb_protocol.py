@@ -0,0 +1,331 @@
+import os
+import shlex
+import socket
+import struct
+import threading
+import time
+from contextlib import closing
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("adb_protocol")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+SERVER_PORT_ENV = "ANDROID_ADB_SERVER_PORT"
+SYNC_DATA_MAX = 64 * 1024
+# STA2 reply after its 4 byte id, with a 64 bit size (stat_v2 feature):
+# error, dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime
+STAT_V2 = struct.Struct("<IQQIIIIQqqq")
+
+# Shell protocol v2 packet ids
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+
+
+class AdbProtocolError(RuntimeError):
+    """Raised when the adb server refuses a request or sends a malformed reply."""
+
+
+def _recv_exact(sock, size, allow_eof=False):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            if allow_eof and not data:
+                return b""
+            raise AdbProtocolError(f"Connection closed after {len(data)} of {size} bytes")
+        data += chunk
+    return data
+
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(SYNC_DATA_MAX)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def _read_hex_prefixed(sock):
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length)
+
+
+class _SyncConnection(object):
+    """One open 'sync:' service connection, reused for consecutive file requests."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def send_request(self, request_id, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.sock.sendall(request_id + struct.pack("<I", len(payload)) + payload)
+
+    def read_header(self):
+        header = _recv_exact(self.sock, 8)
+        return header[:4], struct.unpack("<I", header[4:])[0]
+
+    def read_fail(self, length):
+        message = _recv_exact(self.sock, length).decode(errors="replace")
+        raise AdbProtocolError(message)
+
+    def close(self):
+        try:
+            self.send_request(b"QUIT", b"")
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class AdbServerClient(object):
+    """
+    Talks the adb host protocol directly to the local adb server.
+
+    Every request is a plain TCP exchange with the server, so no adb process
+    is forked per call. Sync connections are kept open per device and reused
+    for stat, push and pull requests.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=None, timeout=None):
+        self.host = host
+        self.port = int(port or os.environ.get(SERVER_PORT_ENV, DEFAULT_PORT))
+        self.timeout = timeout
+        self._features = {}
+        self._sync = {}
+        self._lock = threading.Lock()
+
+    # Host services
+
+    def version(self):
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self):
+        """Returns a list of (serial, state) tuples, like 'adb devices'"""
+        devices = []
+        for line in self._host_query("host:devices").splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                devices.append((fields[0], fields[1]))
+        return devices
+
+    def features(self, serial):
+        if serial not in self._features:
+            features = self._host_query(f"host-serial:{serial}:features")
+            self._features[serial] = set(features.strip().split(","))
+        return self._features[serial]
+
+    # Device services
+
+    def shell(self, serial, cmd, stdin=None):
+        """
+        Runs a shell command on the device.
+
+        Returns:
+            tuple: (stdout, stderr, returncode), returncode is None on devices
+            without shell protocol v2
+        """
+        if "shell_v2" in self.features(serial):
+            return self._shell_v2(serial, cmd, stdin)
+        if stdin is not None:
+            raise AdbProtocolError(f"Device {serial} has no shell_v2 support, can not send stdin")
+        # Legacy shell merges stderr into stdout and drops the exit code
+        with closing(self._open_service(serial, f"shell:{cmd}")) as sock:
+            return _recv_all(sock).decode(errors="replace"), "", None
+
+    def exec_out(self, serial, cmd):
+        """Runs a command with a raw binary stdout stream, like 'adb exec-out'"""
+        with closing(self._open_service(serial, f"exec:{cmd}")) as sock:
+            return _recv_all(sock)
+
+    def open_exec(self, serial, cmd):
+        """Opens an 'exec:' stream and returns the socket, the caller closes it"""
+        return self._open_service(serial, f"exec:{cmd}")
+
+    def stat(self, serial, path):
+        """Returns (mode, size, mtime) of a remote path, None if it does not exist"""
+        if "stat_v2" not in self.features(serial):
+            # STAT v1 has a 32 bit size field, multi-GB traces would wrap
+            return self._shell_stat(serial, [path]).get(str(path))
+
+        def _stat(conn):
+            conn.send_request(b"STA2", str(path))
+            reply = _recv_exact(conn.sock, 4 + STAT_V2.size)
+            if reply[:4] != b"STA2":
+                raise AdbProtocolError(f"Unexpected sync reply {reply[:4]!r}")
+            error, _, _, mode, _, _, _, size, _, mtime, _ = STAT_V2.unpack(reply[4:])
+            return None if error else (mode, size, mtime)
+        return self._with_sync(serial, _stat)
+
+    def pull(self, serial, remote, local, progress=None, stop_event=None):
+        """
+        Pulls one remote file to a local file path.
+
+        Args:
+            progress (callable): Called as progress(transferred_bytes)
+            stop_event (threading.Event): Aborts the transfer when set
+
+        Returns:
+            bool: False if the transfer was cancelled
+        """
+        def _pull(conn):
+            conn.send_request(b"RECV", str(remote))
+            transferred = 0
+            with open(local, "wb") as outfile:
+                while True:
+                    request_id, length = conn.read_header()
+                    if request_id == b"DONE":
+                        return True
+                    if request_id == b"FAIL":
+                        conn.read_fail(length)
+                    if request_id != b"DATA":
+                        raise AdbProtocolError(f"Unexpected sync reply {request_id!r}")
+                    outfile.write(_recv_exact(conn.sock, length))
+                    transferred += length
+                    if progress:
+                        progress(transferred)
+                    if stop_event and stop_event.is_set():
+                        # The rest of the stream is still in flight, the connection can not be reused
+                        raise _Cancelled()
+        return self._with_sync(serial, _pull)
+
+    def push(self, serial, local, remote, mode=0o644, progress=None, stop_event=None):
+        """Pushes one local file to a remote file path, see pull() for arguments"""
+        def _push(conn):
+            conn.send_request(b"SEND", f"{remote},{mode}")
+            transferred = 0
+            with open(local, "rb") as infile:
+                while True:
+                    chunk = infile.read(SYNC_DATA_MAX)
+                    if not chunk:
+                        break
+                    conn.send_request(b"DATA", chunk)
+                    transferred += len(chunk)
+                    if progress:
+                        progress(transferred)
+                    if stop_event and stop_event.is_set():
+                        raise _Cancelled()
+            conn.sock.sendall(b"DONE" + struct.pack("<I", int(time.time())))
+            request_id, length = conn.read_header()
+            if request_id == b"FAIL":
+                conn.read_fail(length)
+            if request_id != b"OKAY":
+                raise AdbProtocolError(f"Unexpected sync reply {request_id!r}")
+            return True
+        return self._with_sync(serial, _push)
+
+    def close(self):
+        """Closes all cached sync connections"""
+        with self._lock:
+            connections, self._sync = self._sync, {}
+        for conn in connections.values():
+            conn.close()
+
+    # Helpers
+
+    def _connect(self):
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def _send_request(self, sock, request):
+        data = request.encode()
+        sock.sendall(b"%04x" % len(data) + data)
+        status = _recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbProtocolError(_read_hex_prefixed(sock).decode(errors="replace"))
+        raise AdbProtocolError(f"Unexpected adb server status {status!r}")
+
+    def _host_query(self, request):
+        with closing(self._connect()) as sock:
+            self._send_request(sock, request)
+            return _read_hex_prefixed(sock).decode(errors="replace")
+
+    def _open_service(self, serial, service):
+        sock = self._connect()
+        try:
+            self._send_request(sock, f"host:transport:{serial}")
+            self._send_request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _shell_v2(self, serial, cmd, stdin):
+        stdout = []
+        stderr = []
+        returncode = None
+        with closing(self._open_service(serial, f"shell,v2,raw:{cmd}")) as sock:
+            if stdin is not None:
+                data = stdin.encode() if isinstance(stdin, str) else stdin
+                sock.sendall(struct.pack("<BI", SHELL_STDIN, len(data)) + data)
+            # Like 'adb shell </dev/null', the command must not wait for input
+            sock.sendall(struct.pack("<BI", SHELL_CLOSE_STDIN, 0))
+            while True:
+                header = _recv_exact(sock, 5, allow_eof=True)
+                if not header:
+                    break
+                packet_id, length = struct.unpack("<BI", header)
+                payload = _recv_exact(sock, length)
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(payload)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(payload)
+                elif packet_id == SHELL_EXIT:
+                    returncode = payload[0] if payload else None
+                    break
+        return (b"".join(stdout).decode(errors="replace"),
+                b"".join(stderr).decode(errors="replace"),
+                returncode)
+
+    def _shell_stat(self, serial, paths):
+        """Returns {path: (mode, size, mtime)} of the existing paths, from one shell stat call"""
+        out, _, _ = self.shell(serial, "stat -c '%f %s %Y %n' " + " ".join(shlex.quote(str(p)) for p in paths))
+        result = {}
+        for line in out.splitlines():
+            fields = line.split(" ", 3)
+            try:
+                result[fields[3]] = (int(fields[0], 16), int(fields[1]), int(fields[2]))
+            except (IndexError, ValueError):
+                continue
+        return result
+
+    def _with_sync(self, serial, request):
+        """
+        Runs request(conn) on the cached sync connection of a device, retrying
+        once on a fresh connection if the cached one was closed by the server.
+        """
+        for attempt in range(2):
+            with self._lock:
+                conn = self._sync.get(serial)
+                if conn is None:
+                    conn = _SyncConnection(self._open_service(serial, "sync:"))
+                    self._sync[serial] = conn
+            with conn.lock:
+                try:
+                    return request(conn)
+                except _Cancelled:
+                    self._drop_sync(serial, conn)
+                    return False
+                except (OSError, AdbProtocolError) as e:
+                    # A FAIL reply leaves the stream in an unknown state, never reuse it
+                    self._drop_sync(serial, conn)
+                    if attempt or isinstance(e, AdbProtocolError):
+                        raise
+                    logger.debug(f"Sync connection to {serial} was lost, reconnecting: {e}")
+
+    def _drop_sync(self, serial, conn):
+        with self._lock:
+            if self._sync.get(serial) is conn:
+                del self._sync[serial]
+        conn.sock.close()
+
+
+class _Cancelled(Exception):
+    pass
@@ -0,0 +1,136 @@
+import queue
+import subprocess
+import threading
+import uuid
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("adb_session")
+
+
+class AdbSessionError(RuntimeError):
+    """Raised when a persistent adb shell dies or stops answering."""
+
+
+class AdbShellSession(object):
+    """
+    Long-lived ``adb shell`` for a single device.
+
+    Commands are written to the shell's stdin and framed with a unique sentinel
+    on both stdout and stderr, so consecutive commands can be told apart
+    without forking a new adb process for each of them.
+    """
+
+    def __init__(self, device, sudo_command=None, adb_binary="adb", timeout=None):
+        self.device = device
+        self.sudo_command = sudo_command
+        self.adb_binary = adb_binary
+        self.timeout = timeout
+        self.process = None
+        self._stdout = None
+        self._stderr = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spawns the shell, wrapped in the sudo command for root sessions."""
+        cmd = [self.adb_binary, '-s', self.device, 'shell']
+        if self.sudo_command:
+            cmd += self.sudo_command.split() + ['sh']
+        logger.debug("Starting persistent ADB session: " + " ".join(cmd))
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self._stdout = self._start_reader(self.process.stdout)
+        self._stderr = self._start_reader(self.process.stderr)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, cmd, timeout=None):
+        """
+        Runs one shell command line in the session.
+
+        Args:
+            cmd (str): Command line, interpreted by the device shell
+            timeout (float): Seconds to wait for the command, None waits forever
+
+        Returns:
+            tuple: (stdout, stderr, returncode)
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if not self.is_alive():
+                self.start()
+            marker = f"__TRACEUI_{uuid.uuid4().hex}__"
+            # Run in a subshell so 'exit' or 'cd' can not leak into the session,
+            # and detach stdin so the command can not eat the following ones.
+            script = (
+                f"( {cmd}\n) </dev/null\n"
+                f"__traceui_rc=$?\n"
+                f"echo; echo {marker} $__traceui_rc\n"
+                f"echo >&2; echo {marker} >&2\n"
+            )
+            try:
+                self.process.stdin.write(script)
+                self.process.stdin.flush()
+                stdout, rc_line = self._read_until(self._stdout, marker, timeout)
+                stderr, _ = self._read_until(self._stderr, marker, timeout)
+            except (OSError, AdbSessionError):
+                self.close()
+                raise
+        try:
+            returncode = int(rc_line.split()[1])
+        except (IndexError, ValueError):
+            returncode = None
+        return stdout, stderr, returncode
+
+    def close(self):
+        """Stops the shell. The next run() starts a new one."""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write("exit\n")
+                process.stdin.flush()
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _read_until(self, lines, marker, timeout):
+        collected = []
+        while True:
+            try:
+                line = lines.get(timeout=timeout)
+            except queue.Empty:
+                raise AdbSessionError(f"Timed out after {timeout}s waiting for device {self.device}")
+            if line is None:
+                raise AdbSessionError(f"ADB session for device {self.device} closed unexpectedly")
+            if line.startswith(marker):
+                # Drop the newline emitted in front of the marker
+                return "".join(collected)[:-1], line
+            collected.append(line)
+
+    @staticmethod
+    def _start_reader(stream):
+        # Drain each pipe on its own thread so a full stderr buffer can never
+        # block the device while we wait on stdout
+        lines = queue.Queue()
+
+        def _pump():
+            for line in iter(stream.readline, ''):
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(target=_pump, daemon=True).start()
+        return lines
@@ -13,13 +13,14 @@ class adbWorker(QObject):
     finished = Signal(bool)
     progress = Signal(int, str)
 
-    def __init__(self, adb=None, file=None, path=None, track=None, action=None):
+    def __init__(self, adb=None, file=None, path=None, track=None, action=None, resumable=False):
         super().__init__()
         self.adb = adb
         self.file = file
         self.path = path
         self.track = track
         self.action = action
+        self.resumable = resumable
         self._last_logged_percent = -1
         self._cancel_event = threading.Event()
 
@@ -43,10 +44,10 @@ class adbWorker(QObject):
 
         if self.action == "push":
             self._report_progress(0, f"Starting upload of {self.file}")
-            result = self.adb.push(file=self.file, path=self.path, device=None, track=self.track, progress_callback=progress_callback, stop_event=self._cancel_event)
+            result = self.adb.push(file=self.file, path=self.path, device=None, track=self.track, progress_callback=progress_callback, stop_event=self._cancel_event, resumable=self.resumable)
         elif self.action == "pull":
             self._report_progress(0, f"Starting download of {self.file}")
-            result = self.adb.pull(file=self.file, path=self.path, device=None, progress_callback=progress_callback, stop_event=self._cancel_event)
+            result = self.adb.pull(file=self.file, path=self.path, device=None, progress_callback=progress_callback, stop_event=self._cancel_event, resumable=self.resumable)
         else:
             result = False
 
@@ -65,9 +66,10 @@ class AdbThread(QObject):
         self.thread = None
 
 
-    def fileHandler(self, adb=None, file=None, path=None, track=False,  action=None):
+    def fileHandler(self, adb=None, file=None, path=None, track=False,  action=None, resumable=False):
         """
         Creates a thread to push files to device and prevent GUI glitching.
+        With resumable set, the transfer is chunked, verified and resumes a previous partial one.
         """
         if hasattr(self, 'thread') and self.thread is not None:
             try:
@@ -80,7 +82,7 @@ class AdbThread(QObject):
             self.thread = None
 
         logger.info("FileHandler started in background")
-        self.worker = adbWorker(adb=adb, file=file, path=path, track=track,  action=action)
+        self.worker = adbWorker(adb=adb, file=file, path=path, track=track,  action=action, resumable=resumable)
         self.thread = QThread()
         self.push_event_loop = QEventLoop()
 
@@ -104,7 +106,7 @@ class AdbThread(QObject):
             self.thread.quit()
             self.thread.wait()
 
-    def run_with_progress(self, parent, title, adb, file, path, track=False, action=None, on_cancel=None):
+    def run_with_progress(self, parent, title, adb, file, path, track=False, action=None, on_cancel=None, resumable=False):
         """
         Run an adb file transfer with a progress dialog.
         Returns a tuple: (cancelled: bool, success: bool)
@@ -141,7 +143,7 @@ class AdbThread(QObject):
         progress_dialog.canceled.connect(on_cancel_clicked)
         self.progress_signal.connect(on_progress)
         self.operation_finished.connect(on_finished)
-        self.fileHandler(adb=adb, file=file, path=path, track=track, action=action)
+        self.fileHandler(adb=adb, file=file, path=path, track=track, action=action, resumable=resumable)
         return cancelled["value"], success["value"]
 
     def on_done(self):
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+
+from core.logger_config import REPO_ROOT, setup_logger
+
+logger = setup_logger("analysis_cache")
+
+# Set to 0 to always pull and rescan the apk in analyze_package
+ANALYSIS_CACHE_ENV = "TRACEUI_ANALYSIS_CACHE"
+DEFAULT_CACHE_PATH = os.path.join(REPO_ROOT, "cache", "apk_analysis.json")
+DEFAULT_MAX_ENTRIES = 512
+
+
+def analysis_cache_enabled():
+    return os.environ.get(ANALYSIS_CACHE_ENV, "1") != "0"
+
+
+class AnalysisCache(object):
+    """
+    On-disk cache of apk analysis results.
+
+    Entries are keyed by package, versionCode and a checksum of base.apk, so a
+    result is reused on any device with the same build and dropped as soon as
+    the apk changes. The least recently used entries are evicted once the
+    cache holds more than max_entries results.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(pkg, version_code, checksum):
+        return f"{pkg}:{version_code}:{checksum}"
+
+    def get(self, key):
+        """Returns the cached result for a key, None if there is none"""
+        with self._lock:
+            entry = self.__load().get(key)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+            self.__save()
+            return entry["result"]
+
+    def put(self, key, result):
+        with self._lock:
+            entries = self.__load()
+            entries[key] = {"result": result, "last_used": time.time()}
+            if len(entries) > self.max_entries:
+                by_age = sorted(entries, key=lambda k: entries[k]["last_used"])
+                for old_key in by_age[:len(entries) - self.max_entries]:
+                    del entries[old_key]
+            self.__save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self.__save()
+
+    def __load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable analysis cache {self.path}: {e}")
+                self._entries = {}
+        return self._entries
+
+    def __save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write analysis cache {self.path}: {e}")
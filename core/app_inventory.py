@@ -0,0 +1,77 @@
+import re
+
+PACKAGE_HEADER = re.compile(r'^\s+Package \[([^\]]+)\]')
+
+
+def parse_dumpsys_packages(output):
+    """
+    Parses the 'Packages:' section of 'dumpsys package packages'.
+
+    Returns:
+        dict: Package name -> {'name', 'abi', 'version', 'path', 'label'}, only
+        the keys found in the dump are set besides 'name'
+    """
+    packages = {}
+    current = None
+    in_packages = False
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            # Top level headers start a section, later ones like 'Hidden system packages:'
+            # repeat older copies of the same packages
+            if in_packages and packages:
+                break
+            in_packages = line.startswith("Packages:")
+            current = None
+            continue
+        if not in_packages:
+            continue
+        m = PACKAGE_HEADER.match(line)
+        if m:
+            current = packages.setdefault(m.group(1), {'name': m.group(1)})
+            continue
+        if current is None:
+            continue
+        stripped = line.strip()
+        if 'primaryCpuAbi=' in stripped:
+            current['abi'] = stripped.split('=')[1]
+        elif 'versionName=' in stripped:
+            current['version'] = stripped.split('=')[1]
+        elif 'resourcePath=' in stripped:
+            current['path'] = stripped.split('resourcePath=')[1]
+        elif stripped.startswith("application-label:") or stripped.startswith("application-label-"):
+            current.setdefault('label', stripped.split(":", 1)[1].strip().strip("'"))
+    return packages
+
+
+class AppInventory(object):
+    """
+    Installed packages of one device, indexed by package name and label.
+    """
+
+    def __init__(self, packages):
+        self.packages = packages
+        self.labels = {}  # lower case label -> [package names]
+        for name, package in packages.items():
+            label = package.get('label')
+            if label:
+                self.labels.setdefault(label.lower(), []).append(name)
+
+    def __contains__(self, name):
+        return name in self.packages
+
+    def get(self, name):
+        return self.packages.get(name)
+
+    def find_by_label(self, label, substring=False):
+        """Returns the package names with the given label, case insensitive"""
+        label = label.lower()
+        if not substring:
+            return list(self.labels.get(label, []))
+        return [name for known, names in self.labels.items() if label in known for name in names]
+
+    def find_by_name(self, text):
+        """Returns the package names containing text, case insensitive"""
+        text = text.lower()
+        return [name for name in self.packages if text in name.lower()]
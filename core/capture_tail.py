@@ -0,0 +1,105 @@
+import os
+import shlex
+import threading
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("capture_tail")
+
+# Set to 1 to copy the capture file while the app is being traced in the GUI
+STREAM_CAPTURE_ENV = "TRACEUI_STREAM_CAPTURE"
+DEFAULT_INTERVAL = 2  # seconds between size checks of the capture file
+
+
+def capture_streaming_enabled():
+    return os.environ.get(STREAM_CAPTURE_ENV, "0") == "1"
+
+
+class CaptureTail(object):
+    """
+    Copies a capture file that is still being written on the device into
+    a local '<name>.partial' file in a background thread.
+
+    Only whole dd blocks below the current size are fetched, read with dd
+    skip= as root since the file belongs to the traced app. Nothing here
+    assumes the tracer only appends: a resumable adb.pull of the finished
+    file re-checks every chunk of the partial file against the device, so
+    after stop() only the tail and any rewritten chunks are transferred and
+    the whole file is verified by size and sha256.
+    """
+
+    def __init__(self, adb, remote_path, local_path, device=None, interval=DEFAULT_INTERVAL,
+                 block_size=1024 * 1024, max_read=64 * 1024 * 1024):
+        self.adb = adb
+        self.remote_path = str(remote_path)
+        self.local_path = str(local_path)
+        self.device = device
+        self.interval = interval
+        self.block_size = block_size
+        self.max_read = max_read
+        self.offset = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.local_path)), exist_ok=True)
+        # A new capture starts from an empty file, drop what an older one left behind
+        with open(self.local_path, "wb"):
+            pass
+        logger.info(f"Streaming {self.remote_path} to {self.local_path} while capturing")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops fetching, the partial file keeps the blocks copied so far.
+
+        Returns:
+            int: Number of bytes copied to the partial file
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        logger.info(f"Streamed {self.offset / (1024 * 1024):.1f} MiB of {self.remote_path} during the capture")
+        return self.offset
+
+    def wait(self):
+        """Blocks until stop() is called from another thread or a signal handler"""
+        while self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=0.5)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception(f"Streaming {self.remote_path} failed, the final pull fetches the rest")
+                return
+
+    def poll(self):
+        """Fetches the whole blocks that were appended since the last call"""
+        stdout, _ = self.adb.command(['stat', '-c', '%s', self.remote_path], True, self.device,
+                                     errors_handled_externally=True, print_command=False)
+        if not stdout.isdigit():
+            return
+        available = int(stdout) // self.block_size * self.block_size
+        while self.offset < available and not self._stop_event.is_set():
+            blocks = min(available - self.offset, self.max_read) // self.block_size
+            self._fetch(blocks)
+
+    def _fetch(self, blocks):
+        cmd = (f"dd if={shlex.quote(self.remote_path)} bs={self.block_size} "
+               f"skip={self.offset // self.block_size} count={blocks} 2>/dev/null")
+        stream = self.adb.open_exec_stream(cmd, self.device, run_with_sudo=True)
+        with stream, open(self.local_path, "r+b") as out:
+            out.seek(self.offset)
+            for data in iter(lambda: stream.read(self.block_size), b""):
+                if self._stop_event.is_set():
+                    stream.abort()
+                    break
+                out.write(data)
+                self.offset += len(data)
+        # A short read may end inside a block, continue at its start next time
+        self.offset = self.offset // self.block_size * self.block_size
@@ -0,0 +1,372 @@
+import getpass
+import json
+import os
+import socket
+import tempfile
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, leases are disabled there
+    fcntl = None
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("device_lease")
+
+# Set to 0 to let traceui_cli use devices without taking a lease
+DEVICE_LEASES_ENV = "TRACEUI_DEVICE_LEASES"
+# Directory of the lease files, shared by every checkout and user on the host
+LEASE_DIR_ENV = "TRACEUI_LEASE_DIR"
+# Seconds to wait for a device before giving up, empty or 0 waits forever
+LEASE_TIMEOUT_ENV = "TRACEUI_LEASE_TIMEOUT"
+DEFAULT_LEASE_DIR = os.path.join(tempfile.gettempdir(), "traceui_leases")
+
+
+def leases_enabled():
+    return fcntl is not None and os.environ.get(DEVICE_LEASES_ENV, "1") != "0"
+
+
+def lease_timeout():
+    value = os.environ.get(LEASE_TIMEOUT_ENV, "")
+    return float(value) if value and float(value) > 0 else None
+
+
+class LeaseTimeout(TimeoutError):
+    pass
+
+
+def parse_requirements(items):
+    """
+    Parses KEY=VALUE device requirements, e.g. ['model=Pixel 8', 'gpu=mali'].
+
+    Returns:
+        dict: {config key: wanted value}
+
+    Raises:
+        ValueError: If an item is not KEY=VALUE
+    """
+    requirements = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"Device requirement '{item}' is not KEY=VALUE")
+        requirements[key.strip()] = value.strip()
+    return requirements
+
+
+def device_matches(config, requirements):
+    """
+    Checks a device config from adb.configs against requirements. Values
+    compare case-insensitively, 'abi' matches any entry of the abi list.
+    """
+    for key, wanted in requirements.items():
+        value = config.get(key)
+        if value is None:
+            return False
+        wanted = wanted.lower()
+        if key == "abi":
+            if wanted not in [abi.strip().lower() for abi in str(value).split(",")]:
+                return False
+        elif isinstance(value, bool):
+            if wanted not in (("1", "true", "yes") if value else ("0", "false", "no")):
+                return False
+        elif str(value).lower() != wanted:
+            return False
+    return True
+
+
+def match_devices(configs, requirements):
+    """Returns the serials in configs whose config meets the requirements"""
+    return [serial for serial, config in configs.items() if device_matches(config, requirements)]
+
+
+def _user():
+    try:
+        return getpass.getuser()
+    except Exception:  # no user name in the environment or the password database
+        return str(os.getuid())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _holder_alive(holder):
+    """A holder lives until it expires, or while its process runs if it has no expiry"""
+    if holder.get("host") != socket.gethostname():
+        # Another host sharing the lease directory, only the expiry can tell
+        return holder.get("expires") is None or holder["expires"] > time.time()
+    if holder.get("expires") is not None:
+        return holder["expires"] > time.time()
+    return _pid_alive(holder["pid"])
+
+
+class DeviceLease(object):
+    """
+    Exclusive use of one device, released with release() or by leaving the
+    with block. A lease without a manager is a placeholder for runs with
+    leases disabled.
+    """
+
+    def __init__(self, device, token=None, manager=None, expires=None):
+        self.device = device
+        self.token = token
+        self.manager = manager
+        self.expires = expires
+
+    def release(self):
+        if self.manager is not None:
+            self.manager.release(self.device, self.token)
+            self.manager = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class LeaseManager(object):
+    """
+    Hands out exclusive device leases through lock files, so traceui
+    processes of different users and CI jobs sharing a host never drive the
+    same device at the same time.
+
+    Every device has a '<serial>.json' file in the lease directory holding
+    the current holder and the lease count and busy time of the device. The
+    file is only read and written under flock, so taking a lease is atomic.
+    A lease ends when it is released, when its process exits or, for leases
+    taken with a ttl that outlive their process (capture setup), when it
+    expires.
+
+    Processes waiting for a device register a ticket in 'queue/'. A waiter
+    only takes a free device that no older live ticket could also use, so
+    jobs get devices in the order they asked for them, while a job asking
+    for other devices is not held up. Among the free devices a job can use,
+    the one with the least busy time so far is picked, which spreads the
+    jobs over the fleet.
+    """
+
+    def __init__(self, lease_dir=None, poll_interval=1.0):
+        self.lease_dir = lease_dir or os.environ.get(LEASE_DIR_ENV) or DEFAULT_LEASE_DIR
+        self.queue_dir = os.path.join(self.lease_dir, "queue")
+        self.poll_interval = poll_interval
+        for path in (self.lease_dir, self.queue_dir):
+            os.makedirs(path, exist_ok=True)
+            try:
+                # Shared by all users on the host
+                os.chmod(path, 0o1777)
+            except PermissionError:
+                pass
+
+    def acquire(self, candidates, job="", timeout=None, ttl=None, on_wait=None):
+        """
+        Waits for a lease on one of the candidate devices.
+
+        Args:
+            candidates: Serials of the devices the job can run on
+            job (str): Description of the job, shown to other waiters
+            timeout (float): Seconds to wait, None waits forever
+            ttl (float): Seconds the lease lasts when it must outlive this process
+            on_wait (callable): Called once as on_wait(holders) if the job has to wait,
+                holders maps each candidate to its holder record or None
+
+        Returns:
+            DeviceLease: The lease, on the least used free device
+
+        Raises:
+            LeaseTimeout: If no candidate became free within timeout
+        """
+        candidates = list(dict.fromkeys(candidates))
+        if not candidates:
+            raise ValueError("No candidate devices to lease")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = self.__add_ticket(candidates, job)
+        waited = False
+        try:
+            while True:
+                blocked = self.__claimed_by_older_tickets(ticket)
+                free = []
+                for device in candidates:
+                    record = self.__read(device)
+                    if device not in blocked and not self.__held(record):
+                        free.append((record.get("busy_seconds", 0.0), record.get("leases", 0), device))
+                for _, _, device in sorted(free):
+                    lease = self.try_acquire(device, job, ttl)
+                    if lease is not None:
+                        if waited:
+                            logger.debug(f"Got device {device} for {job or 'job'}")
+                        return lease
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise LeaseTimeout(f"No device of {candidates} became free within {timeout}s")
+                if not waited:
+                    waited = True
+                    holders = self.holders(candidates)
+                    logger.debug(f"Waiting for a device of {candidates}, held by {holders}")
+                    if on_wait:
+                        on_wait(holders)
+                time.sleep(self.poll_interval)
+        finally:
+            self.__remove_ticket(ticket)
+
+    def try_acquire(self, device, job="", ttl=None):
+        """Returns a DeviceLease if the device is free, None if it is held"""
+        now = time.time()
+        holder = {
+            "token": uuid.uuid4().hex,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "user": _user(),
+            "job": job,
+            "since": now,
+            "expires": now + ttl if ttl else None,
+        }
+        with self.__locked(device) as lock_file:
+            record = self.__load(lock_file)
+            if self.__held(record):
+                return None
+            if record.get("holder"):
+                logger.warning(f"Taking over the stale lease of device {device} from {record['holder']}")
+                self.__close_holder(record, now)
+            record["holder"] = holder
+            record["leases"] = record.get("leases", 0) + 1
+            self.__store(lock_file, record)
+        logger.debug(f"Leased device {device} for {job or 'job'}")
+        return DeviceLease(device, holder["token"], self, holder["expires"])
+
+    def release(self, device, token):
+        """Ends the lease with this token, a no-op if it already ended"""
+        with self.__locked(device) as lock_file:
+            record = self.__load(lock_file)
+            holder = record.get("holder")
+            if not holder or holder.get("token") != token:
+                logger.warning(f"Lease {token} of device {device} is no longer held, nothing to release")
+                return False
+            self.__close_holder(record, time.time())
+            self.__store(lock_file, record)
+        logger.debug(f"Released device {device}")
+        return True
+
+    def holders(self, devices):
+        """Returns {device: holder record or None} for the live leases"""
+        result = {}
+        for device in devices:
+            record = self.__read(device)
+            result[device] = record["holder"] if self.__held(record) else None
+        return result
+
+    def usage(self, devices):
+        """Returns {device: (number of leases, busy seconds)} over the life of the lease directory"""
+        result = {}
+        for device in devices:
+            record = self.__read(device)
+            busy = record.get("busy_seconds", 0.0)
+            if self.__held(record):
+                busy += time.time() - record["holder"]["since"]
+            result[device] = (record.get("leases", 0), busy)
+        return result
+
+    @staticmethod
+    def __held(record):
+        return bool(record.get("holder")) and _holder_alive(record["holder"])
+
+    @staticmethod
+    def __close_holder(record, now):
+        holder = record.pop("holder")
+        end = now if holder.get("expires") is None else min(now, holder["expires"])
+        record["busy_seconds"] = record.get("busy_seconds", 0.0) + max(0.0, end - holder["since"])
+        record["holder"] = None
+
+    def __path(self, device):
+        # Serials of network devices contain ':'
+        return os.path.join(self.lease_dir, device.replace(os.sep, "_").replace(":", "_") + ".json")
+
+    def __locked(self, device):
+        return _LockedFile(self.__path(device))
+
+    def __read(self, device):
+        with self.__locked(device) as lock_file:
+            return self.__load(lock_file)
+
+    @staticmethod
+    def __load(lock_file):
+        lock_file.seek(0)
+        content = lock_file.read()
+        try:
+            return json.loads(content) if content else {}
+        except ValueError:
+            logger.warning(f"Ignoring corrupt lease file {lock_file.name}")
+            return {}
+
+    @staticmethod
+    def __store(lock_file, record):
+        lock_file.seek(0)
+        lock_file.truncate()
+        json.dump(record, lock_file)
+        lock_file.flush()
+
+    def __add_ticket(self, candidates, job):
+        # Names sort in the order the tickets were taken
+        name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        ticket = os.path.join(self.queue_dir, name)
+        with open(ticket, "w") as ticket_file:
+            json.dump({"pid": os.getpid(), "host": socket.gethostname(), "candidates": candidates, "job": job},
+                      ticket_file)
+        return ticket
+
+    def __remove_ticket(self, ticket):
+        try:
+            os.remove(ticket)
+        except FileNotFoundError:
+            pass
+
+    def __claimed_by_older_tickets(self, ticket):
+        """Returns the devices wanted by live tickets queued before this one"""
+        blocked = set()
+        own = os.path.basename(ticket)
+        for name in sorted(os.listdir(self.queue_dir)):
+            if name >= own:
+                break
+            path = os.path.join(self.queue_dir, name)
+            try:
+                with open(path) as ticket_file:
+                    waiter = json.load(ticket_file)
+            except (OSError, ValueError):
+                continue
+            if waiter.get("host") == socket.gethostname() and not _pid_alive(waiter.get("pid", 0)):
+                logger.debug(f"Removing the ticket of exited process {waiter.get('pid')}")
+                self.__remove_ticket(path)
+                continue
+            blocked.update(waiter.get("candidates", []))
+        return blocked
+
+
+class _LockedFile(object):
+    """A lease file opened and held under an exclusive flock"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            # Other users must be able to lock the file too, whatever their umask
+            os.fchmod(fd, 0o666)
+        except PermissionError:
+            pass
+        self.file = os.fdopen(fd, "r+")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
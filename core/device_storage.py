@@ -0,0 +1,175 @@
+import os
+import shlex
+import time
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("device_storage")
+
+# MiB to keep free on the device when pushing a trace, 0 turns eviction off
+MIN_FREE_ENV = "TRACEUI_DEVICE_MIN_FREE"
+DEFAULT_MIN_FREE_MIB = 2048
+# Index of the traces used in a replay working dir, one '<epoch> <path>' line per use
+LRU_INDEX_NAME = ".traceui_lru"
+DELETE_BATCH = 256  # paths per rm call, keeps every call far below ARG_MAX
+INDEX_COMPACT_FACTOR = 4  # rewrite the index once it has this many lines per trace
+
+
+def min_free_bytes():
+    return int(float(os.environ.get(MIN_FREE_ENV, DEFAULT_MIN_FREE_MIB)) * 1024 * 1024)
+
+
+class DeviceStorage(object):
+    """
+    Manages the traces traceui leaves in the replay working dirs.
+
+    Every push or replay of a trace appends a line to an index file in the
+    working dir, on the device so it is shared by every host and process
+    driving the device. Before a trace is pushed, the least recently used
+    traces of the index are evicted until the device keeps the configured
+    free space. Files that traceui never recorded are left alone.
+    Deletions run as a few batched rm calls in one root round-trip.
+    """
+
+    def __init__(self, adb):
+        self.adb = adb
+
+    def delete(self, paths, device=None):
+        """
+        Deletes device files in one round-trip.
+
+        Returns:
+            list: The paths of the rm calls that failed
+        """
+        paths = [str(path) for path in paths]
+        batches = [paths[i:i + DELETE_BATCH] for i in range(0, len(paths), DELETE_BATCH)]
+        results = self.adb.command_many(
+            [['rm', '-f'] + [shlex.quote(path) for path in batch] for batch in batches],
+            True, device, errors_handled_externally=True, print_command=False,
+        )
+        failed = []
+        for batch, (_, err, rc) in zip(batches, results):
+            if rc != 0:
+                logger.warning(f"Failed to delete some of {len(batch)} files: {err.strip()}")
+                failed.extend(batch)
+        logger.debug(f"Deleted {len(paths) - len(failed)} files in {len(batches)} rm calls")
+        return failed
+
+    def free_space(self, path, device=None):
+        """Returns the bytes available on the filesystem of a device path, None if unknown"""
+        stdout, _ = self.adb.command(['df', '-k', shlex.quote(str(path))], True, device,
+                                     errors_handled_externally=True, print_command=False)
+        lines = stdout.strip().splitlines()
+        fields = lines[-1].split() if len(lines) > 1 else []
+        if len(fields) < 4 or not fields[3].isdigit():
+            logger.debug(f"Could not read the free space of {path}: {stdout.strip()}")
+            return None
+        return int(fields[3]) * 1024
+
+    def record_use(self, working_dir, paths, device=None):
+        """Marks traces in working_dir as just used"""
+        now = int(time.time())
+        index = shlex.quote(f"{working_dir}/{LRU_INDEX_NAME}")
+        lines = "".join(f"{now} {path}\n" for path in paths)
+        # A batch runs in a root shell, so the redirection is done as root too
+        self.adb.command_many([['printf', "'%s'", shlex.quote(lines), '>>', index]], True, device,
+                              errors_handled_externally=True, print_command=False)
+
+    def last_used(self, working_dir, device=None):
+        """Returns {path: epoch of the last use} from the index of working_dir"""
+        stdout, _ = self.adb.command(['cat', shlex.quote(f"{working_dir}/{LRU_INDEX_NAME}")], True, device,
+                                     errors_handled_externally=True, print_command=False)
+        return self.__parse_index(stdout)
+
+    def traces(self, working_dir, device=None):
+        """
+        Lists the recorded traces still present in working_dir.
+
+        Returns:
+            list: (last use epoch, size in bytes, path) tuples, least recently used first
+        """
+        index = shlex.quote(f"{working_dir}/{LRU_INDEX_NAME}")
+        results = self.adb.command_many([
+            ['cat', index],
+            [f"cut -d' ' -f2- {index} | sort -u | while IFS= read -r f; do "
+             f"[ -f \"$f\" ] && stat -c '%s %n' \"$f\"; done"],
+        ], True, device, errors_handled_externally=True, print_command=False)
+        used = self.__parse_index(results[0][0])
+        traces = []
+        for line in results[1][0].splitlines():
+            size, _, path = line.partition(" ")
+            if size.isdigit() and path in used:
+                traces.append((used[path], int(size), path))
+        if len(results[0][0].splitlines()) > INDEX_COMPACT_FACTOR * (len(used) + 16):
+            # Every use appends a line, keep only the last use of the traces still there
+            self.__rewrite_index(working_dir, {path: stamp for stamp, _, path in traces}, device)
+        return sorted(traces)
+
+    def make_room(self, working_dir, incoming_path, incoming_size, protect=(), device=None):
+        """
+        Evicts least recently used traces from working_dir until pushing a
+        file of incoming_size to incoming_path leaves the configured free space.
+
+        Args:
+            working_dir: Replay working dir on the device
+            incoming_path: Device path the file will be pushed to
+            incoming_size (int): Size of the file in bytes
+            protect: Device paths that must not be evicted, e.g. traces of a running batch
+
+        Returns:
+            list: The evicted paths
+        """
+        min_free = min_free_bytes()
+        if min_free <= 0:
+            return []
+        free = self.free_space(working_dir, device)
+        if free is None:
+            return []
+        traces = self.traces(working_dir, device)
+        sizes = {path: size for _, size, path in traces}
+        incoming_path = str(incoming_path)
+        # Pushing over an existing copy only needs the difference
+        shortfall = incoming_size - sizes.get(incoming_path, 0) + min_free - free
+        if shortfall <= 0:
+            return []
+
+        protected = {str(path) for path in protect} | {incoming_path}
+        evict = []
+        for _, size, path in traces:
+            if shortfall <= 0:
+                break
+            if path not in protected:
+                evict.append(path)
+                shortfall -= size
+        if evict:
+            logger.info(f"Evicting {len(evict)} least recently used traces from {working_dir} "
+                        f"to keep {min_free // (1024 * 1024)} MiB free: {', '.join(evict)}")
+            self.delete(evict, device)
+            self.forget(working_dir, evict, device)
+        if shortfall > 0:
+            logger.warning(f"Device will have {shortfall // (1024 * 1024)} MiB less than the "
+                           f"{min_free // (1024 * 1024)} MiB to keep free after pushing {incoming_path}")
+        return evict
+
+    @staticmethod
+    def __parse_index(content):
+        used = {}
+        for line in content.splitlines():
+            stamp, _, path = line.partition(" ")
+            if stamp.isdigit() and path:
+                used[path] = max(used.get(path, 0), int(stamp))
+        return used
+
+    def forget(self, working_dir, paths, device=None):
+        """Drops deleted files from the index of working_dir"""
+        paths = {str(path) for path in paths}
+        used = self.last_used(working_dir, device)
+        if not paths & set(used):
+            return
+        self.__rewrite_index(working_dir, {path: stamp for path, stamp in used.items() if path not in paths}, device)
+
+    def __rewrite_index(self, working_dir, used, device):
+        index = shlex.quote(f"{working_dir}/{LRU_INDEX_NAME}")
+        lines = "".join(f"{stamp} {path}\n" for path, stamp in sorted(used.items(), key=lambda item: item[1]))
+        self.adb.command_many([['printf', "'%s'", shlex.quote(lines), '>', index]], True, device,
+                              errors_handled_externally=True, print_command=False)
@@ -6,6 +6,11 @@ Is deterministic for the same input data.
 
 Keep this script simple, dont import any scipy modules or other complex
 libs that are not part of the standart python distributions on linux.
+NumPy is fine, it is installed with pandas.
+
+Samples given as lists run through the original pure Python k-means,
+samples given as NumPy arrays through a vectorized one that returns the
+same frames and weights, down to the last bit of every float.
 """
 
 import argparse
@@ -15,6 +20,7 @@ import math
 from copy import deepcopy
 import random
 
+import numpy
 import pandas
 
 from adblib import print_codes
@@ -24,6 +30,12 @@ logger = setup_logger("frame_selection")
 
 GPU_ACTIVE_SAMPLE_INDEX = 0
 LARGE_NUMBER = 99999999999999999999999999999
+# Set to 'python' to run select_frames on lists with the pure Python k-means
+FRAME_SELECTION_ENGINE_ENV = "TRACEUI_FRAME_SELECTION_ENGINE"
+
+
+def frame_selection_engine():
+    return os.environ.get(FRAME_SELECTION_ENGINE_ENV, "numpy")
 
 
 def parse_args():
@@ -70,9 +82,11 @@ def process_hwc(csv_file):
 
     data_filtered = data[frame_selection_columns]
 
-    return data_filtered.values.tolist()
+    return data_filtered.to_numpy(dtype=float)
 
 def normalize_samples(samples):
+    if isinstance(samples, numpy.ndarray):
+        return _normalize_samples_numpy(samples)
     sample_size = len(samples[0])
     num_samples = len(samples)
 
@@ -99,9 +113,24 @@ def normalize_samples(samples):
     return normalized_samples
 
 
+def _normalize_samples_numpy(samples):
+    # fmax/fmin skip NaN like the comparisons in the loop above
+    sample_maxes = numpy.fmax.reduce(samples, axis=0, initial=-LARGE_NUMBER)
+    sample_mins = numpy.fmin.reduce(samples, axis=0, initial=LARGE_NUMBER)
+    value_ranges = sample_maxes - sample_mins
+    with numpy.errstate(invalid="ignore"):
+        has_range = value_ranges > 0.0
+    normalized_samples = numpy.zeros(samples.shape)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        normalized_samples[:, has_range] = (samples[:, has_range] - sample_mins[has_range]) / value_ranges[has_range]
+    return normalized_samples
+
+
 # Main entry point
 def select_frames(per_frame_hwc_data, frame_range_start=0, frame_range_end=LARGE_NUMBER, number_of_frames=1):
     frame_vector_samples = process_hwc(per_frame_hwc_data)
+    if frame_selection_engine() == "python":
+        frame_vector_samples = frame_vector_samples.tolist()
 
     if not len(frame_vector_samples):
         logger.error(f"Input sample CSV is empty, cant select any frames.")
@@ -144,7 +173,33 @@ def calc_distance(v1, v2):
     return math.sqrt(summed)
 
 
+def _calc_distances(columns, center):
+    """
+    calc_distance of every sample to one center, with the samples given as
+    one array per feature. Sums the features in the same order as
+    calc_distance, so the result is bit for bit the same.
+    """
+    summed = numpy.zeros(columns.shape[1])
+    for feature, column in enumerate(columns):
+        diff = column - center[feature]
+        summed += diff * diff
+    return numpy.sqrt(summed)
+
+
+def _sequential_sum(values):
+    """Sums rows in order like repeated calc_sum, numpy.sum would add them pairwise"""
+    return numpy.add.accumulate(values, axis=0)[-1]
+
+
+def _first_appearance_order(labels):
+    """Distinct labels in the order they first appear, like the dicts keyed by cluster"""
+    distinct, first_index = numpy.unique(labels, return_index=True)
+    return [int(label) for label in distinct[numpy.argsort(first_index)]]
+
+
 def run_k_means(initial_cluster_centers, samples, num_runs=1, tolerance=0.001, max_iterations=1000):
+    if isinstance(samples, numpy.ndarray):
+        return _run_k_means_numpy(initial_cluster_centers, samples, tolerance, max_iterations)
     sample_clusters = [-1 for _ in range(len(samples))]
     cluster_centers = deepcopy(initial_cluster_centers)
 
@@ -194,10 +249,51 @@ def run_k_means(initial_cluster_centers, samples, num_runs=1, tolerance=0.001, m
     return sample_clusters, cluster_centers
 
 
-def pick_frames(num_frames, samples, raw_samples, frame_range_start):
-    # samples = samples[0:3]
-    # raw_samples = raw_samples[0:3]
-    num_clusters = num_frames
+def _run_k_means_numpy(initial_cluster_centers, samples, tolerance, max_iterations):
+    """Vectorized run_k_means, returns the sample clusters and the centers as arrays"""
+    sample_clusters = numpy.full(len(samples), -1)
+    cluster_centers = numpy.array(initial_cluster_centers, dtype=float)
+    # Contiguous feature columns, reading a column of the sample rows is strided
+    columns = numpy.ascontiguousarray(samples.T)
+
+    iteration = 0
+    done = False
+    while not done:
+        logger.debug(f"Running KMeans iteration {iteration} with {len(cluster_centers)} clusters.")
+
+        done = True
+
+        # One row of distances per cluster
+        dists = numpy.stack([_calc_distances(columns, cluster) for cluster in cluster_centers])
+        # A NaN distance never beats the running minimum, a sample without any
+        # usable distance keeps its cluster from the previous iteration
+        with numpy.errstate(invalid="ignore"):
+            usable = dists < LARGE_NUMBER
+        dists[~usable] = numpy.inf
+        assigned = usable.any(axis=0)
+        sample_clusters[assigned] = numpy.argmin(dists[:, assigned], axis=0)
+
+        for cluster_index in _first_appearance_order(sample_clusters):
+            members = samples[sample_clusters == cluster_index]
+            new_cluster = _sequential_sum(members) / float(len(members))
+            cluster_improvement = _calc_distances(new_cluster[:, numpy.newaxis], cluster_centers[cluster_index])[0]
+
+            if cluster_improvement > tolerance:
+                done = False
+                cluster_centers[cluster_index] = new_cluster
+
+        iteration += 1
+
+        if iteration > max_iterations:
+            logger.warning(f"KMeans reached the maximum number of iterations which was {max_iterations}, selected frames may not be great!")
+            done = True
+
+    logger.debug(f"Finished KMeans after {iteration} iterations.")
+
+    return sample_clusters, cluster_centers
+
+
+def _initial_cluster_centers(num_clusters, samples):
     sample_size = len(samples[0])
     num_samples = len(samples)
 
@@ -216,6 +312,18 @@ def pick_frames(num_frames, samples, raw_samples, frame_range_start):
         for cluster_index in range(num_clusters):
             cluster_centers.append(deepcopy(samples[step_init + cluster_index * step_size]))
 
+    return cluster_centers
+
+
+def pick_frames(num_frames, samples, raw_samples, frame_range_start):
+    if isinstance(samples, numpy.ndarray):
+        return _pick_frames_numpy(num_frames, samples, numpy.asarray(raw_samples, dtype=float), frame_range_start)
+    # samples = samples[0:3]
+    # raw_samples = raw_samples[0:3]
+    num_samples = len(samples)
+
+    cluster_centers = _initial_cluster_centers(num_frames, samples)
+
     sample_cluster_indices, cluster_centers = run_k_means(cluster_centers, samples)
 
     cluster_best_sample_meta = {}
@@ -270,6 +378,53 @@ def pick_frames(num_frames, samples, raw_samples, frame_range_start):
     ]
 
 
+def _pick_frames_numpy(num_frames, samples, raw_samples, frame_range_start):
+    """Vectorized pick_frames, the selected frames and weights match the list version exactly"""
+    num_samples = len(samples)
+
+    cluster_centers = _initial_cluster_centers(num_frames, samples)
+
+    sample_cluster_indices, cluster_centers = run_k_means(cluster_centers, samples)
+
+    gpu_active = raw_samples[:, GPU_ACTIVE_SAMPLE_INDEX]
+    counted = gpu_active != 0
+
+    selected_frames = []
+    for cluster_index in _first_appearance_order(sample_cluster_indices):
+        in_cluster = numpy.flatnonzero((sample_cluster_indices == cluster_index) & counted)
+        num_frames_in_cluster = len(in_cluster)
+        if num_frames_in_cluster == 0:
+            continue
+
+        dist_to_center = _calc_distances(samples[in_cluster].T, cluster_centers[cluster_index])
+        with numpy.errstate(invalid="ignore"):
+            usable = numpy.flatnonzero(dist_to_center < LARGE_NUMBER)
+        if len(usable) == 0:
+            continue
+        # argmin picks the first of equal distances, like the strict < in the list version
+        best_sample_index = int(in_cluster[usable[numpy.argmin(dist_to_center[usable])]])
+
+        # Default weight is just the proportion of frames in this cluster
+        raw_weight = num_frames_in_cluster / num_samples
+        cluster_gpu_active = gpu_active[in_cluster]
+        real_mean = float(_sequential_sum(cluster_gpu_active)) / num_frames_in_cluster
+        stereotype_mean = float(gpu_active[best_sample_index])
+        # Corrected mean takes into account how far the selected frame is from the cluster mean
+        fixed_rate_weight = (real_mean / stereotype_mean) * raw_weight
+
+        real_mean = float(_sequential_sum(1.0 / cluster_gpu_active)) / num_frames_in_cluster
+        fixed_time_weight = real_mean * stereotype_mean * raw_weight
+
+        selected_frames.append({
+            "frame": best_sample_index + frame_range_start,
+            "fixed_rate_weight": fixed_rate_weight,
+            "fixed_time_weight": fixed_time_weight,
+            "num_frames_in_cluster": num_frames_in_cluster
+        })
+
+    return selected_frames
+
+
 if __name__ == "__main__":
     ARGS = parse_args()
 
@@ -0,0 +1,81 @@
+import os
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("layer_deployment")
+
+
+class LayerDeployment(object):
+    """
+    Keeps the capture and replay layers on the devices up to date.
+
+    Remembers per device which build (sha256) of a layer was deployed at
+    which path, so deploying the same layer again costs one root command
+    batch that reapplies the permissions and checks the file is still there,
+    instead of a push followed by chmod, chown and ls calls. Copies of the
+    layer left in the other directories the loader could pick it up from are
+    removed in the same batch.
+    """
+
+    def __init__(self, adb):
+        self.adb = adb
+        self.records = {}  # device -> {remote path: sha256 of the deployed build}
+
+    def deploy(self, local_path, device_dir, mode="755", owner="system:system", stale_dirs=(), device=None):
+        """
+        Makes sure device_dir holds the local build of a layer.
+
+        Args:
+            local_path: Layer .so on the host
+            device_dir: Directory on the device to deploy it to
+            mode (str): chmod mode of the deployed layer
+            owner (str): chown owner of the deployed layer
+            stale_dirs: Other directories where a copy of the layer must not linger
+            device (str): Device name, if None adblib device will be used
+
+        Returns:
+            str: Path of the layer on the device
+
+        Raises:
+            FileNotFoundError: If the layer is not on the device after pushing it
+        """
+        device = device or self.adb.device
+        local_path = str(local_path)
+        name = os.path.basename(local_path)
+        remote_path = f"{device_dir}/{name}"
+        local_hash = self.adb.local_sha256(local_path)
+        stale = [f"{d}/{name}" for d in stale_dirs if str(d) != str(device_dir)]
+        records = self.records.setdefault(device, {})
+
+        if records.get(remote_path) == local_hash:
+            if self.__finish(remote_path, mode, owner, stale, device):
+                logger.debug(f"Layer {name} is already deployed at {remote_path} on device {device}")
+                return remote_path
+            logger.info(f"Layer {remote_path} changed on device {device}, deploying it again")
+            del records[remote_path]
+
+        logger.debug(f"Pushing layer: {local_path} to {device_dir}")
+        if not self.adb.push(local_path, str(device_dir), device=device, dedup=True):
+            raise FileNotFoundError(f"Failed to push layer {local_path} to {device_dir}")
+        if not self.__finish(remote_path, mode, owner, stale, device):
+            raise FileNotFoundError(f"Layer not found on device in {device_dir}")
+        records[remote_path] = local_hash
+        for path in stale:
+            records.pop(path, None)
+        return remote_path
+
+    def forget(self, paths, device=None):
+        """Drops the records of files that were removed from the device"""
+        devices = [device] if device else list(self.records)
+        for name in devices:
+            for path in paths:
+                self.records.get(name, {}).pop(str(path), None)
+
+    def __finish(self, remote_path, mode, owner, stale, device):
+        """Removes stale copies, applies permissions and checks the layer is there in one root batch"""
+        results = self.adb.command_many([['rm', '-f', path] for path in stale] + [
+            ['chmod', mode, remote_path],
+            ['chown', owner, remote_path],
+            ['ls', remote_path],
+        ], True, device, errors_handled_externally=True, print_command=False)
+        return bool(results[-1][0])
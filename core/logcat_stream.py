@@ -0,0 +1,90 @@
+import subprocess
+import threading
+import uuid
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("logcat_stream")
+
+MARKER_TAG = "traceui_marker"
+
+
+class LogcatStream(object):
+    """
+    Follows 'adb logcat' of one device in a background thread.
+
+    Every line is fed to matcher.feed(line). When that returns True the line
+    is fatal and the fatal event is set, so a caller waiting on the device
+    can give up right away instead of waiting for the run to end.
+    """
+
+    def __init__(self, device, matcher, filters=None, adb_binary="adb", drain_timeout=2):
+        self.device = device
+        self.matcher = matcher
+        self.filters = filters
+        self.adb_binary = adb_binary
+        self.drain_timeout = drain_timeout
+        self.fatal = threading.Event()
+        self.fatal_line = None
+        self.process = None
+        self._thread = None
+        self._markers = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        cmd = [self.adb_binary, '-s', self.device, 'logcat']
+        if self.filters is not None:
+            # The marker tag lets stop() know when every earlier line was read
+            cmd += ['-s', f"{self.filters},{MARKER_TAG}"]
+        logger.debug("Streaming logcat: " + " ".join(cmd))
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            bufsize=1,
+        )
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the stream once all lines logged so far have been fed to the matcher.
+
+        Returns:
+            The result of matcher.finish()
+        """
+        if self.process is not None:
+            self._drain()
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+            self._thread.join(timeout=self.drain_timeout)
+            self.process = None
+        return self.matcher.finish()
+
+    def _drain(self):
+        marker = uuid.uuid4().hex
+        seen = threading.Event()
+        with self._lock:
+            self._markers[marker] = seen
+        subprocess.run([self.adb_binary, '-s', self.device, 'shell', 'log', '-t', MARKER_TAG, marker],
+                       capture_output=True)
+        if not seen.wait(self.drain_timeout):
+            logger.debug(f"Logcat marker not seen within {self.drain_timeout}s on device {self.device}")
+
+    def _pump(self):
+        for line in iter(self.process.stdout.readline, ''):
+            line = line.rstrip("\n")
+            if MARKER_TAG in line:
+                with self._lock:
+                    for marker, seen in self._markers.items():
+                        if marker in line:
+                            seen.set()
+                continue
+            if self.matcher.feed(line) and not self.fatal.is_set():
+                self.fatal_line = line
+                self.fatal.set()
+                logger.error(f"Fatal line in logcat: {line}")
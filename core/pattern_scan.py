@@ -0,0 +1,48 @@
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class PatternScanner(object):
+    """
+    Finds which of a set of byte patterns occur in a binary stream.
+
+    The stream is read once in fixed-size chunks, with a small overlap so
+    patterns crossing a chunk boundary are still found. Every chunk is
+    searched for each pattern that is still missing with a plain substring
+    search, so memory stays bounded by the chunk size and patterns stop
+    costing time after their first hit.
+    """
+
+    def __init__(self, patterns, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.patterns = set(patterns)
+        self.chunk_size = chunk_size
+
+    def scan(self, stream, done=None):
+        """
+        Scans a readable binary stream.
+
+        Args:
+            stream: File-like object with read(size)
+            done (callable): Called as done(found) whenever new patterns are
+                found, returning True stops the scan before the end of the stream
+
+        Returns:
+            set: The patterns that were found
+        """
+        found = set()
+        missing = set(self.patterns)
+        if not missing:
+            return found
+        overlap = max(len(p) for p in missing) - 1
+        tail = b""
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                return found
+            buffer = tail + chunk
+            hits = {p for p in missing if p in buffer}
+            if hits:
+                found |= hits
+                missing -= hits
+                if not missing or (done and done(found)):
+                    return found
+            tail = buffer[-overlap:] if overlap else b""
@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+
+from core.logger_config import setup_logger
+
+logger = setup_logger("replay_pipeline")
+
+
+class PipelineJob(object):
+    """
+    One item passing through a StagePipeline. Stage functions keep their
+    results in data, error and failed_stage are set when a stage raises.
+    """
+
+    def __init__(self, item, cost=0):
+        self.item = item
+        self.cost = cost
+        self.data = {}
+        self.error = None
+        self.failed_stage = None
+        self.stage_times = {}
+
+
+class StagePipeline(object):
+    """
+    Runs jobs through a fixed sequence of stages with one worker thread per
+    stage, so job N+1 can be in the first stage while job N is in the second
+    and job N-1 in the third. Jobs keep their order in every stage.
+
+    Every job holds its cost from the moment it enters the first stage until
+    it leaves the last one. A new job waits while the costs in flight would
+    exceed capacity, which bounds e.g. the device storage used by traces that
+    were pushed but not replayed and cleaned up yet. A job bigger than the
+    capacity still runs, alone.
+    """
+
+    def __init__(self, stages, capacity=None, on_done=None):
+        """
+        Args:
+            stages: List of (name, function) tuples, function(job) raises on failure
+            capacity: Maximum total cost of the jobs in flight, None for no limit
+            on_done (callable): Called as on_done(job) when a job leaves the
+                pipeline, whether it finished or failed
+        """
+        self.stages = list(stages)
+        self.capacity = capacity
+        self.on_done = on_done
+        self.busy = {name: 0.0 for name, _ in self.stages}
+        self.wall = 0.0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def run(self, jobs):
+        """Runs all jobs and returns them once every stage is done"""
+        queues = [queue.Queue() for _ in self.stages]
+        threads = [threading.Thread(target=self._worker, args=(index, queues), daemon=True)
+                   for index in range(len(self.stages))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for job in jobs:
+            self._admit(job)
+            queues[0].put(job)
+        queues[0].put(None)
+        for thread in threads:
+            thread.join()
+        self.wall = time.perf_counter() - start
+        return jobs
+
+    def utilization(self):
+        """Returns {stage: (busy seconds, fraction of the wall time)}"""
+        return {name: (busy, busy / self.wall if self.wall else 0.0) for name, busy in self.busy.items()}
+
+    def _admit(self, job):
+        with self._cond:
+            while self.capacity is not None and self._in_flight and self._in_flight + job.cost > self.capacity:
+                self._cond.wait()
+            self._in_flight += job.cost
+
+    def _release(self, job):
+        if self.on_done:
+            try:
+                self.on_done(job)
+            except Exception:
+                logger.exception(f"Cleaning up after {job.item} failed")
+        with self._cond:
+            self._in_flight -= job.cost
+            self._cond.notify_all()
+
+    def _worker(self, index, queues):
+        name, function = self.stages[index]
+        last = index == len(self.stages) - 1
+        while True:
+            job = queues[index].get()
+            if job is None:
+                if not last:
+                    queues[index + 1].put(None)
+                return
+            start = time.perf_counter()
+            try:
+                function(job)
+            except Exception as e:
+                job.error = str(e) or e.__class__.__name__
+                job.failed_stage = name
+                logger.error(f"{name} failed for {job.item}: {job.error}")
+            elapsed = time.perf_counter() - start
+            job.stage_times[name] = elapsed
+            self.busy[name] += elapsed
+            if last or job.error is not None:
+                self._release(job)
+            else:
+                queues[index + 1].put(job)
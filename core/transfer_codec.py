@@ -0,0 +1,77 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+# Preferred first. Each codec is also the name of the device-side binary.
+CODECS = ("zstd", "gzip")
+
+
+def host_codecs():
+    """Returns the codecs the host can compress and decompress"""
+    return [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+
+
+class _GzipCompressor(object):
+    def __init__(self):
+        # wbits 31 writes a gzip header, which gzip -d on the device expects
+        self._compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _GzipDecompressor(object):
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(31)
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+class _ZstdCompressor(object):
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _ZstdDecompressor(object):
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+def compressor(codec):
+    return _ZstdCompressor() if codec == "zstd" else _GzipCompressor()
+
+
+def decompressor(codec):
+    return _ZstdDecompressor() if codec == "zstd" else _GzipDecompressor()
+
+
+def device_compress_command(codec, path):
+    """Shell command writing the compressed content of path to stdout"""
+    return f"{codec} -1 -c {path}"
+
+
+def device_decompress_command(codec, path):
+    """Shell command decompressing stdin into path"""
+    return f"{codec} -d -c > {path}"
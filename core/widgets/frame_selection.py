@@ -377,7 +377,8 @@ class UiFrameSelectionWidget(PageNavigation):
             adb=self.replay_widget.adb,
             file=self.replay_widget.currentTrace,
             path=desired_output_dir,
-            action="pull")
+            action="pull",
+            resumable=True)
         self.location_label.setText(
             f"Location of trace and selected frame information: {os.getcwd()}/{desired_output_dir}")
         logger.info("Frame selection is completed.")
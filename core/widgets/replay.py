@@ -8,6 +8,7 @@ import json
 from pathlib import Path
 import time
 import subprocess
+import threading
 
 from core.logger_config import setup_logger
 
@@ -29,6 +30,7 @@ class ReplayWorker(QObject):
         self.adb = adb
         self.process = process
         self._killed = False
+        self._stop_event = threading.Event()
         self.filename = filename
         self.cmd = cmd
         self.screenshot = screenshot
@@ -40,6 +42,7 @@ class ReplayWorker(QObject):
 
     def stop(self):
         self._killed = True
+        self._stop_event.set()
 
     def start_replay(self):
         self.replay_started.emit(True)
@@ -53,11 +56,8 @@ class ReplayWorker(QObject):
             logger.debug(f"Replaying with command: {self.cmd}")
         time.sleep(0.1)
 
-        stdout, _ = self.adb.command([f"ps -A | grep {self.process}"])
         logger.info("Replay still ongoing.")
-        while f'{self.process}' in stdout:
-            time.sleep(0.5)
-            stdout, _ = self.adb.command([f"ps -A | grep {self.process}"], print_command=False)
+        self.adb.wait_for_process_exit(self.process, stop_event=self._stop_event)
         if not self._killed:
             self.done_replaying.emit(True)
         else:
@@ -152,8 +152,7 @@ class ReplayWorker(QObject):
     def pullPictures(self):
         self.pull_pictures.emit(True)
         if self.local_dir and self.results.get('screenshot_path'):
-            for image in self.results.get('screenshot_path'):
-                self.adb.pull(image, self.local_dir)
+            self.adb.pull_many(self.results.get('screenshot_path'), self.local_dir)
         self.finished.emit(True)
 
 
@@ -10,6 +10,7 @@ from PySide6.QtWidgets import QApplication, QLabel, QVBoxLayout, QWidget, QHBoxL
 from shiboken6 import isValid
 from core.page_navigation import PageNavigation, PageIndex
 from core.adb_thread import AdbThread
+from core.capture_tail import capture_streaming_enabled
 from adblib import print_codes
 
 from core.logger_config import setup_logger
@@ -138,6 +139,7 @@ class UiTraceWidget(PageNavigation):
         self.app_start_widget = None
         self.start_application_button = None
         self.adbWorker = None
+        self.capture_tail = None
         self.adbThread = None
         self._trace_stop_worker = None
         self._trace_stop_thread = None
@@ -153,6 +155,11 @@ class UiTraceWidget(PageNavigation):
         if self._is_qt_object_valid(self.adbWorker):
             self.adbWorker.stop()
 
+    def _stop_capture_tail(self):
+        if self.capture_tail is not None:
+            self.capture_tail.stop()
+            self.capture_tail = None
+
     def _reset_trace_stop_state(self):
         self._trace_stop_worker = None
         self._trace_stop_thread = None
@@ -436,6 +443,7 @@ class UiTraceWidget(PageNavigation):
         """
         self.currentAppStarted = False
         self._stop_adb_worker()
+        self._stop_capture_tail()
         self.nestedStack.setCurrentIndex(PAGE_APP_SELECTION)
         self.adb.clear_logcat()
         self.button_list = None
@@ -693,8 +701,12 @@ class UiTraceWidget(PageNavigation):
 
             self.plugins[self.currentTool].adb = self.adb
             # Set up device and start prosess
+            self._stop_capture_tail()
             self.plugins[self.currentTool].trace_setup_device(self.currentApp)
             logger.debug(f"Device was set up for tracing '{self.currentApp}' using '{self.currentTool}")
+            if capture_streaming_enabled():
+                # Downloads of the trace to tmp/ resume from what was copied while tracing
+                self.capture_tail = self.adb.open_capture_tail(self.plugins[self.currentTool].capture_file_fullpath, "tmp")
             if self.currentTool == "gfxreconstruct" and self.manual_tracing:
                 # set prop "capture_android_trigger" based on tickbox
                 self.adb.setprop('debug.gfxrecon.capture_android_trigger', 'false')
@@ -816,6 +828,7 @@ class UiTraceWidget(PageNavigation):
             track=track,
             action=action,
             on_cancel=lambda: None,
+            resumable=action == "pull",
         )
         return cancelled, success
 
@@ -833,6 +846,7 @@ class UiTraceWidget(PageNavigation):
         if self.currentTool == "gfxreconstruct":
             self.adb.setprop('debug.gfxrecon.capture_android_trigger', '')
         self._stop_adb_worker()
+        self._stop_capture_tail()
         if self.plugins[self.currentTool].trace_setup_check(self.currentApp) and self.currentAppStarted:
             self.updatePage()
             QApplication.processEvents()
@@ -1161,6 +1175,7 @@ class UiTraceWidget(PageNavigation):
             path="tmp",
             action="pull",
             on_cancel=lambda: None,
+            resumable=True,
         )
         if cancelled or not success:
             downloading_label.clear()
@@ -321,6 +321,7 @@ class MainWindow(QMainWindow):
             trace_exists_on_device = False
 
         if (not trace_exists_on_device) or self.widget_import.override_trace_if_existing:
+            self.adb.storage.make_room(target_path, target_path / self.currentTrace.name, self.currentTrace.stat().st_size)
             self.helper_thread = AdbThread()
             cancelled, success = self.helper_thread.run_with_progress(
                 parent=self,
@@ -345,6 +346,7 @@ class MainWindow(QMainWindow):
             return
 
         self.currentTrace = target_path / os.path.basename(self.currentTrace)
+        self.adb.storage.record_use(target_path, [self.currentTrace])
         logger.info(f"Trace path on device is: {self.currentTrace}")
 
         self.stacked.setCurrentIndex(PageIndex.REPLAY)
@@ -420,27 +420,30 @@ class tracetool(object):
         self.adb.reset_props_by_grep('debug.gfxrecon')
 
         # chack that the package/app exists
-        device_layer_path = self.__get_device_package_layer_path(app)
-
-        self.adb.command(['setenforce', '0'], True)
-        self.adb.command(['settings', 'put', 'global',
-                         'enable_gpu_debug_layers', '1'])
-        self.adb.command(['settings', 'put', 'global', 'gpu_debug_app', app])
-        self.adb.command(
-            ['settings', 'put', 'global', 'gpu_debug_layers',
-             'VK_LAYER_LUNARG_gfxreconstruct'])
+        device_layer_path, layer_dirs = self.__get_device_package_layer_path(app)
+
+        self.adb.command_many([
+            ['setenforce', '0'],
+            ['mkdir', '-p', self.capture_root_dir],
+            ['chmod', 'o+rw', self.capture_root_dir],
+            ['chcon', 'u:object_r:app_data_file:s0:c512,c768', self.capture_root_dir],
+        ], True)
+        self.adb.command_many([
+            ['settings', 'put', 'global', 'enable_gpu_debug_layers', '1'],
+            ['settings', 'put', 'global', 'gpu_debug_app', app],
+            ['settings', 'put', 'global', 'gpu_debug_layers', 'VK_LAYER_LUNARG_gfxreconstruct'],
+        ])
+        setprops = {}
         for setprop_item in self._iter_trace_setup_setprops():
             if not setprop_item.get("enabled", True):
                 continue
-            self.adb.setprop(setprop_item["prop"], setprop_item["value"])
+            setprops[setprop_item["prop"]] = setprop_item["value"]
         # TODO: Update the capture_file_name when capture_frames is set
 
-        self.adb.command(['mkdir', '-p', self.capture_root_dir], True)
-        self.adb.command(['chmod', 'o+rw', self.capture_root_dir], True)
-        self.adb.command(['chcon', 'u:object_r:app_data_file:s0:c512,c768', self.capture_root_dir], True)
         self.capture_file_name = self.__generate_trace_name(app)
         self.capture_file_fullpath = self.capture_root_dir / self.capture_file_name
-        self.adb.setprop('debug.gfxrecon.capture_file', self.capture_file_fullpath)
+        setprops['debug.gfxrecon.capture_file'] = self.capture_file_fullpath
+        self.adb.setprop_many(setprops)
         logger.info(
             f"GFXReconstruct output trace file to: {self.capture_file_fullpath}")
         self.adb.delete_file(self.capture_file_fullpath)
@@ -448,9 +451,6 @@ class tracetool(object):
         # causes corruptions for UE
         #self.adb.setprop('debug.gfxrecon.page_guard_separate_read', 'false')
 
-        # Retrieve the app "layer path" to put the capture layer in
-        device_layer_path_so = device_layer_path / 'libVkLayer_gfxreconstruct.so'
-
         # Find the layer path
 
         adb_config_abi = self.adb.configs[self.adb.device]['abi']
@@ -467,26 +467,19 @@ class tracetool(object):
             raise Exception(f"Layer not found in {layer_path}")
             # TODO return to previous page and inform user
 
-        # Put the layer at the right package/app
-        self.adb.delete_file(device_layer_path_so)
-        logger.debug(f"Pushing layer: {layer_path} to {device_layer_path}")
-        self.adb.push(str(layer_path), str(device_layer_path))
+        # Put the layer at the right package/app, a copy in the other layer directory would be stale
+        self.adb.layers.deploy(layer_path, device_layer_path, stale_dirs=layer_dirs)
         # (If this fails try putting the layer at this location insted: /data/local/debug/vulkan)
 
-        if not self.adb.command(['ls', device_layer_path], True):
-            raise Exception(f"Layer not found in {device_layer_path}")
-
-        self.adb.command([f'chmod 755 {device_layer_path_so}'], True)
-        self.adb.command([f'chown system:system {device_layer_path_so}'], True)
-
     def trace_reset_device(self):
         """
         Resets the parameters set by tracing/replaying to their original value.
         """
-        self.adb.command(['settings', 'delete', 'global',
-                          'enable_gpu_debug_layers'])
-        self.adb.command(['settings', 'delete', 'global', 'gpu_debug_app'])
-        self.adb.command(['settings', 'delete', 'global', 'gpu_debug_layers'])
+        self.adb.command_many([
+            ['settings', 'delete', 'global', 'enable_gpu_debug_layers'],
+            ['settings', 'delete', 'global', 'gpu_debug_app'],
+            ['settings', 'delete', 'global', 'gpu_debug_layers'],
+        ])
 
         # Remove all costom settings
         self.adb.intermediate_cleanup()
@@ -505,23 +498,23 @@ class tracetool(object):
         Returns:
             bool: True if application is runing and all the nessesary parameters/layers are set
         """
-        result, _ = self.adb.command([f"ps -A | grep {app}"])
-        stdout, _ = self.adb.command([f"pm list package -f | grep {app}"])
-
-        layers_enabled, _ = self.adb.command(
-            ['settings', 'get', 'global', 'enable_gpu_debug_layers'])
-        app_in_debug_prop, _ = self.adb.command(
-            ['settings', 'get', 'global', 'gpu_debug_app'])
-        tracing_layers_enabled, _ = self.adb.command(
-            ['settings', 'get', 'global', 'gpu_debug_layers'])
+        results = self.adb.command_many([
+            [f"ps -A | grep {app}"],
+            [f"pm list package -f | grep {app}"],
+            ['settings', 'get', 'global', 'enable_gpu_debug_layers'],
+            ['settings', 'get', 'global', 'gpu_debug_app'],
+            ['settings', 'get', 'global', 'gpu_debug_layers'],
+            ['getprop', 'debug.gfxrecon.page_guard_align_buffer_sizes'],
+        ])
+        layers_enabled, app_in_debug_prop, tracing_layers_enabled, align_buffer_sizes = [
+            stdout for stdout, _, _ in results[2:]
+        ]
         align_buffer_sizes_enabled = self._is_trace_setup_setprop_enabled(
             'debug.gfxrecon.page_guard_align_buffer_sizes'
         )
         align_buffer_sizes_ok = True
         if align_buffer_sizes_enabled:
-            align_buffer_sizes_ok = (
-                self.adb.getprop('debug.gfxrecon.page_guard_align_buffer_sizes') == 'true'
-            )
+            align_buffer_sizes_ok = align_buffer_sizes == 'true'
         if (layers_enabled == '1' and
             app_in_debug_prop == app and
             'VK_LAYER_LUNARG_gfxreconstruct' in tracing_layers_enabled and
@@ -558,7 +551,7 @@ class tracetool(object):
                 self.adb.command(['mv', stdout, self.capture_file_fullpath])
             self.adb.command(['chmod', 'o+rw', self.capture_file_fullpath], True)
             if self.trace_stop_handle_transfers:
-                self.adb.pull(self.capture_file_fullpath, 'tmp')
+                self.adb.pull(self.capture_file_fullpath, 'tmp', resumable=True)
                 optimized_trace = self.optimize_trace(f"tmp/{self.capture_file_name}")
                 if optimized_trace is not None:
                     self.adb.push(optimized_trace, self.sdcard_working_dir, device=None, track=False)
@@ -567,18 +560,20 @@ class tracetool(object):
 
         return self.capture_file_fullpath
 
-    def optimize_trace(self, trace):
+    def optimize_trace(self, trace, outdir="tmp"):
         """
         Runs gfxrecon-optimize on the tracefile
 
         Args:
             trace (str): Path to trace
+            outdir (str): Local directory to write the optimized trace to
 
         Returns:
             Path: Path to trace on remote device
         """
         logger.info(f"Running optimizer on {trace}")
-        optimized_trace = f"tmp/{Path(trace).stem}.optimized.gfxr"
+        os.makedirs(outdir, exist_ok=True)
+        optimized_trace = str(Path(outdir) / f"{Path(trace).stem}.optimized.gfxr")
         cmd = [str(self.basepath / self.replayer['optimizer']), trace, optimized_trace]
         subprocess.run(" ".join(cmd), shell=True, capture_output=True)
         if Path(optimized_trace).is_file(): # TODO Add more sophisticated error handling reading the output of the optimizer
@@ -599,8 +594,8 @@ class tracetool(object):
         """
         apk_path = self.basepath / self.dirname / self.replayer['apk']
         # by only reinstalling the replayer we don't have to get permissions
-        # manually again
-        self.adb.install(apk_path, device)
+        # manually again, and an identical replayer is not reinstalled at all
+        self.adb.install(apk_path, device, package_name=self.replayer['name'])
         self.adb.manage_app_permissions(self.replayer['name'], device)
         # clear the logcat after setup
         self.adb.clear_logcat()
@@ -694,53 +689,24 @@ class tracetool(object):
         self.adb.command(['appops', 'reset', self.replayer['name']])
         self.trace_reset_device()
 
-    def parse_logcat(self, mode=None, app=None):
+    def logcat_matcher(self, mode=None, app=None):
+        """Returns a LogcatMatcher for the given mode, None if there is nothing to check"""
         if mode is None and app is None:
-            return []
+            return None
         if mode == "replay":
             app = "gfxrecon"
         elif mode == "trace" and app is None:
             raise Exception("Application not specified for tracing")
-        logcat = self.adb.fetch_logcat(device=None, filters="vulkan,gfxrecon")
-        loglines = logcat.splitlines()
-        err_lines = []
-        extension_missing_lines = []
-
-        for line in loglines:
-
-            # Check for potential permission or filesystem issues
-            if "E gfxrecon: fopen(" in line:
-                estring = "WARNING: App may lack write permissions to output folder, check logcat/shell for more info.\n"
-                if estring not in err_lines:
-                    logger.error(f"Found: {line} in logcat, potential source of the error. App may lack write permissions to the output folder.")
-                    err_lines.append(estring)
-
-            if "W gfxrecon: Extension " in line:
-                logger.warning(
-                    f"Extension missing on replay device, replay may fail: {line}")
-                extension_missing_lines.append(line)
-
-            if "File did not contain any frames" in line:
-                frame_error = (
-                    "ERROR: gfxreconstruct reported no frames in the trace file "
-                    "(\"File did not contain any frames\")."
-                )
-                if frame_error not in err_lines:
-                    logger.error(f"Found no-frame trace error in logcat: {line}")
-                    err_lines.append(frame_error)
-
-            if "F gfxrecon: API call at index:" in line:
-                if "VK_ERROR_EXTENSION_NOT_PRESENT" in line:
-                    logger.error(f"API call failed on replay:{line}, due to missing extension. Potential culprits: {extension_missing_lines}")
-                    err_lines.append(
-                        f"ERROR: API call failed on replay:\n{line}, due to missing extension.\nPotential culprits: {extension_missing_lines}\n")
-                else:
-                    logger.error(
-                        f"API call failed on replay: {line}")
-                    err_lines.append(
-                        f"ERROR: API call failed on replay:\n{line}\n")
+        return LogcatMatcher()
 
-        return err_lines
+    def parse_logcat(self, mode=None, app=None):
+        matcher = self.logcat_matcher(mode=mode, app=app)
+        if matcher is None:
+            return []
+        logcat = self.adb.fetch_logcat(device=None, filters=matcher.filters)
+        for line in logcat.splitlines():
+            matcher.feed(line)
+        return matcher.finish()
 
     # Private helper functions
     def __get_device_package_layer_path(self, app):
@@ -751,19 +717,20 @@ class tracetool(object):
             app (str): App package name, e.g. com.example.myapp
 
         Return:
-            Path: pathlib path to package layer path
+            tuple: pathlib path to package layer path, and both candidate layer paths
         """
         device_pkg_path_root = self.adb.get_pkg_path(app)
         if not device_pkg_path_root:
             raise Exception(f"Unable obtain package information for: {app}")
         device_layer_path = Path(device_pkg_path_root) / "lib" / "arm64"
+        layer_dirs = [device_layer_path, self.device_layer_debug_root]
         testfile = f"{device_layer_path}/testfile.txt"
         stdout, _ = self.adb.command(['touch', testfile], run_with_sudo=True,  errors_handled_externally=True)
         if not stdout:
             logger.debug(f"Using debug directory instead")
             device_layer_path = self.device_layer_debug_root
             self.adb.command(['mkdir', '-p', device_layer_path], True)
-        return device_layer_path
+        return device_layer_path, layer_dirs
 
     def __setup_hwcpipe_layer(self):
         """
@@ -776,26 +743,15 @@ class tracetool(object):
         if not os.path.exists(expected_lib_path):
             raise FileNotFoundError(f"HWC layer not found in {expected_lib_path}\nTry running update-artifacts.sh")
 
-        device_layer_path = self.__get_device_package_layer_path(
+        device_layer_path, layer_dirs = self.__get_device_package_layer_path(
             self.replayer['name'])
-        logger.debug(
-            f"Pushing layer {expected_lib_path} to {device_layer_path}")
-        self.adb.push(str(expected_lib_path), str(device_layer_path))
-
-        self.adb.command([f'chmod 755 {device_layer_path}'], True)
-        self.adb.command([f'chown system:system {device_layer_path}'], True)
-
-        stdout, _ = self.adb.command(['ls', device_layer_path], True)
-        if not stdout:
-            raise FileNotFoundError(f"Layer not found on device in {self.replayer['name']}")
+        self.adb.layers.deploy(expected_lib_path, device_layer_path, stale_dirs=layer_dirs)
 
-        self.adb.command(['settings', 'put', 'global',
-                         'enable_gpu_debug_layers', '1'])
-        self.adb.command(
-            ['settings', 'put', 'global', 'gpu_debug_layers',
-             'VK_LAYER_VKL_HWCPIPE'])
-        self.adb.command(['settings', 'put', 'global',
-                         'gpu_debug_app', self.replayer['name']])
+        self.adb.command_many([
+            ['settings', 'put', 'global', 'enable_gpu_debug_layers', '1'],
+            ['settings', 'put', 'global', 'gpu_debug_layers', 'VK_LAYER_VKL_HWCPIPE'],
+            ['settings', 'put', 'global', 'gpu_debug_app', self.replayer['name']],
+        ])
 
     def __generate_trace_name(self, app_name):
         """ creates a file name from package name and hash of current time
@@ -805,6 +761,57 @@ class tracetool(object):
         return f'{app_name.replace(".", "_")}_{time_hash}_capture.gfxr'
 
 
+class LogcatMatcher(object):
+    """
+    Checks gfxreconstruct logcat lines one at a time, so they can be matched
+    from a live logcat stream as well as from a logcat dump.
+    """
+    filters = "vulkan,gfxrecon"
+
+    def __init__(self):
+        self.err_lines = []
+        self.extension_missing_lines = []
+
+    def feed(self, line):
+        """Checks one logcat line, returns True if the replay can not recover from it"""
+        # Check for potential permission or filesystem issues
+        if "E gfxrecon: fopen(" in line:
+            estring = "WARNING: App may lack write permissions to output folder, check logcat/shell for more info.\n"
+            if estring not in self.err_lines:
+                logger.error(f"Found: {line} in logcat, potential source of the error. App may lack write permissions to the output folder.")
+                self.err_lines.append(estring)
+
+        if "W gfxrecon: Extension " in line:
+            logger.warning(
+                f"Extension missing on replay device, replay may fail: {line}")
+            self.extension_missing_lines.append(line)
+
+        if "File did not contain any frames" in line:
+            frame_error = (
+                "ERROR: gfxreconstruct reported no frames in the trace file "
+                "(\"File did not contain any frames\")."
+            )
+            if frame_error not in self.err_lines:
+                logger.error(f"Found no-frame trace error in logcat: {line}")
+                self.err_lines.append(frame_error)
+
+        if "F gfxrecon: API call at index:" in line:
+            if "VK_ERROR_EXTENSION_NOT_PRESENT" in line:
+                logger.error(f"API call failed on replay:{line}, due to missing extension. Potential culprits: {self.extension_missing_lines}")
+                self.err_lines.append(
+                    f"ERROR: API call failed on replay:\n{line}, due to missing extension.\nPotential culprits: {self.extension_missing_lines}\n")
+            else:
+                logger.error(
+                    f"API call failed on replay: {line}")
+                self.err_lines.append(
+                    f"ERROR: API call failed on replay:\n{line}\n")
+            return True
+        return False
+
+    def finish(self):
+        return self.err_lines
+
+
 if __name__ == '__main__':
     a = adblib.adb()
     g = tracetool(a)
@@ -124,16 +124,16 @@ class tracetool(object):
         assert self.adb.device, 'No device selected'
         # Check and cleanup previous caputre file
         self.capture_app_dir = self.capture_root_dir / app
-        self.adb.command(['mkdir', '-p', self.capture_app_dir], True)
-        self.adb.command(['chmod', 'o+rw', self.capture_app_dir], True)
-        self.adb.command(
-            ['chcon', 'u:object_r:app_data_file:s0:c512,c768', self.capture_app_dir], True)
+        self.adb.command_many([
+            ['setenforce', '0'],
+            ['mkdir', '-p', self.capture_app_dir],
+            ['chmod', 'o+rw', self.capture_app_dir],
+            ['chcon', 'u:object_r:app_data_file:s0:c512,c768', self.capture_app_dir],
+        ], True)
         self.capture_file_fullpath = self.capture_root_dir / \
             app / (app + ".1.pat")
         self.adb.delete_file(self.capture_file_fullpath)
 
-        # Retrieve the app "layer path" to put the capture layer in
-        device_layer_root_so = self.device_layer_root / self.layer_filename
         # Find the layer path
         adb_config_abi = self.adb.configs[self.adb.device]['abi']
         if len(adb_config_abi.split(",")) == 0:
@@ -147,33 +147,25 @@ class tracetool(object):
             logger.critical(f"Trace layer not found on local device")
             raise Exception(f"Layer not found in {layer_path}")
 
-        # Put the layer on device
-        self.adb.command(['mkdir', '-p', self.device_layer_root], True)
-        logger.debug(
-            f"Pushing layer: {layer_path} to {self.device_layer_root}")
-        self.adb.push(str(layer_path), str(self.device_layer_root))
-        if not self.adb.command(['ls', self.device_layer_root], True):
-            raise Exception(f"Layer not found in {self.device_layer_root}")
-        self.adb.command([f'chmod 777 {device_layer_root_so}'], True)
-        self.adb.command([f'chown system:system {device_layer_root_so}'], True)
+        # Put the layer on device, push creates the layer directory
+        self.adb.layers.deploy(layer_path, self.device_layer_root, mode="777")
 
         # setup patrace
-        self.adb.command(['setenforce', '0'], True)
-        self.adb.command(['settings', 'put', 'global',
-                         'enable_gpu_debug_layers', '1'])
-        self.adb.command(['settings', 'put', 'global', 'gpu_debug_app', app])
-        self.adb.command(['settings', 'put', 'global',
-                         'gpu_debug_layers_gles', self.layer_filename])
+        self.adb.command_many([
+            ['settings', 'put', 'global', 'enable_gpu_debug_layers', '1'],
+            ['settings', 'put', 'global', 'gpu_debug_app', app],
+            ['settings', 'put', 'global', 'gpu_debug_layers_gles', self.layer_filename],
+        ])
 
     def trace_reset_device(self):
         """
         Resets the parameters set by tracing/replaying to their original value.
         """
-        self.adb.command(['settings', 'delete', 'global',
-                          'enable_gpu_debug_layers'])
-        self.adb.command(['settings', 'delete', 'global', 'gpu_debug_app'])
-        self.adb.command(
-            ['settings', 'delete', 'global', 'gpu_debug_layers_gles'])
+        self.adb.command_many([
+            ['settings', 'delete', 'global', 'enable_gpu_debug_layers'],
+            ['settings', 'delete', 'global', 'gpu_debug_app'],
+            ['settings', 'delete', 'global', 'gpu_debug_layers_gles'],
+        ])
 
         # Remove all custom settings
         self.adb.intermediate_cleanup()
@@ -191,16 +183,17 @@ class tracetool(object):
         Returns:
             bool: True if application is runing and all the nessesary parameters/layers are set
         """
-        result, _ = self.adb.command([f"ps -A | grep {app}"])
         device_layer_path = self.device_layer_root / self.layer_filename
-        layer_found, _ = self.adb.command(
-            [f"if [ -f {device_layer_path} ]; then echo true; else echo false; fi"])
-        layers_enabled, _ = self.adb.command(
-            ['settings', 'get', 'global', 'enable_gpu_debug_layers'])
-        app_in_debug_prop, _ = self.adb.command(
-            ['settings', 'get', 'global', 'gpu_debug_app'])
-        tracing_layers_enabled, _ = self.adb.command(
-            ['settings', 'get', 'global', 'gpu_debug_layers_gles'])
+        results = self.adb.command_many([
+            [f"ps -A | grep {app}"],
+            [f"if [ -f {device_layer_path} ]; then echo true; else echo false; fi"],
+            ['settings', 'get', 'global', 'enable_gpu_debug_layers'],
+            ['settings', 'get', 'global', 'gpu_debug_app'],
+            ['settings', 'get', 'global', 'gpu_debug_layers_gles'],
+        ])
+        layer_found, layers_enabled, app_in_debug_prop, tracing_layers_enabled = [
+            stdout for stdout, _, _ in results[1:]
+        ]
         if (layer_found == 'true' and layers_enabled == '1' and app_in_debug_prop ==
                 app and self.layer_filename in tracing_layers_enabled):
             logger.debug(f"Attempted tracing for:  '{app}'")
@@ -238,8 +231,8 @@ class tracetool(object):
         """
         apk_path = self.basepath / self.dirname / self.replayer['apk']
         # by only reinstalling the replayer we don't have to get permissions
-        # manually again
-        self.adb.install(apk_path, device)
+        # manually again, and an identical replayer is not reinstalled at all
+        self.adb.install(apk_path, device, package_name=self.replayer['name'])
         self.adb.manage_app_permissions(self.replayer['name'], device)
         # clear the logcat after setup
 
@@ -304,44 +297,68 @@ class tracetool(object):
     def replay_reset_device(self):
         self.trace_reset_device()
 
-    def parse_logcat(self, mode=None, app=None):  # return None when done
+    def logcat_matcher(self, mode=None, app=None):
+        """Returns a LogcatMatcher for the given mode, None if there is nothing to check"""
         filter = "patrace"
         if mode is None and app is None:
-            return []
+            return None
         if mode == "replay":
             app = "paretrace"
             filter = "paretrace64"
         if mode == "trace" and app is None:
             raise Exception("Application not specified for tracing")
-        logcat = self.adb.fetch_logcat(device=None, filters=filter)
-        loglines = logcat.splitlines()
-
-        err_lines = []
-        found_app = False
-
-        for line in loglines:
-            if app in line:
-                found_app = True
-
-            # Check for potential permission or filesystem issues
-            if "Warning:" in line:
-                logger.warning(f"{line}")
-                err_lines.append(line)
+        return LogcatMatcher(app, filter)
 
-            if "Never rendered anything" in line:
-                logger.warning(f"Unusable tracefile: {line}")
-                err_lines.append(line)
-
-            if "Failed to open" in line and "output JSON" not in line:
-                logger.warning(f"File not accessible : {line}")
-                err_lines.append(line)
-
-        if not found_app:
+    def parse_logcat(self, mode=None, app=None):  # return None when done
+        matcher = self.logcat_matcher(mode=mode, app=app)
+        if matcher is None:
+            return []
+        logcat = self.adb.fetch_logcat(device=None, filters=matcher.filters)
+        for line in logcat.splitlines():
+            matcher.feed(line)
+        return matcher.finish()
+
+
+class LogcatMatcher(object):
+    """
+    Checks patrace logcat lines one at a time, so they can be matched from a
+    live logcat stream as well as from a logcat dump.
+    """
+
+    def __init__(self, app, filters):
+        self.app = app
+        self.filters = filters
+        self.err_lines = []
+        self.found_app = False
+
+    def feed(self, line):
+        """Checks one logcat line, returns True if the replay can not recover from it"""
+        fatal = False
+        if self.app in line:
+            self.found_app = True
+
+        # Check for potential permission or filesystem issues
+        if "Warning:" in line:
+            logger.warning(f"{line}")
+            self.err_lines.append(line)
+
+        if "Never rendered anything" in line:
+            logger.warning(f"Unusable tracefile: {line}")
+            self.err_lines.append(line)
+            fatal = True
+
+        if "Failed to open" in line and "output JSON" not in line:
+            logger.warning(f"File not accessible : {line}")
+            self.err_lines.append(line)
+        return fatal
+
+    def finish(self):
+        err_lines = list(self.err_lines)
+        if not self.found_app:
             logger.warning(
-                f"Found no mention of the target app: {app} in the logcat output, app may not have been started.")
+                f"Found no mention of the target app: {self.app} in the logcat output, app may not have been started.")
             err_lines.append(
-                f"WARNING: Found no mention of the target app: {app} in the logcat output, app may not have been started.\n")
-
+                f"WARNING: Found no mention of the target app: {self.app} in the logcat output, app may not have been started.\n")
         return err_lines
 
 
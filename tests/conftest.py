@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+# The plugins import each other as top level modules, like traceui_cli sets them up
+for path in (REPO_ROOT, REPO_ROOT / "plugins"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
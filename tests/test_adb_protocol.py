@@ -0,0 +1,35 @@
+import pytest
+
+from benchmarks.fake_adb_server import DEFAULT_FEATURES, FakeAdbServer
+from benchmarks.fake_device import FAKE_SERIAL, FakeDevice
+from core.adb_protocol import AdbServerClient
+
+# Larger than the 32 bit size field of the v1 sync replies
+BIG_SIZE = 2 ** 32 + 12345
+
+
+@pytest.fixture(params=["v2", "v1"])
+def server(request):
+    fake = FakeDevice()
+    features = DEFAULT_FEATURES if request.param == "v2" else ("shell_v2", "cmd")
+    server = FakeAdbServer(fake, features=features)
+    # Without stat_v2 the client asks the shell, let stat reach the sandbox filesystem
+    with open(fake.root / "device.rc", "a") as rc:
+        rc.write("unset -f stat\n")
+    (server.fs_root / "sdcard").mkdir()
+    with open(server.fs_root / "sdcard" / "big.gfxr", "wb") as big:
+        big.truncate(BIG_SIZE)  # sparse, takes no disk space
+    (server.fs_root / "sdcard" / "small.gfxr").write_bytes(b"x" * 10)
+    server.start()
+    yield server
+    server.stop()
+    fake.cleanup()
+
+
+def test_stat_size_above_4gib(server):
+    client = AdbServerClient(port=server.port)
+    assert client.stat(FAKE_SERIAL, "sdcard/big.gfxr")[1] == BIG_SIZE
+    assert client.stat(FAKE_SERIAL, "sdcard/small.gfxr")[1] == 10
+    assert client.stat(FAKE_SERIAL, "sdcard/missing.gfxr") is None
+    client.close()
+
@@ -0,0 +1,109 @@
+import argparse
+import os
+import threading
+import time
+
+import pytest
+
+import adblib
+import traceui_cli
+from benchmarks.fake_device import FakeDevice
+from core.device_lease import LEASE_DIR_ENV, LeaseManager, LeaseTimeout, match_devices, parse_requirements
+
+
+@pytest.fixture
+def lease_dir(tmp_path, monkeypatch):
+    path = tmp_path / "leases"
+    monkeypatch.setenv(LEASE_DIR_ENV, str(path))
+    return str(path)
+
+
+def test_second_manager_waits_for_a_held_device(lease_dir):
+    first = LeaseManager(lease_dir, poll_interval=0.02)
+    second = LeaseManager(lease_dir, poll_interval=0.02)
+    lease = first.try_acquire("s1", "first job")
+    assert lease is not None
+    assert second.try_acquire("s1", "second job") is None
+    with pytest.raises(LeaseTimeout):
+        second.acquire(["s1"], "second job", timeout=0.1)
+    assert second.holders(["s1"])["s1"]["job"] == "first job"
+    lease.release()
+    with second.acquire(["s1"], "second job", timeout=1) as taken:
+        assert taken.device == "s1"
+    assert first.usage(["s1"])["s1"][0] == 2
+
+
+def test_expired_lease_is_reclaimed(lease_dir):
+    first = LeaseManager(lease_dir)
+    second = LeaseManager(lease_dir)
+    assert first.try_acquire("s1", "capture", ttl=0.1) is not None
+    assert second.try_acquire("s1") is None
+    time.sleep(0.2)
+    lease = second.try_acquire("s1")
+    assert lease is not None
+    # The expired holder must not be able to release the new lease
+    assert not first.release("s1", "stale token")
+    assert second.holders(["s1"])["s1"]["token"] == lease.token
+
+
+def test_waiters_get_the_device_in_ticket_order(lease_dir):
+    manager = LeaseManager(lease_dir, poll_interval=0.02)
+    holder = manager.try_acquire("s1", "holder")
+    order = []
+
+    def wait(name):
+        with LeaseManager(lease_dir, poll_interval=0.02).acquire(["s1"], name, timeout=5):
+            order.append(name)
+            time.sleep(0.05)
+
+    queue = os.path.join(lease_dir, "queue")
+    threads = []
+    for name in ("older", "newer"):
+        thread = threading.Thread(target=wait, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # The next waiter only starts once this one holds its ticket
+        deadline = time.monotonic() + 5
+        while len(os.listdir(queue)) < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    holder.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["older", "newer"]
+
+
+def test_requirements_filter_devices():
+    configs = {
+        "p1": {"model": "Pixel 8", "gpu": "mali", "abi": "arm64-v8a,armeabi-v7a"},
+        "p2": {"model": "Galaxy", "gpu": "adreno", "abi": "arm64-v8a"},
+    }
+    assert match_devices(configs, parse_requirements(["gpu=MALI"])) == ["p1"]
+    assert match_devices(configs, parse_requirements(["abi=armeabi-v7a"])) == ["p1"]
+    assert match_devices(configs, parse_requirements(["abi=arm64-v8a", "gpu=adreno"])) == ["p2"]
+    assert match_devices(configs, parse_requirements(["soc=unknown"])) == []
+    with pytest.raises(ValueError):
+        parse_requirements(["gpu"])
+
+
+@pytest.fixture
+def fleet(lease_dir, monkeypatch):
+    fake = FakeDevice(fleet={"p1": {"gpu": "mali"}, "p2": {"gpu": "adreno"}})
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    yield fake
+    fake.cleanup()
+
+
+def test_require_picks_a_matching_device(fleet):
+    args = argparse.Namespace(device=None, require=["gpu=adreno"])
+    adb, lease = traceui_cli.init_leased_adb(args, "replay")
+    with lease:
+        assert lease.device == adb.device == "p2"
+        # The only matching device is taken, the next job has to wait
+        with pytest.raises(LeaseTimeout):
+            LeaseManager().acquire(["p2"], timeout=0.1)
+
+
+def test_several_devices_without_device_or_require_fail(fleet):
+    args = argparse.Namespace(device=None, require=None)
+    with pytest.raises(traceui_cli.CLIError, match="Multiple devices connected"):
+        traceui_cli.init_leased_adb(args, "replay")
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+import pytest
+
+import adblib
+from benchmarks.fake_adb_server import FakeAdbServer
+from benchmarks.fake_device import FAKE_SERIAL, FakeDevice
+
+HANG = "sleep 7.25"  # distinct, so the test can find leftover processes
+
+
+def _running(cmdline):
+    """Returns True if a process with this command line is running"""
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if f.read().replace(b"\0", b" ").strip() == cmdline.encode():
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    fake = FakeDevice(fleet={"ok0": {}, "hung0": {}})
+    with open(fake.root / "hung0.rc", "a") as rc:
+        rc.write(f"getprop() {{ {HANG}; }}\n")
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    yield fake
+    fake.cleanup()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc to find leftover processes")
+def test_hung_device_is_dropped_and_killed(fleet):
+    threads = threading.active_count()
+    a = adblib.adb(transport="cli")
+    a.DEVICE_PROBE_TIMEOUT = 1
+    start = time.monotonic()
+    assert a.init() == ["ok0"]
+    assert time.monotonic() - start < 3
+    assert a.configs["ok0"]["model"] == "Fake Phone"
+    # Nothing keeps driving the dropped device or holds up the interpreter exit
+    assert threading.active_count() == threads
+    assert not _running(HANG)
+
+
+def test_hung_device_over_socket(monkeypatch):
+    fake = FakeDevice()
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    with open(fake.root / "device.rc", "a") as rc:
+        rc.write("getprop() { sleep 2; }\n")
+    server = FakeAdbServer(fake)
+    server.start()
+    monkeypatch.setenv("ANDROID_ADB_SERVER_PORT", str(server.port))
+    try:
+        a = adblib.adb(transport="socket")
+        a.DEVICE_PROBE_TIMEOUT = 0.5
+        start = time.monotonic()
+        assert a.init() is False
+        assert time.monotonic() - start < 1.5
+        assert FAKE_SERIAL not in a.devices
+    finally:
+        server.stop()
+        fake.cleanup()
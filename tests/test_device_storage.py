@@ -0,0 +1,87 @@
+import pytest
+
+import adblib
+from benchmarks.fake_device import FakeDevice
+from core.device_storage import LRU_INDEX_NAME, MIN_FREE_ENV, DeviceStorage
+
+DF_HEADER = "Filesystem 1K-blocks Used Available Use% Mounted on"
+
+
+@pytest.fixture
+def device(monkeypatch):
+    fake = FakeDevice(files=True)
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    monkeypatch.setenv(MIN_FREE_ENV, "1")
+    a = adblib.adb(transport="cli")
+    a.init()
+    working_dir = fake.fs / "replay"
+    working_dir.mkdir()
+    yield fake, DeviceStorage(a), working_dir
+    fake.cleanup()
+
+
+def _set_df(fake, output):
+    """Makes df on the fake device print output, like toybox df -k"""
+    with open(fake.root / "device.rc", "a") as rc:
+        rc.write("df() { cat <<'__DF__'\n" + output + "\n__DF__\n}\n")
+
+
+def _add_traces(working_dir, names, size=1024):
+    """Creates traces in working_dir, used in the order of names, oldest first"""
+    paths = []
+    with open(working_dir / LRU_INDEX_NAME, "a") as index:
+        for stamp, name in enumerate(names, 1000):
+            path = working_dir / name
+            path.write_bytes(b"x" * size)
+            index.write(f"{stamp} {path}\n")
+            paths.append(str(path))
+    return paths
+
+
+def test_free_space_parses_df(device):
+    fake, storage, working_dir = device
+    _set_df(fake, DF_HEADER + "\n/dev/block/dm-46 115249236 98765432 16483804 86% /data")
+    assert storage.free_space(working_dir) == 16483804 * 1024
+
+
+def test_free_space_unknown_without_a_df_line(device):
+    fake, storage, working_dir = device
+    _set_df(fake, "df: /data/local/tmp/replay: Permission denied")
+    assert storage.free_space(working_dir) is None
+    _add_traces(working_dir, ["a.gfxr"])
+    assert storage.make_room(working_dir, working_dir / "new.gfxr", 2048) == []
+
+
+def test_make_room_evicts_least_recently_used_first(device):
+    fake, storage, working_dir = device
+    # Exactly the 1 MiB to keep free, so a push of 2 KiB needs two 1 KiB traces gone
+    _set_df(fake, DF_HEADER + "\n/dev/block/dm-46 4096 3072 1024 75% /data")
+    oldest, older, newest = _add_traces(working_dir, ["c.gfxr", "a.gfxr", "b.gfxr"])
+    assert storage.make_room(working_dir, working_dir / "new.gfxr", 2048) == [oldest, older]
+    assert sorted(path.name for path in working_dir.glob("*.gfxr")) == ["b.gfxr"]
+    assert list(storage.last_used(working_dir)) == [newest]
+
+
+def test_make_room_never_evicts_protected_traces(device):
+    fake, storage, working_dir = device
+    _set_df(fake, DF_HEADER + "\n/dev/block/dm-46 4096 4096 0 100% /data")
+    paths = _add_traces(working_dir, ["a.gfxr", "b.gfxr", "c.gfxr"])
+    # Not enough to evict even with every unprotected trace gone
+    assert storage.make_room(working_dir, paths[2], 2048, protect=[paths[0]]) == [paths[1]]
+    assert sorted(path.name for path in working_dir.glob("*.gfxr")) == ["a.gfxr", "c.gfxr"]
+
+
+def test_make_room_is_off_with_zero_min_free(device, monkeypatch):
+    fake, storage, working_dir = device
+    monkeypatch.setenv(MIN_FREE_ENV, "0")
+    _set_df(fake, DF_HEADER + "\n/dev/block/dm-46 4096 4096 0 100% /data")
+    _add_traces(working_dir, ["a.gfxr"])
+    assert storage.make_room(working_dir, working_dir / "new.gfxr", 2048) == []
+    assert (working_dir / "a.gfxr").exists()
+
+
+def test_record_use_moves_a_trace_to_the_back(device):
+    fake, storage, working_dir = device
+    first, second = _add_traces(working_dir, ["a.gfxr", "b.gfxr"])
+    storage.record_use(working_dir, [first])
+    assert [path for _, _, path in storage.traces(working_dir)] == [second, first]
@@ -0,0 +1,52 @@
+import importlib
+import threading
+
+import adblib
+import traceui_cli
+from benchmarks.fake_device import FakeDevice
+
+OPTIMIZER = """#!/bin/sh
+# Stands in for gfxrecon-optimize, slow enough for the two runs to overlap
+sleep 0.3
+printf '%s' "$1" > "$2"
+"""
+
+
+def test_fan_out_runs_keep_their_optimized_traces_apart(tmp_path, monkeypatch):
+    fake = FakeDevice(fleet={"dev0": {}, "dev1": {}})
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    optimizer = tmp_path / "artifacts" / "x64" / "gfxrecon-optimize"
+    optimizer.parent.mkdir(parents=True)
+    optimizer.write_text(OPTIMIZER)
+    optimizer.chmod(0o755)
+    monkeypatch.chdir(tmp_path)
+    adb = adblib.adb(transport="cli")
+    adb.init()
+
+    outputs = {}
+    errors = []
+
+    def run(serial):
+        try:
+            device_adb = adb.for_device(serial)
+            plugin = importlib.import_module("gfxreconstruct").tracetool(device_adb)
+            plugin.basepath = tmp_path / "artifacts"
+            outdir = tmp_path / "out" / serial
+            outputs[serial] = traceui_cli.collect_fastforward_output(
+                device_adb, plugin, "/sdcard/game_ff.gfxr", outdir, staging_dir=outdir)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(serial,)) for serial in ("dev0", "dev1")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for serial in ("dev0", "dev1"):
+        assert outputs[serial] == tmp_path / "out" / serial / "game_ff.optimized.gfxr"
+        # Written by the optimizer run of this device, from the trace staged for it
+        assert outputs[serial].read_text() == str(tmp_path / "out" / serial / "game_ff.gfxr")
+    assert not (tmp_path / "tmp" / "game_ff.optimized.gfxr").exists()
+    fake.cleanup()
@@ -0,0 +1,41 @@
+import threading
+import time
+
+import pytest
+
+import adblib
+from benchmarks.fake_device import FakeDevice
+
+# Answers 'ps -A -o NAME' like toybox, from a file listing the running process names
+PS = 'ps() { echo NAME; cat "$FAKE_PROCESSES" 2>/dev/null; }\n'
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    fake = FakeDevice()
+    with open(fake.root / "device.rc", "a") as rc:
+        rc.write(PS)
+    processes = tmp_path / "processes"
+    monkeypatch.setenv("FAKE_PROCESSES", str(processes))
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    a = adblib.adb(transport="cli")
+    a.init()
+    yield a, processes
+    fake.cleanup()
+
+
+@pytest.mark.parametrize("running", ["com.example.replay", "com.example.replay:render"])
+def test_waits_until_the_process_exits(device, running):
+    a, processes = device
+    processes.write_text(f"init\n{running}\nsurfaceflinger\n")
+    threading.Timer(0.6, lambda: processes.write_text("init\nsurfaceflinger\n")).start()
+    start = time.time()
+    exited = a.wait_for_process_exit("com.example.replay", timeout=10)
+    assert exited is not None and exited - start >= 0.5
+
+
+def test_returns_at_once_when_not_running(device):
+    a, processes = device
+    processes.write_text("init\ncom.example.other\n")
+    start = time.time()
+    assert a.wait_for_process_exit("com.example.replay", timeout=10) - start < 0.5
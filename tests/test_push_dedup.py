@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import adblib
+from benchmarks.fake_device import FakeDevice
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    fake = FakeDevice(files=True)
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    monkeypatch.setattr(adblib, "PUSH_MANIFEST", str(fake.fs / "traceui_push_manifest"))
+    a = adblib.adb(transport="cli")
+    a.init()
+    working_dir = fake.fs / "replay"
+    working_dir.mkdir()
+    trace = tmp_path / "game.gfxr"
+    trace.write_bytes(b"first version of the trace")
+    yield fake, a, trace, working_dir
+    fake.cleanup()
+
+
+def _pushes(fake):
+    return sum(1 for line in fake.log_path.read_text().splitlines() if " push " in f" {line} ")
+
+
+def _push(fake, a, trace, working_dir):
+    before = _pushes(fake)
+    assert a.push(str(trace), str(working_dir), dedup=True)
+    assert (working_dir / trace.name).read_bytes() == trace.read_bytes()
+    return _pushes(fake) - before
+
+
+def test_unchanged_file_is_skipped(device):
+    fake, a, trace, working_dir = device
+    assert _push(fake, a, trace, working_dir) == 1
+    assert _push(fake, a, trace, working_dir) == 0
+    # A new adb object has no hashes cached, only the manifest on the device
+    fresh = adblib.adb(transport="cli")
+    fresh.init()
+    assert _push(fake, fresh, trace, working_dir) == 0
+
+
+def test_changed_content_is_pushed(device):
+    fake, a, trace, working_dir = device
+    assert _push(fake, a, trace, working_dir) == 1
+    trace.write_bytes(b"other version of the trace")  # same size
+    assert _push(fake, a, trace, working_dir) == 1
+
+
+def test_changed_content_with_restored_mtime_is_pushed(device):
+    fake, a, trace, working_dir = device
+    assert _push(fake, a, trace, working_dir) == 1
+    st = trace.stat()
+    trace.write_bytes(b"other version of the trace")
+    os.utime(trace, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert _push(fake, a, trace, working_dir) == 1
+
+
+def test_deleted_remote_file_is_pushed(device):
+    fake, a, trace, working_dir = device
+    assert _push(fake, a, trace, working_dir) == 1
+    (working_dir / trace.name).unlink()
+    assert _push(fake, a, trace, working_dir) == 1
+
+
+def test_remote_file_changed_behind_the_manifest_is_pushed(device):
+    fake, a, trace, working_dir = device
+    assert _push(fake, a, trace, working_dir) == 1
+    (working_dir / trace.name).write_bytes(b"edited on the device itself")
+    assert _push(fake, a, trace, working_dir) == 1
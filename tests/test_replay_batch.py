@@ -0,0 +1,83 @@
+import argparse
+import threading
+import time
+from pathlib import PurePosixPath
+
+import pytest
+
+import adblib
+import traceui_cli
+from benchmarks.fake_device import FakeDevice
+
+WORKING_DIR = PurePosixPath("/data/local/tmp/replay")
+
+
+class _Plugin(object):
+    plugin_name = "gfxr"
+    suffix = "gfxr"
+    sdcard_working_dir = WORKING_DIR
+
+
+def _traces(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(b"trace")
+        paths.append(path)
+    return paths
+
+
+def test_duplicate_stems_are_rejected(tmp_path):
+    args = argparse.Namespace(trace=[str(p) for p in _traces(tmp_path, ["a.gfxr", "a.pat", "b.gfxr"])],
+                              storage_limit=None)
+    with pytest.raises(traceui_cli.CLIError, match="a.gfxr, .*a.pat"):
+        traceui_cli.handle_replay_batch(args, None, {}, tmp_path / "out", {})
+
+
+def test_stages_use_their_own_adb_and_keep_traces(tmp_path, monkeypatch):
+    fake = FakeDevice()
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    adb = adblib.adb(transport="cli")
+    adb.init()
+    used = {"push": set(), "replay": set(), "pull": set()}
+    removed = []
+    lock = threading.Lock()
+
+    def _use(stage, stage_adb):
+        with lock:
+            used[stage].add(id(stage_adb))
+        time.sleep(0.01)
+
+    def prepare_remote_trace(stage_adb, plugin, trace_path, protect=()):
+        _use("push", stage_adb)
+        return trace_path, plugin.sdcard_working_dir / trace_path.name
+
+    def run_replay(stage_adb, *args):
+        _use("replay", stage_adb)
+        return []
+
+    def collect_replay_outputs(stage_adb, *args):
+        _use("pull", stage_adb)
+        return {"screenshots": []}
+
+    def command(self, args, *rest, **kwargs):
+        if args[:2] == ["rm", "-f"]:
+            removed.append(args[2])
+        return "", ""
+
+    monkeypatch.setattr(traceui_cli, "prepare_remote_trace", prepare_remote_trace)
+    monkeypatch.setattr(traceui_cli, "run_replay", run_replay)
+    monkeypatch.setattr(traceui_cli, "collect_replay_outputs", collect_replay_outputs)
+    monkeypatch.setattr(traceui_cli, "cleanup_replay_artifacts", lambda *args: None)
+    monkeypatch.setattr(adblib.adb, "command", command)
+
+    traces = _traces(tmp_path, [f"t{index}.gfxr" for index in range(6)])
+    jobs, _ = traceui_cli.execute_replay_batch(adb, {"gfxr": _Plugin()}, traces, tmp_path / "out")
+
+    assert all(job.error is None for job in jobs)
+    assert used["replay"] == {id(adb)}
+    assert len(used["push"]) == len(used["pull"]) == 1
+    assert used["push"] != used["pull"] and not (used["push"] | used["pull"]) & used["replay"]
+    # Traces stay for the next run, eviction makes room for new ones
+    assert removed == []
+    fake.cleanup()
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import adblib
+from benchmarks.fake_device import FakeDevice
+
+BLOCK = 1024
+CHUNK = 4 * BLOCK
+COUNT = 5
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    monkeypatch.setattr(adblib, "DD_BLOCK", BLOCK)
+    monkeypatch.setattr(adblib, "RESUMABLE_CHUNK", CHUNK)
+    fake = FakeDevice(files=True)
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    a = adblib.adb(transport="cli")
+    a.init()
+    # Chunks that differ from each other, with a short last one
+    data = b"".join(bytes([i]) * CHUNK for i in range(COUNT - 1)) + b"tail"
+    yield fake, a, data, tmp_path
+    fake.cleanup()
+
+
+def _chunk_transfers(fake, sub):
+    """Chunks moved by 'adb exec-out' (pull) or 'adb exec-in' (push) so far"""
+    if not fake.log_path.exists():
+        return 0
+    return sum(1 for line in fake.log_path.read_text().splitlines() if f" {sub} dd " in line)
+
+
+def test_pull_resumes_from_truncated_partial(device):
+    fake, a, data, tmp_path = device
+    remote = fake.fs / "trace.gfxr"
+    remote.write_bytes(data)
+    local_dir = tmp_path / "out"
+    local_dir.mkdir()
+    (local_dir / ("trace.gfxr" + adblib.PARTIAL_SUFFIX)).write_bytes(data[:2 * CHUNK + 100])
+    assert a.pull(str(remote), str(local_dir), resumable=True)
+    assert (local_dir / "trace.gfxr").read_bytes() == data
+    assert not (local_dir / ("trace.gfxr" + adblib.PARTIAL_SUFFIX)).exists()
+    assert _chunk_transfers(fake, "exec-out") == COUNT - 2
+
+
+def test_push_resumes_from_truncated_partial(device):
+    fake, a, data, tmp_path = device
+    trace = tmp_path / "trace.gfxr"
+    trace.write_bytes(data)
+    (fake.fs / ("trace.gfxr" + adblib.PARTIAL_SUFFIX)).write_bytes(data[:3 * CHUNK])
+    assert a.push(str(trace), str(fake.fs), resumable=True)
+    assert (fake.fs / "trace.gfxr").read_bytes() == data
+    assert _chunk_transfers(fake, "exec-in") == COUNT - 3
+
+
+def test_corrupted_chunk_is_replaced(device):
+    fake, a, data, tmp_path = device
+    remote = fake.fs / "trace.gfxr"
+    remote.write_bytes(data)
+    local_dir = tmp_path / "out"
+    local_dir.mkdir()
+    corrupted = bytearray(data)
+    corrupted[CHUNK + 10] ^= 0xFF
+    (local_dir / ("trace.gfxr" + adblib.PARTIAL_SUFFIX)).write_bytes(bytes(corrupted))
+    assert a.pull(str(remote), str(local_dir), resumable=True)
+    assert (local_dir / "trace.gfxr").read_bytes() == data
+    # The chunks behind the corrupted one are kept, only the short last chunk
+    # is never verified in place and always fetched again
+    log = fake.log_path.read_text()
+    assert _chunk_transfers(fake, "exec-out") == 2
+    assert f"skip={CHUNK // BLOCK} " in log
+    assert f"skip={(COUNT - 1) * CHUNK // BLOCK} " in log
+
+
+def test_sha256_mismatch_fails(device):
+    fake, a, data, tmp_path = device
+    remote = fake.fs / "trace.gfxr"
+    remote.write_bytes(data)
+    # Every chunk verifies, only the final whole-file check disagrees
+    with open(fake.root / "device.rc", "a") as rc:
+        rc.write('sha256sum() { echo 0000000000000000 "$1"; }\n')
+    local_dir = tmp_path / "out"
+    local_dir.mkdir()
+    assert not a.pull(str(remote), str(local_dir), resumable=True)
+    assert not os.path.exists(local_dir / "trace.gfxr")
+    assert not os.path.exists(local_dir / ("trace.gfxr" + adblib.PARTIAL_SUFFIX))
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+import adblib
+from benchmarks.fake_device import FAKE_SERIAL, FakeDevice
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeDevice()
+    monkeypatch.setattr(adblib, "ADB", str(fake.adb_path))
+    monkeypatch.setenv("FAKE_ADB_TRANSFER_STEP", "0.15")
+    yield fake
+    fake.cleanup()
+
+
+def _pull(fake, **kwargs):
+    updates = []
+    cmd = [str(fake.adb_path), "-s", FAKE_SERIAL, "pull", "-p", "/sdcard/capture.gfxr", "capture.gfxr"]
+    start = time.monotonic()
+    rc = adblib.adb()._run_subprocess_with_progress(
+        cmd, lambda percent, _: updates.append((time.monotonic() - start, percent)), "Pulling", **kwargs)
+    assert rc == 0
+    return updates
+
+
+@pytest.mark.skipif(adblib.pty is None, reason="needs a pty")
+def test_progress_from_adb_output(fake):
+    updates = _pull(fake)
+    percents = [percent for _, percent in updates]
+    assert percents == sorted(percents)
+    assert len([percent for percent in percents if 0 < percent < 100]) >= 5
+
+
+def test_progress_without_terminal_polls(fake, monkeypatch, tmp_path):
+    # Without a pty adb prints no progress, like the real adb writing to a pipe
+    monkeypatch.setattr(adblib, "pty", None)
+    partial = tmp_path / "capture.gfxr"
+    partial.write_bytes(b"x" * 500)
+    updates = _pull(fake, total_size=1000, poll_path=str(partial))
+    assert [percent for _, percent in updates] == [50]
+    assert updates[0][0] < 1.5
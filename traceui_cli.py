@@ -6,12 +6,19 @@ import json
 import os
 import re
 import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 from pathlib import Path
 
 import adblib
+from core.device_lease import (
+    DeviceLease, LeaseManager, LeaseTimeout, lease_timeout, leases_enabled, match_devices, parse_requirements
+)
+from core.replay_pipeline import PipelineJob, StagePipeline
 
 from core.logger_config import LOG_LEVEL_ENV, setup_logger
 
@@ -29,6 +36,8 @@ CLI_PLUGIN_ALIASES = {
 }
 CAPTURE_PLUGIN_CHOICES = ("gfxr", "patrace")
 REPLAYER_PLUGIN_CHOICES = ("auto", "gfxr", "patrace")
+CAPTURE_LEASE_TTL = 12 * 60 * 60  # a capture keeps its device from capture setup until capture stop
+MULTIPLE_DEVICES_ERROR = "Multiple devices connected. Use --device SERIAL to choose one."
 
 
 class CLIError(RuntimeError):
@@ -60,13 +69,140 @@ def init_adb(device=None):
         adb.select_device(device)
     elif adb.device is None:
         if len(adb.devices) > 1:
-            raise CLIError(
-                "Multiple devices connected. Use --device SERIAL to choose one."
-            )
+            raise CLIError(MULTIPLE_DEVICES_ERROR)
         adb.select_device(adb.devices[0])
     return adb
 
 
+def matching_devices(adb, serials, require):
+    """Returns the serials whose probed config meets the --require KEY=VALUE items"""
+    try:
+        requirements = parse_requirements(require)
+    except ValueError as exc:
+        raise CLIError(str(exc))
+    unknown = [serial for serial in serials if serial not in adb.devices]
+    if unknown:
+        raise CLIError(f"Devices not connected: {', '.join(unknown)}. Available: {adb.devices}")
+    matching = match_devices({serial: adb.configs[serial] for serial in serials}, requirements)
+    if not matching:
+        raise CLIError(f"No connected device matches {requirements}.")
+    return matching
+
+
+def acquire_device_lease(candidates, job, ttl=None):
+    """Waits for an exclusive lease on the least used free device of candidates"""
+    def on_wait(holders):
+        busy = [f"{serial} ({holder['user']}: {holder['job']})" for serial, holder in holders.items() if holder]
+        _print(f"Waiting for a free device, in use: {', '.join(busy) or 'reserved by earlier jobs'}")
+
+    try:
+        return LeaseManager().acquire(candidates, job, lease_timeout(), ttl, on_wait)
+    except LeaseTimeout as exc:
+        raise CLIError(str(exc))
+
+
+def init_leased_adb(args, job, ttl=None):
+    """
+    Like init_adb, but first takes an exclusive lease on the device, so no
+    other traceui process drives it at the same time. Without --device the
+    least used free device meeting --require is picked, with neither given
+    several connected devices are an error, like in init_adb.
+
+    Returns:
+        (adb, DeviceLease)
+    """
+    adb = adblib.adb()
+    if not adb.init():
+        raise CLIError("No connected Android devices found.")
+    if not args.device and not args.require and len(adb.devices) > 1:
+        raise CLIError(MULTIPLE_DEVICES_ERROR)
+    candidates = matching_devices(adb, [args.device] if args.device else adb.devices, args.require)
+    if leases_enabled():
+        lease = acquire_device_lease(candidates, job, ttl)
+    elif len(candidates) > 1:
+        raise CLIError(MULTIPLE_DEVICES_ERROR)
+    else:
+        lease = DeviceLease(candidates[0])
+    if adb.device != lease.device:
+        adb.select_device(lease.device)
+    return adb, lease
+
+
+def init_device_adbs(devices, require=None):
+    """
+    Returns one adb object per device selected by --devices, 'all' or a
+    comma separated list of serials, and meeting --require.
+    """
+    adb = adblib.adb()
+    if not adb.init():
+        raise CLIError("No connected Android devices found.")
+    if devices == "all":
+        serials = list(adb.devices)
+    else:
+        serials = list(dict.fromkeys(serial.strip() for serial in devices.split(",") if serial.strip()))
+    if not serials:
+        raise CLIError("No devices selected.")
+    return [adb.for_device(serial) for serial in matching_devices(adb, serials, require)]
+
+
+def run_on_devices(args, run_device):
+    """
+    Runs run_device(args, adb, plugins, outdir, report) concurrently on every
+    device of --devices, each with its own adb object, plugin instances and
+    outdir/<serial> directory, and writes the reports to outdir/devices_summary.json.
+    """
+    if args.device:
+        raise CLIError("--device and --devices cannot be combined.")
+    outdir = Path(args.outdir or DEFAULT_OUTPUT_DIR)
+    _ensure_dir(outdir)
+    adbs = sorted(init_device_adbs(args.devices, args.require), key=lambda adb: adb.device)
+    leases = []
+    try:
+        # Always leased in serial order, so two fan-outs over the same devices cannot deadlock
+        for adb in adbs:
+            if leases_enabled():
+                leases.append(acquire_device_lease([adb.device], f"{args.command} on {len(adbs)} devices"))
+        return _run_on_leased_devices(args, run_device, adbs, outdir)
+    finally:
+        for lease in leases:
+            lease.release()
+
+
+def _run_on_leased_devices(args, run_device, adbs, outdir):
+    # Plugins are loaded here, importing them from several threads would race on sys.path
+    runs = [(adb, load_plugins(adb)) for adb in adbs]
+    _print(f"Running on devices: {', '.join(adb.device for adb, _ in runs)}")
+    reports = {adb.device: {"outdir": str(outdir / adb.device)} for adb, _ in runs}
+
+    def _run(adb, plugins):
+        report = reports[adb.device]
+        report["model"] = adb.configs[adb.device].get("model")
+        try:
+            report["exit_code"] = run_device(args, adb, plugins, outdir / adb.device, report)
+        except CLIError as exc:
+            report["exit_code"] = 1
+            report["error"] = str(exc)
+        except Exception as exc:
+            logger.exception(f"Run on device {adb.device} failed")
+            report["exit_code"] = 1
+            report["error"] = str(exc) or exc.__class__.__name__
+
+    threads = [threading.Thread(target=_run, args=run, daemon=True) for run in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary_path = outdir / "devices_summary.json"
+    with open(summary_path, "w") as outfile:
+        json.dump({"command": args.command, "devices": reports}, outfile, indent=2)
+    for serial, report in reports.items():
+        status = "OK" if report["exit_code"] == 0 else f"FAILED {report.get('error', '')}".rstrip()
+        _print(f"{serial}: {status}, output in {report['outdir']}")
+    _print(f"Summary written to: {summary_path}")
+    return 0 if all(report["exit_code"] == 0 for report in reports.values()) else 1
+
+
 def load_plugins(adb):
     plugins = {}
     sys.path.insert(0, str(PLUGINS_PATH))
@@ -141,17 +277,6 @@ def resolve_plugin(plugins, plugin_name=None, trace_path=None):
     raise CLIError(f"Multiple plugins matched trace suffix '.{suffix}'.")
 
 
-def _extract_application_label(adb, package_name):
-    info, _ = adb.command(["dumpsys", "package", package_name], errors_handled_externally=True, print_command=False)
-    for line in info.splitlines():
-        stripped = line.strip()
-        if stripped.startswith("application-label:"):
-            return stripped.split(":", 1)[1].strip().strip("'")
-        if stripped.startswith("application-label-"):
-            return stripped.split(":", 1)[1].strip().strip("'")
-    return None
-
-
 def resolve_target_app(adb, target):
     target = target.strip()
     apps = adb.apps()
@@ -164,18 +289,15 @@ def resolve_target_app(adb, target):
     if len(package_matches) == 1:
         return package_matches[0]
 
-    label_matches = []
-    for app in apps:
-        label = _extract_application_label(adb, app["name"])
-        if not label:
-            continue
-        if label.lower() == target.lower() or target.lower() in label.lower():
-            label_matches.append((app["name"], label))
+    app_names = {app["name"] for app in apps}
+    label_matches = [
+        name for name in adb.app_inventory().find_by_label(target, substring=True) if name in app_names
+    ]
 
     if len(label_matches) == 1:
-        return label_matches[0][0]
+        return label_matches[0]
 
-    candidates = package_matches if package_matches else [match[0] for match in label_matches]
+    candidates = package_matches if package_matches else label_matches
     preview = ", ".join(sorted(candidates)[:10]) if candidates else "none"
     raise CLIError(
         f"Could not uniquely resolve target '{target}'. Candidate packages: {preview}"
@@ -249,13 +371,15 @@ def validate_local_trace(trace_path):
     return trace_path
 
 
-def prepare_remote_trace(adb, plugin, trace_path):
+def prepare_remote_trace(adb, plugin, trace_path, protect=()):
     trace_path = validate_local_trace(trace_path)
-    remote_trace = plugin.sdcard_working_dir / trace_path.name
-    adb.command(["mkdir", "-p", str(plugin.sdcard_working_dir)], True)
-    adb.delete_file(remote_trace)
-    if not adb.push(str(trace_path), str(plugin.sdcard_working_dir), track=False):
+    working_dir = plugin.sdcard_working_dir
+    remote_trace = working_dir / trace_path.name
+    adb.command(["mkdir", "-p", str(working_dir)], True)
+    adb.storage.make_room(working_dir, remote_trace, trace_path.stat().st_size, protect)
+    if not adb.push(str(trace_path), str(working_dir), track=False, dedup=True):
         raise CLIError(f"Failed to push trace to device: {trace_path}")
+    adb.storage.record_use(working_dir, [remote_trace])
     return trace_path, remote_trace
 
 
@@ -273,18 +397,19 @@ def _ensure_remote_file_exists(adb, remote_path, description):
         raise CLIError(f"{description} was not created on device: {remote_path}")
 
 
-def collect_fastforward_output(adb, plugin, remote_output, outdir):
+def collect_fastforward_output(adb, plugin, remote_output, outdir, staging_dir=DEFAULT_OUTPUT_DIR):
     outdir = Path(outdir)
     _ensure_dir(outdir)
     _ensure_remote_file_exists(adb, remote_output, "Fast-forward trace")
 
     if plugin.plugin_name == "gfxreconstruct":
-        staging_dir = DEFAULT_OUTPUT_DIR
+        staging_dir = Path(staging_dir)
         _ensure_dir(staging_dir)
         if not adb.pull(str(remote_output), str(staging_dir)):
             raise CLIError(f"Failed to pull fast-forward trace from device: {remote_output}")
         staged_trace = staging_dir / Path(remote_output).name
-        optimized_trace = plugin.optimize_trace(str(staged_trace))
+        # Straight into outdir, fan-out runs of the same trace must not share a file
+        optimized_trace = plugin.optimize_trace(str(staged_trace), str(outdir))
         if optimized_trace is None:
             final_local_path = outdir / staged_trace.name
             if staged_trace.resolve() != final_local_path.resolve():
@@ -324,18 +449,55 @@ def remove_capture_session(session_path):
         session_path.unlink()
 
 
-def write_patrace_replay_args(adb, plugin, data):
-    _ensure_dir(DEFAULT_OUTPUT_DIR)
-    local_args_path = DEFAULT_OUTPUT_DIR / "replay_args.json"
-    with open(local_args_path, "w") as outfile:
-        json.dump(data, outfile, indent=2)
-    adb.command(["mkdir", "-p", str(plugin.sdcard_working_dir)], True)
-    adb.delete_file(plugin.sdcard_working_dir / local_args_path.name)
-    if not adb.push(str(local_args_path), str(plugin.sdcard_working_dir), track=False):
-        raise CLIError("Failed to push patrace replay_args.json to device.")
+def start_capture_stream(state_file):
+    """Starts 'capture tail' as a detached process that outlives this command"""
+    cmd = [sys.executable, str(Path(__file__).resolve()), "capture", "tail", "--state-file", str(state_file)]
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return process.pid
+
+
+def stop_capture_stream(session, pull_dir, remote_trace, timeout=30):
+    """
+    Stops the 'capture tail' process of a session and moves its partial trace
+    to pull_dir, where a resumable pull of remote_trace picks it up.
+    """
+    pid = session.get("stream_pid")
+    if not pid:
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            os.kill(pid, 0)
+            time.sleep(0.1)
+        logger.warning(f"Capture stream process {pid} did not exit within {timeout}s")
+    except ProcessLookupError:
+        pass
+    partial = Path(session["stream_dir"]) / (Path(remote_trace).name + adblib.PARTIAL_SUFFIX)
+    if partial.exists() and partial.parent.resolve() != Path(pull_dir).resolve():
+        _ensure_dir(pull_dir)
+        shutil.move(str(partial), str(Path(pull_dir) / partial.name))
 
 
-def start_replay_process(adb, plugin, cmd):
+def write_patrace_replay_args(adb, plugin, data):
+    # A private directory, replays on other devices may write their own args at the same time
+    with tempfile.TemporaryDirectory() as tempdir:
+        local_args_path = Path(tempdir) / "replay_args.json"
+        with open(local_args_path, "w") as outfile:
+            json.dump(data, outfile, indent=2)
+        adb.command(["mkdir", "-p", str(plugin.sdcard_working_dir)], True)
+        adb.delete_file(plugin.sdcard_working_dir / local_args_path.name)
+        if not adb.push(str(local_args_path), str(plugin.sdcard_working_dir), track=False):
+            raise CLIError("Failed to push patrace replay_args.json to device.")
+
+
+def start_replay_process(adb, plugin, cmd, logcat_stream=None):
     process_name = plugin.replayer["name"]
     if "gfxreconstruct" in process_name:
         logger.debug("Launching replay command: %s", " ".join([str(x) for x in cmd]))
@@ -345,10 +507,23 @@ def start_replay_process(adb, plugin, cmd):
         logger.debug("Launching replay command: %s", cmd)
 
     time.sleep(0.1)
-    stdout, _ = adb.command([f"ps -A | grep {process_name}"], print_command=False)
-    while process_name in stdout:
-        time.sleep(0.5)
-        stdout, _ = adb.command([f"ps -A | grep {process_name}"], print_command=False)
+    fatal = logcat_stream.fatal if logcat_stream else None
+    adb.wait_for_process_exit(process_name, stop_event=fatal)
+    if fatal and fatal.is_set():
+        logger.error("Stopping replay after fatal logcat line: %s", logcat_stream.fatal_line)
+        adb.command(["am", "force-stop", process_name], run_with_sudo=True)
+
+
+def open_replay_logcat_stream(adb, plugin):
+    if not hasattr(plugin, "logcat_matcher"):
+        return None
+    return adb.open_logcat_stream(plugin.logcat_matcher(mode="replay"))
+
+
+def finish_replay_logcat(plugin, logcat_stream):
+    if logcat_stream is None:
+        return _parse_plugin_logcat(plugin, mode="replay")
+    return logcat_stream.stop()
 
 
 def _get_screenshot_paths(adb, base_dir, prefix):
@@ -387,15 +562,18 @@ def collect_replay_outputs(adb, plugin, trace_on_device, screenshots, interval,
                     continue
                 adb.command([f"mv {remote_path} {normalized_path}"], True)
             screenshot_paths = _get_screenshot_paths(adb, screenshot_dir, screenshot_prefix)
+        pulled = set(adb.pull_many(screenshot_paths, str(outdir)))
         for remote_path in screenshot_paths:
-            if not adb.pull(remote_path, str(outdir)):
+            local_path = str(outdir / Path(remote_path).name)
+            if local_path not in pulled:
                 raise CLIError(f"Failed to pull screenshot from device: {remote_path}")
-            results["screenshots"].append(str(outdir / Path(remote_path).name))
+            results["screenshots"].append(local_path)
 
     return results
 
 
-def execute_replay_run(adb, plugin, remote_trace, outdir, screenshot_mode=False, interval=10, from_frame=None, to_frame=None):
+def run_replay(adb, plugin, remote_trace, screenshot_mode=False, interval=10, from_frame=None, to_frame=None):
+    """Replays a trace that is already on the device, returns the replay error lines"""
     adb.clear_logcat()
     cleanup_replay_artifacts(adb, plugin, remote_trace, screenshot_mode)
     plugin.replay_setup()
@@ -413,16 +591,98 @@ def execute_replay_run(adb, plugin, remote_trace, outdir, screenshot_mode=False,
     if plugin.plugin_name == "patrace":
         write_patrace_replay_args(adb, plugin, data)
 
+    logcat_stream = open_replay_logcat_stream(adb, plugin)
     try:
-        start_replay_process(adb, plugin, cmd)
-        results = collect_replay_outputs(adb, plugin, remote_trace, screenshot_mode, interval, outdir)
-        err_lines = plugin.parse_logcat(mode="replay")
+        start_replay_process(adb, plugin, cmd, logcat_stream)
+        err_lines = finish_replay_logcat(plugin, logcat_stream)
+        logcat_stream = None
     finally:
+        if logcat_stream is not None:
+            logcat_stream.stop()
         plugin.replay_reset_device()
 
+    return err_lines
+
+
+def execute_replay_run(adb, plugin, remote_trace, outdir, screenshot_mode=False, interval=10, from_frame=None, to_frame=None):
+    err_lines = run_replay(adb, plugin, remote_trace, screenshot_mode, interval, from_frame, to_frame)
+    results = collect_replay_outputs(adb, plugin, remote_trace, screenshot_mode, interval, outdir)
     return results, err_lines
 
 
+def execute_replay_batch(adb, plugins, trace_paths, outdir, screenshot_mode=False, interval=10,
+                         config=None, storage_limit=None):
+    """
+    Replays many traces with the push, replay and pull stages overlapped: the
+    next trace is pushed and the screenshots of the previous one are pulled
+    while a trace replays. storage_limit bounds the bytes of the traces in
+    flight. Once its outputs are pulled, a trace stays on the device so a later
+    run skips its push; the storage the traces take on the device is capped by
+    the DeviceStorage.make_room eviction before every push, not by storage_limit.
+
+    Returns:
+        tuple: The finished PipelineJob list and the StagePipeline, for its utilization
+    """
+    configured = set()
+    jobs = []
+    for trace_path in trace_paths:
+        plugin = resolve_plugin(plugins, trace_path=trace_path)
+        plugin.adb = adb
+        if config and plugin.plugin_name not in configured:
+            apply_plugin_config(plugin, config)
+            configured.add(plugin.plugin_name)
+        job = PipelineJob(trace_path, cost=trace_path.stat().st_size)
+        job.data["plugin"] = plugin
+        job.data["outdir"] = outdir / trace_path.stem
+        jobs.append(job)
+
+    # The replay stage drives the device through adb, which the plugins use too.
+    # The other stages get their own adb objects, their state is not thread-safe.
+    push_adb = adb.for_device(adb.device)
+    pull_adb = adb.for_device(adb.device)
+    cleanup_adb = adb.for_device(adb.device)
+    cleanup_lock = threading.Lock()
+    # Traces of this batch not done yet must not be evicted to make room
+    protected = {str(job.data["plugin"].sdcard_working_dir / job.item.name) for job in jobs}
+    protected_lock = threading.Lock()
+
+    def push(job):
+        with protected_lock:
+            protect = list(protected)
+        _, job.data["remote_trace"] = prepare_remote_trace(push_adb, job.data["plugin"], job.item, protect)
+
+    def replay(job):
+        job.data["errors"] = run_replay(adb, job.data["plugin"], job.data["remote_trace"], screenshot_mode, interval)
+
+    def pull(job):
+        job.data["results"] = collect_replay_outputs(
+            pull_adb, job.data["plugin"], job.data["remote_trace"], screenshot_mode, interval, job.data["outdir"]
+        )
+
+    def finish(job):
+        # Runs in the thread of the stage the job finished or failed in
+        remote_trace = job.data.get("remote_trace")
+        if remote_trace is None:
+            return
+        with protected_lock:
+            protected.discard(str(remote_trace))
+        with cleanup_lock:
+            cleanup_replay_artifacts(cleanup_adb, job.data["plugin"], remote_trace, screenshot_mode)
+
+    pipeline = StagePipeline(
+        [("push", push), ("replay", replay), ("pull", pull)],
+        capacity=storage_limit,
+        on_done=finish,
+    )
+    try:
+        return pipeline.run(jobs), pipeline
+    finally:
+        for stage_adb in (push_adb, pull_adb, cleanup_adb):
+            stage_adb.close_sessions()
+            if stage_adb.server:
+                stage_adb.server.close()
+
+
 def stage_compared_frame(results, target_path, frame_number, run_label):
     screenshots = results.get("screenshots", [])
     if len(screenshots) != 1:
@@ -468,7 +728,15 @@ def compare_replay_frames(frame_number, first_image, second_image, diff_image):
 
 def handle_capture_setup(args):
     configure_command_loglevel(args.loglevel)
-    adb = init_adb(args.device)
+    adb, lease = init_leased_adb(args, f"capture {args.app}", ttl=CAPTURE_LEASE_TTL)
+    try:
+        return setup_capture(args, adb, lease)
+    except BaseException:
+        lease.release()
+        raise
+
+
+def setup_capture(args, adb, lease):
     plugins = load_plugins(adb)
     plugin = resolve_plugin(plugins, args.plugin)
     plugin.adb = adb
@@ -493,9 +761,15 @@ def handle_capture_setup(args):
         "requested_app": args.app,
         "config_path": str(args.config) if args.config else None,
         "outdir": str(DEFAULT_OUTPUT_DIR),
+        "lease_token": lease.token,
         "plugin_state": plugin.export_capture_session_state() if hasattr(plugin, "export_capture_session_state") else {},
     }
     save_capture_session(args.state_file, session_data)
+    if args.stream_trace:
+        session_data["stream_dir"] = session_data["outdir"]
+        session_data["stream_pid"] = start_capture_stream(args.state_file)
+        save_capture_session(args.state_file, session_data)
+        _print(f"Streaming the trace to {session_data['stream_dir']} while capturing.")
     _print(f"Capture armed. Session stored at: {args.state_file}")
     if args.launch_app:
         launch_target_app(adb, resolved_target)
@@ -511,7 +785,8 @@ def handle_capture_stop(args):
     if not session_plugin:
         raise CLIError("Capture session is missing the plugin name.")
 
-    adb = init_adb(args.device)
+    # capture setup may have picked the device itself
+    adb = init_adb(args.device or session.get("device"))
     plugins = load_plugins(adb)
     plugin = resolve_plugin(plugins, session_plugin)
     plugin.adb = adb
@@ -538,12 +813,17 @@ def handle_capture_stop(args):
 
     remote_trace = None
     try:
+        if getattr(plugin, "capture_file_fullpath", None):
+            # gfxreconstruct pulls the raw trace to tmp/ itself in trace_stop to optimize it
+            pull_dir = Path("tmp") if getattr(plugin, "trace_stop_handle_transfers", False) else outdir
+            stop_capture_stream(session, pull_dir, plugin.capture_file_fullpath)
         remote_trace = plugin.trace_stop(resolved_target)
         _ensure_capture_trace_exists(adb, plugin, resolved_target, remote_trace)
-        if not adb.pull(str(remote_trace), str(outdir)):
+        if not adb.pull(str(remote_trace), str(outdir), resumable=True):
             raise CLIError(f"Failed to pull trace from device: {remote_trace}")
     finally:
         plugin.trace_reset_device()
+        release_capture_lease(session)
 
     local_path = outdir / Path(remote_trace).name
     remove_capture_session(args.state_file)
@@ -552,6 +832,24 @@ def handle_capture_stop(args):
     return 0
 
 
+def release_capture_lease(session):
+    """Ends the device lease capture setup took for the session"""
+    if session.get("lease_token") and leases_enabled():
+        LeaseManager().release(session["device"], session["lease_token"])
+
+
+def handle_capture_tail(args):
+    session = load_capture_session(args.state_file)
+    adb = init_adb(session.get("device"))
+    remote_path = session.get("plugin_state", {}).get("capture_file_fullpath")
+    if not remote_path:
+        raise CLIError("Capture session has no capture file to stream.")
+    tail = adb.open_capture_tail(remote_path, session["stream_dir"])
+    signal.signal(signal.SIGTERM, lambda signum, frame: tail.stop())
+    tail.wait()
+    return 0
+
+
 def handle_capture_list_packages(args):
     adb = init_adb(args.device)
     packages = list_installed_packages(adb)
@@ -576,17 +874,89 @@ def handle_capture_sample_config(args):
     return 0
 
 
+def handle_replay_batch(args, adb, plugins, outdir, report):
+    trace_paths = [validate_local_trace(trace) for trace in args.trace]
+    # The device screenshot dir and outdir/<name> are named after the stem
+    stems = [trace.stem for trace in trace_paths]
+    duplicates = sorted(str(trace) for trace in trace_paths if stems.count(trace.stem) > 1)
+    if duplicates:
+        raise CLIError(f"Traces share a name, their outputs would overwrite each other: {', '.join(duplicates)}")
+    if args.storage_limit is not None and args.storage_limit <= 0:
+        raise CLIError("Device storage limit must be > 0.")
+    _ensure_dir(outdir)
+    _print(f"Using device: {adb.device}")
+    _print(f"Replaying {len(trace_paths)} traces with overlapped push, replay and pull")
+
+    jobs, pipeline = execute_replay_batch(
+        adb,
+        plugins,
+        trace_paths,
+        outdir,
+        screenshot_mode="interval" if args.screenshots else False,
+        interval=args.interval if args.interval is not None else 10,
+        config=args.config,
+        storage_limit=args.storage_limit * 1024 * 1024 if args.storage_limit else None,
+    )
+
+    failed = 0
+    summary = {"device": adb.device, "traces": [], "stages": {}}
+    for job in jobs:
+        errors = job.data.get("errors") or []
+        entry = {
+            "trace": str(job.item),
+            "outdir": str(job.data["outdir"]),
+            "screenshots": job.data.get("results", {}).get("screenshots", []),
+            "errors": errors,
+            "failed_stage": job.failed_stage,
+            "error": job.error,
+            "stage_seconds": job.stage_times,
+        }
+        summary["traces"].append(entry)
+        if job.error:
+            failed += 1
+            _print(f"{job.item}: failed in {job.failed_stage}: {job.error}")
+        elif errors:
+            failed += 1
+            _print_error_lines(f"{job.item}: replay reported errors:", errors)
+        else:
+            _print(f"{job.item}: OK, {len(entry['screenshots'])} screenshot(s) in {entry['outdir']}")
+
+    _print(f"Stage utilization over {pipeline.wall:.1f}s:")
+    for stage, (busy, fraction) in pipeline.utilization().items():
+        summary["stages"][stage] = {"busy_seconds": busy, "utilization": fraction}
+        _print(f"  {stage:<7} {busy:>8.1f}s {fraction:>6.0%}")
+    summary["wall_seconds"] = pipeline.wall
+    report["replay_summary"] = summary
+    summary_path = outdir / "replay_summary.json"
+    with open(summary_path, "w") as outfile:
+        json.dump(summary, outfile, indent=2)
+    _print(f"Summary written to: {summary_path}")
+    return 1 if failed else 0
+
+
 def handle_replay(args):
     configure_command_loglevel(args.loglevel)
-    adb = init_adb(args.device)
-    plugins = load_plugins(adb)
-    trace_path = validate_local_trace(args.trace)
+    if args.devices:
+        return run_on_devices(args, replay_on_device)
+    adb, lease = init_leased_adb(args, f"replay {', '.join(Path(trace).name for trace in args.trace)}")
+    with lease:
+        return replay_on_device(args, adb, load_plugins(adb), Path(args.outdir or DEFAULT_OUTPUT_DIR))
+
+
+def replay_on_device(args, adb, plugins, outdir, report=None):
+    report = {} if report is None else report
+    if len(args.trace) > 1:
+        if args.compare_frame is not None:
+            raise CLIError("--compare-frame takes a single trace.")
+        if args.interval is not None and args.interval < 0:
+            raise CLIError("Screenshot interval must be >= 0.")
+        return handle_replay_batch(args, adb, plugins, outdir, report)
+    trace_path = validate_local_trace(args.trace[0])
 
     plugin = resolve_plugin(plugins, trace_path=trace_path)
     plugin.adb = adb
     if args.config:
         apply_plugin_config(plugin, args.config)
-    outdir = Path(args.outdir or DEFAULT_OUTPUT_DIR)
     _ensure_dir(outdir)
     if args.interval is not None and args.interval < 0:
         raise CLIError("Screenshot interval must be >= 0.")
@@ -662,6 +1032,8 @@ def handle_replay(args):
         interval=replay_interval,
     )
 
+    report["screenshots"] = [str(path) for path in results["screenshots"]]
+    report["errors"] = err_lines
     if results["screenshots"]:
         _print(f"Pulled {len(results['screenshots'])} screenshot(s) to: {outdir}")
     else:
@@ -680,9 +1052,15 @@ def handle_fastforward(args):
         raise CLIError("Fast-forward start frame must be >= 0.")
     if args.end_frame is not None and args.end_frame < args.start_frame:
         raise CLIError("Fast-forward end frame must be >= start frame.")
+    if args.devices:
+        return run_on_devices(args, fastforward_on_device)
+    adb, lease = init_leased_adb(args, f"fastforward {Path(args.trace).name}")
+    with lease:
+        return fastforward_on_device(args, adb, load_plugins(adb), Path(args.outdir or DEFAULT_OUTPUT_DIR))
 
-    adb = init_adb(args.device)
-    plugins = load_plugins(adb)
+
+def fastforward_on_device(args, adb, plugins, outdir, report=None):
+    report = {} if report is None else report
     trace_path = validate_local_trace(args.trace)
     plugin = resolve_plugin(plugins, args.plugin, trace_path)
     plugin.adb = adb
@@ -694,7 +1072,6 @@ def handle_fastforward(args):
         raise CLIError("Fastforward plugin is not available.")
     fastforward_plugin.adb = adb
 
-    outdir = Path(args.outdir or DEFAULT_OUTPUT_DIR)
     _ensure_dir(outdir)
     _, remote_trace = prepare_remote_trace(adb, plugin, trace_path)
 
@@ -708,6 +1085,7 @@ def handle_fastforward(args):
 
     remote_output = None
     local_output = None
+    logcat_stream = None
     try:
         cmd, remote_output = fastforward_plugin.replay_start_fastforward(
             remote_trace,
@@ -718,12 +1096,20 @@ def handle_fastforward(args):
         if cmd is None or remote_output is None:
             raise CLIError("Fast-forward setup failed before launch.")
 
-        start_replay_process(adb, plugin, cmd)
-        local_output = collect_fastforward_output(adb, plugin, remote_output, outdir)
-        err_lines = plugin.parse_logcat(mode="replay")
+        logcat_stream = open_replay_logcat_stream(adb, plugin)
+        start_replay_process(adb, plugin, cmd, logcat_stream)
+        # Fan-out runs stage in their own output directory, not the shared default one
+        staging_dir = outdir if args.devices else DEFAULT_OUTPUT_DIR
+        local_output = collect_fastforward_output(adb, plugin, remote_output, outdir, staging_dir)
+        err_lines = finish_replay_logcat(plugin, logcat_stream)
+        logcat_stream = None
     finally:
+        if logcat_stream is not None:
+            logcat_stream.stop()
         plugin.replay_reset_device()
 
+    report["output"] = str(local_output) if local_output is not None else None
+    report["errors"] = err_lines
     if local_output is not None:
         _print(f"Fast-forward trace saved to: {local_output}")
 
@@ -734,6 +1120,26 @@ def handle_fastforward(args):
     return 0
 
 
+def handle_devices(args):
+    adb = adblib.adb()
+    if not adb.init():
+        raise CLIError("No connected Android devices found.")
+    holders, usage = {}, {}
+    if leases_enabled():
+        manager = LeaseManager()
+        holders, usage = manager.holders(adb.devices), manager.usage(adb.devices)
+    _print(f"{'serial':<20} {'model':<20} {'gpu':<10} {'abi':<12} {'leases':>6} {'busy':>8}  holder")
+    for serial in adb.devices:
+        config = adb.configs[serial]
+        abi = (config.get("abi") or "").split(",")[0]
+        leases, busy = usage.get(serial, (0, 0.0))
+        holder = holders.get(serial)
+        held_by = f"{holder['job']} ({holder['user']}, pid {holder['pid']})" if holder else "free"
+        _print(f"{serial:<20} {config.get('model') or '':<20} {config.get('gpu') or '':<10} {abi:<12} "
+               f"{leases:>6} {busy / 60:>7.1f}m  {held_by}")
+    return 0
+
+
 def build_parser():
     parser = argparse.ArgumentParser(prog="traceui-cli")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -751,6 +1157,12 @@ def build_parser():
     capture_setup.add_argument("--app", required=True, help="Target Android package or app name.")
     capture_setup.add_argument("-c", "--config", type=Path, help="Plugin-scoped capture config JSON.")
     capture_setup.add_argument("--device", help="ADB device serial.")
+    capture_setup.add_argument(
+        "--require",
+        action="append",
+        metavar="KEY=VALUE",
+        help="Only use devices whose probed config matches, e.g. model=Pixel 8, gpu=mali or abi=arm64-v8a. Repeatable.",
+    )
     capture_setup.add_argument(
         "--loglevel",
         choices=("debug", "info", "warning", "error", "critical"),
@@ -761,6 +1173,11 @@ def build_parser():
         action="store_true",
         help="Launch the target app after capture setup completes.",
     )
+    capture_setup.add_argument(
+        "--stream-trace",
+        action="store_true",
+        help="Copy the trace in the background while capturing, so capture stop only fetches the rest.",
+    )
     capture_setup.add_argument(
         "--state-file",
         type=Path,
@@ -781,6 +1198,16 @@ def build_parser():
     )
     capture_stop.set_defaults(handler=handle_capture_stop)
 
+    # Started by 'capture setup --stream-trace', runs until capture stop terminates it
+    capture_tail = capture_subparsers.add_parser("tail")
+    capture_tail.add_argument(
+        "--state-file",
+        type=Path,
+        default=DEFAULT_SESSION_FILE,
+        help="Path to the capture session state file created by capture setup.",
+    )
+    capture_tail.set_defaults(handler=handle_capture_tail)
+
     capture_list_packages = capture_subparsers.add_parser("list-packages")
     capture_list_packages.add_argument("--device", help="ADB device serial.")
     capture_list_packages.set_defaults(handler=handle_capture_list_packages)
@@ -795,8 +1222,25 @@ def build_parser():
     capture_sample_config.set_defaults(handler=handle_capture_sample_config)
 
     replay_parser = subparsers.add_parser("replay")
-    replay_parser.add_argument("trace", type=Path, help="Local trace path.")
-    replay_parser.add_argument("--device", help="ADB device serial.")
+    replay_parser.add_argument(
+        "trace",
+        type=Path,
+        nargs="+",
+        help="Local trace path. With several traces, pushes, replays and pulls of different traces overlap.",
+    )
+    replay_parser_devices = replay_parser.add_mutually_exclusive_group()
+    replay_parser_devices.add_argument("--device", help="ADB device serial.")
+    replay_parser_devices.add_argument(
+        "--devices",
+        help="Run on several devices at once: 'all' or comma separated serials. "
+             "Output goes to <outdir>/<serial>, with a combined devices_summary.json."
+    )
+    replay_parser.add_argument(
+        "--require",
+        action="append",
+        metavar="KEY=VALUE",
+        help="Only use devices whose probed config matches, e.g. model=Pixel 8, gpu=mali or abi=arm64-v8a. Repeatable.",
+    )
     replay_parser.add_argument("-c", "--config", type=Path, help="Config JSON used to override device paths.")
     replay_parser.add_argument(
         "--loglevel",
@@ -816,13 +1260,32 @@ def build_parser():
         default=None,
         help="Screenshot interval when --screenshots is enabled; defaults to 10, and 0 disables capture within screenshot mode.",
     )
+    replay_parser.add_argument(
+        "--storage-limit",
+        type=int,
+        default=4096,
+        help="With several traces, MiB of traces being pushed, replayed or pulled at once (default 4096). "
+        "Traces left on the device are capped by the eviction before each push, see TRACEUI_DEVICE_MIN_FREE.",
+    )
     replay_parser.add_argument("-o", "--outdir", type=Path, default=DEFAULT_OUTPUT_DIR, help="Local output directory.")
     replay_parser.set_defaults(handler=handle_replay)
 
     fastforward_parser = subparsers.add_parser("fastforward")
     fastforward_parser.add_argument("trace", type=Path, help="Local trace path.")
     fastforward_parser.add_argument("--plugin", default="auto", choices=REPLAYER_PLUGIN_CHOICES, help="Plugin name or 'auto'.")
-    fastforward_parser.add_argument("--device", help="ADB device serial.")
+    fastforward_parser_devices = fastforward_parser.add_mutually_exclusive_group()
+    fastforward_parser_devices.add_argument("--device", help="ADB device serial.")
+    fastforward_parser_devices.add_argument(
+        "--devices",
+        help="Run on several devices at once: 'all' or comma separated serials. "
+             "Output goes to <outdir>/<serial>, with a combined devices_summary.json."
+    )
+    fastforward_parser.add_argument(
+        "--require",
+        action="append",
+        metavar="KEY=VALUE",
+        help="Only use devices whose probed config matches, e.g. model=Pixel 8, gpu=mali or abi=arm64-v8a. Repeatable.",
+    )
     fastforward_parser.add_argument("-c", "--config", type=Path, help="Config JSON used to override device paths.")
     fastforward_parser.add_argument(
         "--loglevel",
@@ -845,6 +1308,9 @@ def build_parser():
     fastforward_parser.add_argument("-o", "--outdir", type=Path, default=DEFAULT_OUTPUT_DIR, help="Local output directory.")
     fastforward_parser.set_defaults(handler=handle_fastforward)
 
+    devices_parser = subparsers.add_parser("devices", help="List connected devices and who holds them.")
+    devices_parser.set_defaults(handler=handle_devices)
+
     return parser
 
 